@@ -27,9 +27,81 @@ DEBUG = True
 
 MEDIA_URL = '/media/'
 MEDIA_ROOT = BASE_DIR / 'media'
+# Оригиналы фото без водяного знака — вне MEDIA_ROOT, наружу не раздаются
+PRIVATE_MEDIA_ROOT = BASE_DIR / 'private_media'
+# Копии фото, созданные по запросу /media/r/... (можно удалять целиком).
+# /media/r/ должен проксироваться в Django, а не раздаваться как файлы
+RENDITION_CACHE_ROOT = BASE_DIR / 'rendition_cache'
+RENDITION_CACHE_MAX_BYTES = 512 * 1024 * 1024
+# Недогруженные файлы загрузки по частям (/api/uploads/...)
+UPLOAD_TEMP_ROOT = BASE_DIR / 'upload_tmp'
+UPLOAD_CHUNK_SIZE = 4 * 1024 * 1024  # наибольший размер одной части
+UPLOAD_MAX_SIZE = 64 * 1024 * 1024
+UPLOAD_SESSION_TTL = 24 * 3600  # брошенные загрузки удаляются через сутки
 STATIC_ROOT = BASE_DIR / 'staticfiles'
 STATIC_URL = '/static/'
 
+# Сколько готовых слоёв водяного знака держать в памяти процесса
+# (и сколько байт они могут занять: слой «плитки» размером с само фото)
+WATERMARK_CACHE_SIZE = 16
+WATERMARK_CACHE_BYTES = 64 * 1024 * 1024
+
+# Водяной знак накладывается воркером (manage.py process_image_jobs),
+# а не внутри запроса админки
+IMAGE_PROCESSING_ASYNC = True
+IMAGE_JOB_MAX_ATTEMPTS = 3
+IMAGE_JOB_RETRY_DELAY = 30  # секунд, удваивается с каждой попыткой
+
+# Массовая загрузка фото (POST /api/<раздел>/<id>/images/bulk/) обрабатывается
+# сразу в пуле потоков; None — по числу ядер
+IMAGE_BULK_MAX_FILES = 50
+IMAGE_BULK_WORKERS = None
+
+# Сколько проверок доступности принимает POST /api/availability/batch/ за раз
+AVAILABILITY_BATCH_MAX_ITEMS = 200
+
+# Индекс занятости в памяти процесса перечитывается не реже чем раз в столько
+# секунд, даже если счётчик поколения в базе не менялся
+AVAILABILITY_INDEX_TTL = 60
+
+# POST броней с заголовком Idempotency-Key: ответ хранится сутки, повторы
+# ждут первый запрос не дольше IDEMPOTENCY_KEY_LOCK_TIMEOUT секунд
+IDEMPOTENCY_KEY_TTL = 24 * 3600
+IDEMPOTENCY_KEY_LOCK_TIMEOUT = 30
+
+# Фото больше IMAGE_MAX_PIXELS уменьшаются ещё при чтении (≈ 3460×2310 —
+# с запасом для экранов телефонов), больше IMAGE_PIXEL_BUDGET — отклоняются
+IMAGE_MAX_PIXELS = 8_000_000
+IMAGE_PIXEL_BUDGET = 120_000_000
+
+# Для разделов с watermark_mode = 'auto': узор вместо одного знака у фото с
+# соотношением сторон от IMAGE_TILE_MIN_ASPECT (панорамы) или от
+# IMAGE_TILE_MIN_PIXELS пикселей
+IMAGE_TILE_MIN_ASPECT = 2.0
+IMAGE_TILE_MIN_PIXELS = 40_000_000
+
+# Уменьшенные копии фото (ширина в пикселях), каждая в WebP и JPEG.
+# В карточках отдаётся 'card', остальные — в srcset
+IMAGE_RENDITIONS = {'thumbnail': 320, 'card': 768, 'full': 1600}
+
+# Профили кодирования: 'photo' — основной файл с водяным знаком, остальные —
+# качество копий из IMAGE_RENDITIONS. Сравнить с прежним кодированием:
+# python manage.py encoding_report
+IMAGE_ENCODING_PROFILES = {
+    'photo': {'format': 'jpeg', 'quality': 88},
+    'thumbnail': {'quality': 75},
+    'card': {'quality': 78},
+    'full': {'quality': 80},
+}
+# Форматы копий по порядку предпочтения; 'avif' можно добавить,
+# если Pillow собран с libavif (форматы без поддержки пропускаются)
+IMAGE_RENDITION_FORMATS = ['webp', 'jpeg']
+
+# Загрузка, чей перцептивный хэш отличается от другого фото не больше чем на
+# столько бит (из 64), помечается как возможный дубликат. Это только подсказка:
+# готовые файлы переиспользуются лишь при совпадении хэша исходника (SHA-256)
+IMAGE_DUPLICATE_DISTANCE = 2
+
 ALLOWED_HOSTS = ['*']
 
 CORS_ALLOW_ALL_ORIGINS = True
@@ -53,6 +125,7 @@ INSTALLED_APPS = [
     'motorcycles',
     'houses',
     'excursions',
+    'core',
     'rest_framework',
     'django_filters',
 ]
@@ -121,6 +194,9 @@ DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
+        # Тестовая база — файл, как и рабочая: общая in-memory база SQLite не
+        # ждёт блокировок, и тесты одновременных броней падали бы сразу
+        'TEST': {'NAME': BASE_DIR / 'test_db.sqlite3'},
     }
 }
 
@@ -3,6 +3,8 @@ from django.urls import path, include
 from django.conf import settings
 from django.conf.urls.static import static
 
+from core.views import BatchAvailabilityView
+
 urlpatterns = [
     # Админка Django
     path('admin/', admin.site.urls),
@@ -12,6 +14,13 @@ urlpatterns = [
     path('api/motorcycles/', include('motorcycles.urls')),
     path('api/houses/', include('houses.urls')),  
     path('api/excursions/', include('excursions.urls')),  
+    # Загрузка больших фото частями (начало — /api/<раздел>/<id>/images/uploads/)
+    path('api/uploads/', include('core.api_urls')),
+    # Доступность многих объектов одним запросом
+    path('api/availability/batch/', BatchAvailabilityView.as_view(), name='availability-batch'),
+
+    # Копии фото по запросу: /media/r/<размер>/<хэш>.<webp|jpg>
+    path('media/r/', include('core.urls')),
 ]
 
 if settings.DEBUG:
@@ -8,8 +8,8 @@ from .models import Category, Feature, Car, CarImage, Booking, Brand
 class CarImageInline(admin.TabularInline):
     model = CarImage
     extra = 1
-    fields = ['image', 'order', 'image_preview']
-    readonly_fields = ['image_preview']
+    fields = ['image', 'order', 'processing_status', 'image_preview']
+    readonly_fields = ['processing_status', 'image_preview']
     
     def image_preview(self, obj):
         if obj.image:
@@ -95,9 +95,9 @@ class CarAdmin(ModelAdmin):
 
 @admin.register(CarImage)
 class CarImageAdmin(ModelAdmin):
-    list_display = ['car', 'order', 'image_preview']
+    list_display = ['car', 'order', 'processing_status', 'possible_duplicate', 'image_preview']
     list_editable = ['order']
-    list_filter = ['car']
+    list_filter = ['car', 'processing_status', 'possible_duplicate']
     list_per_page = 20
     
     @display(description="Изображение")
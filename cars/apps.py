@@ -4,3 +4,8 @@ from django.apps import AppConfig
 class CarsConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'cars'
+
+    def ready(self):
+        from core.availability import register
+        from .models import Booking
+        register(Booking, 'car')
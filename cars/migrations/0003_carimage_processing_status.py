@@ -0,0 +1,18 @@
+# Generated by Django 5.1.2 on 2026-10-17 06:17
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cars', '0002_brand_car_brand'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='carimage',
+            name='processing_status',
+            field=models.CharField(choices=[('processing', 'Обрабатывается'), ('ready', 'Готово'), ('failed', 'Ошибка')], default='ready', max_length=20, verbose_name='Обработка'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.1.2 on 2026-10-17 06:23
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cars', '0005_carimage_original_carimage_watermark_version'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='carimage',
+            name='renditions',
+            field=models.JSONField(blank=True, default=dict, editable=False, verbose_name='Уменьшенные копии'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.1.2 on 2026-10-17 06:26
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cars', '0006_carimage_renditions'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='carimage',
+            name='image',
+            field=models.ImageField(blank=True, upload_to='cars/images/'),
+        ),
+    ]
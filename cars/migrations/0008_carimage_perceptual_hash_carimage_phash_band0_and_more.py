@@ -0,0 +1,38 @@
+# Generated by Django 5.1.2 on 2026-10-17 06:30
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cars', '0007_alter_carimage_image'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='carimage',
+            name='perceptual_hash',
+            field=models.CharField(blank=True, editable=False, max_length=16, verbose_name='Перцептивный хэш'),
+        ),
+        migrations.AddField(
+            model_name='carimage',
+            name='phash_band0',
+            field=models.PositiveIntegerField(blank=True, db_index=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='carimage',
+            name='phash_band1',
+            field=models.PositiveIntegerField(blank=True, db_index=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='carimage',
+            name='phash_band2',
+            field=models.PositiveIntegerField(blank=True, db_index=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='carimage',
+            name='phash_band3',
+            field=models.PositiveIntegerField(blank=True, db_index=True, editable=False, null=True),
+        ),
+    ]
@@ -1,11 +1,11 @@
-from django.db import models
+from django.db import models, transaction
 from django.contrib.auth.models import User
 from django.utils import timezone
 from PIL import Image, ImageDraw, ImageFont
 import os
 from django.core.files.base import ContentFile
 import io
-from watermark import WatermarkProcessor
+from core.models import WatermarkedImage
 
 class Category(models.Model):
     title = models.CharField(max_length=100, verbose_name="Название категории")
@@ -148,9 +148,9 @@ class Watermark:
             # Если водяной знак не найден, возвращаем оригинальное изображение
             return None
 
-class CarImage(models.Model):
+class CarImage(WatermarkedImage):
     car = models.ForeignKey(Car, related_name='images', on_delete=models.CASCADE)
-    image = models.ImageField(upload_to='cars/images/')
+    image = models.ImageField(upload_to='cars/images/', blank=True)
     order = models.IntegerField(default=0, verbose_name="Порядок")
     
     class Meta:
@@ -160,27 +160,6 @@ class CarImage(models.Model):
     
     def __str__(self):
         return f"Фото {self.car.title}"
-    
-    def save(self, *args, **kwargs):
-        # Сначала сохраняем чтобы получить путь к файлу
-        if not self.pk:
-            super().save(*args, **kwargs)
-        
-        # Добавляем водяной знак
-        if self.image:
-            try:
-                watermarked_image = WatermarkProcessor.add_watermark(self.image.path)
-                if watermarked_image:
-                    # Сохраняем изображение с водяным знаком
-                    self.image.save(
-                        os.path.basename(self.image.name),
-                        watermarked_image,
-                        save=False
-                    )
-            except Exception as e:
-                print(f"Error processing watermark for car image: {e}")
-        
-        super().save(*args, **kwargs)
 
 class Booking(models.Model):
     STATUS_CHOICES = [
@@ -205,6 +184,16 @@ class Booking(models.Model):
     class Meta:
         verbose_name = "Бронирование"
         verbose_name_plural = "Бронирования"
+        indexes = [
+            # Проверка конкретного объекта и фильтры по статусу
+            models.Index(fields=['car', 'status', 'start_date', 'end_date'], name='cars_booking_avail_idx'),
+            # Поиск свободных объектов на даты: после статуса — конец брони,
+            # чтобы прошедшие брони отсекались по индексу. Частичный индекс
+            # (WHERE status IN ...) SQLite не применяет к запросам с параметрами
+            models.Index(fields=['status', 'end_date', 'start_date', 'car'], name='cars_booking_search_idx'),
+            models.Index(fields=['telegram_id'], name='cars_booking_telegram_idx'),
+            models.Index(fields=['created_at'], name='cars_booking_created_idx'),
+        ]
     
     def __str__(self):
         return f"{self.car.title} - {self.client_name} ({self.start_date} - {self.end_date})"
@@ -226,4 +215,6 @@ class Booking(models.Model):
     def save(self, *args, **kwargs):
         if not self.total_price:
             self.total_price = self.calculate_total_price()
-        super().save(*args, **kwargs)
\ No newline at end of file
+        # Бронь и её занятые дни (пишет сигнал post_save) фиксируются вместе
+        with transaction.atomic():
+            super().save(*args, **kwargs)
\ No newline at end of file
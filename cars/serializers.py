@@ -1,4 +1,8 @@
 from rest_framework import serializers
+
+from core.availability import availability
+from core.booking import BookingConflict, create_booking
+from core.serializers import FirstImageMixin
 from .models import Car, Booking, Category, Feature, CarImage, Brand
 
 
@@ -60,14 +64,7 @@ class CreateBookingSerializer(serializers.ModelSerializer):
             raise serializers.ValidationError("Дата окончания должна быть позже даты начала")
         
         car = data['car']
-        conflicting_bookings = Booking.objects.filter(
-            car=car,
-            status__in=['confirmed', 'active', 'pending'],
-            start_date__lte=end_date,
-            end_date__gte=start_date
-        )
-        
-        if conflicting_bookings.exists():
+        if not availability(Booking).is_available(car.id, start_date, end_date):
             raise serializers.ValidationError("На выбранные даты автомобиль уже забронирован")
         
         return data
@@ -84,17 +81,22 @@ class CreateBookingSerializer(serializers.ModelSerializer):
         total_days = (end_date - start_date).days + 1
         total_price = total_days * car.price_per_day
         
-        booking = Booking.objects.create(
-            car=car,
-            telegram_id=telegram_id,
-            start_date=start_date,
-            end_date=end_date,
-            client_name=client_name,
-            phone_number=phone_number,
-            comment=comment,
-            total_price=total_price,
-            status='pending'
-        )
+        try:
+            booking = create_booking(
+                Booking,
+                car=car,
+                telegram_id=telegram_id,
+                start_date=start_date,
+                end_date=end_date,
+                client_name=client_name,
+                phone_number=phone_number,
+                comment=comment,
+                total_price=total_price,
+                status='pending'
+            )
+        except BookingConflict:
+            # Даты заняли между проверкой и сохранением
+            raise serializers.ValidationError("На выбранные даты автомобиль уже забронирован")
         
         return booking
     
@@ -104,13 +106,12 @@ class BrandSerializer(serializers.ModelSerializer):
         model = Brand
         fields = ['id', 'name', 'icon']
 
-class CarListSerializer(serializers.ModelSerializer):
+class CarListSerializer(FirstImageMixin, serializers.ModelSerializer):
     """Сериализатор для списка автомобилей (карточек)"""
     brand_name = serializers.CharField(source='brand.name', read_only=True)
     brand_icon = serializers.SerializerMethodField()
     category_title = serializers.CharField(source='category.title', read_only=True)
     features = FeatureSerializer(many=True, read_only=True)
-    first_image = serializers.SerializerMethodField()
     price_per_day = serializers.IntegerField()
     
     class Meta:
@@ -118,16 +119,11 @@ class CarListSerializer(serializers.ModelSerializer):
         fields = [
             'id', 'title', 'brand', 'brand_name', 'brand_icon', 'category_title', 
             'year', 'color', 'engine_volume', 'mileage', 'transmission', 'oil_type',
-            'price_per_day', 'deposit', 'status', 'features', 'first_image'
+            'price_per_day', 'deposit', 'status', 'features', 'first_image', 'first_image_srcset',
+            'first_image_placeholder'
         ]
     
     def get_brand_icon(self, obj):
         if obj.brand and obj.brand.icon:
             return self.context['request'].build_absolute_uri(obj.brand.icon.url)
         return None
-    
-    def get_first_image(self, obj):
-        first_image = obj.images.first()
-        if first_image and first_image.image:
-            return self.context['request'].build_absolute_uri(first_image.image.url)
-        return None
\ No newline at end of file
@@ -1,3 +1,458 @@
-from django.test import TestCase
+import io
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import unittest
+from datetime import date
 
-# Create your tests here.
+from django.conf import settings
+from django.core.management import call_command
+from django.db import connection
+from django.test import SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.urls import reverse
+from rest_framework.exceptions import ValidationError
+from unittest import mock
+from PIL import Image, ImageChops
+
+from core.availability import ACTIVE_STATUSES
+from core.tests import MediaRootMixin, make_car, make_jpeg
+from watermark import WatermarkLayerCache, WatermarkProcessor, layer_cache
+from .models import Booking, CarImage
+from .serializers import CreateBookingSerializer
+
+SAMPLE_IMAGE = os.path.join(settings.BASE_DIR, 'media', 'cars', 'images', 'Photo_with_classmates.jpg')
+
+
+def reference_watermark(image_path, opacity=90, scale=0.5):
+    """Прежняя реализация с попиксельным циклом — эталон для сравнения"""
+    opacity = max(0, min(100, opacity)) / 100.0
+    scale = max(0.1, min(1.0, scale))
+    watermark_path = os.path.join(settings.BASE_DIR, 'media', 'watermark.png')
+
+    original_image = Image.open(image_path)
+    image = original_image.convert('RGBA')
+    watermark = Image.open(watermark_path).convert('RGBA')
+
+    image_width, image_height = image.size
+    watermark_width = int(image_width * scale)
+    watermark_height = int(watermark_width * watermark.height / watermark.width)
+    if watermark_width < 100:
+        watermark_width = 100
+        watermark_height = int(watermark_width * watermark.height / watermark.width)
+    watermark = watermark.resize((watermark_width, watermark_height), Image.Resampling.LANCZOS)
+
+    watermark_with_alpha = Image.new('RGBA', watermark.size)
+    for x in range(watermark.width):
+        for y in range(watermark.height):
+            r, g, b, a = watermark.getpixel((x, y))
+            watermark_with_alpha.putpixel((x, y), (r, g, b, int(a * opacity)))
+
+    position = ((image_width - watermark_width) // 2, (image_height - watermark_height) // 2)
+    watermarked = Image.new('RGBA', image.size)
+    watermarked.paste(image, (0, 0))
+    watermarked.paste(watermark_with_alpha, position, watermark_with_alpha)
+    if original_image.mode == 'RGB':
+        watermarked = watermarked.convert('RGB')
+    return watermarked
+
+
+class WatermarkProcessorTests(SimpleTestCase):
+    def assertSamePixels(self, first, second):
+        self.assertEqual(first.size, second.size)
+        self.assertEqual(first.mode, second.mode)
+        self.assertIsNone(ImageChops.difference(first, second).getbbox())
+
+    def test_vectorized_opacity_matches_reference(self):
+        for opacity in (0, 37, 90, 100):
+            with self.subTest(opacity=opacity):
+                result = WatermarkProcessor.add_watermark(SAMPLE_IMAGE, opacity=opacity)
+                expected = reference_watermark(SAMPLE_IMAGE, opacity=opacity)
+
+                buffer = io.BytesIO()
+                expected.save(buffer, format='JPEG', quality=95)
+                self.assertEqual(result.read(), buffer.getvalue())
+
+    def test_png_output_matches_reference(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'sample.png')
+            Image.new('RGBA', (320, 200), (10, 120, 200, 255)).save(path, format='PNG')
+
+            result = WatermarkProcessor.add_watermark(path, opacity=50, scale=0.3)
+            expected = reference_watermark(path, opacity=50, scale=0.3)
+
+        self.assertSamePixels(Image.open(result), expected)
+
+
+# Замер пика памяти в отдельном процессе: ru_maxrss — максимум за всю жизнь
+# процесса, поэтому считаем прирост от уровня после импортов
+PEAK_MEMORY_SCRIPT = """
+import resource, sys
+import django
+django.setup()
+from django.conf import settings
+from watermark import WatermarkProcessor
+
+def peak_kb():
+    # ru_maxrss наследуется через fork/exec от родителя (тестового процесса
+    # с большой базой в памяти), поэтому сбрасываем пик и читаем VmHWM
+    with open('/proc/self/status') as f:
+        return next(int(line.split()[1]) for line in f if line.startswith('VmHWM:'))
+
+settings.IMAGE_MAX_PIXELS = int(sys.argv[2]) or None
+try:
+    with open('/proc/self/clear_refs', 'w') as f:
+        f.write('5')
+    measure = peak_kb
+except OSError:
+    measure = lambda: resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+before = measure()
+image, _ = WatermarkProcessor.render(sys.argv[1])
+after = measure()
+print(after - before, image.width * image.height)
+"""
+
+
+class OversizedImageTests(SimpleTestCase):
+    def setUp(self):
+        tmp = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmp, ignore_errors=True)
+        self.path = os.path.join(tmp, 'large.jpg')
+        Image.new('RGB', (6000, 4000), (30, 90, 160)).save(self.path, format='JPEG')
+
+    def test_large_jpeg_is_reduced_while_decoding(self):
+        image, image_format = WatermarkProcessor.open_image(self.path, max_pixels=2_000_000)
+
+        self.assertEqual(image_format, 'JPEG')
+        self.assertLessEqual(image.width * image.height, 2_000_000)
+        self.assertAlmostEqual(image.width / image.height, 1.5, places=2)
+
+    def test_draft_does_not_shrink_twice(self):
+        path = os.path.join(os.path.dirname(self.path), 'phone.jpg')
+        Image.new('RGB', (9000, 6000), (30, 90, 160)).save(path, format='JPEG')
+
+        image, _ = WatermarkProcessor.open_image(path, max_pixels=8_000_000)
+
+        # draft раскодирует в 4500x3000, дальше resize до ~8 Мп, а не ещё раз в том же масштабе
+        self.assertLessEqual(image.width * image.height, 8_000_000)
+        self.assertGreater(image.width * image.height, 7_900_000)
+        self.assertAlmostEqual(image.width / image.height, 1.5, places=2)
+
+    def test_small_image_is_left_as_is(self):
+        image, _ = WatermarkProcessor.open_image(self.path, max_pixels=30_000_000)
+        self.assertEqual(image.size, (6000, 4000))
+
+    def test_pixel_budget_rejects_before_decoding(self):
+        with mock.patch('PIL.ImageFile.ImageFile.load') as load:
+            with self.assertRaises(ValueError):
+                WatermarkProcessor.open_image(self.path, pixel_budget=10_000_000)
+        load.assert_not_called()
+
+        with override_settings(IMAGE_PIXEL_BUDGET=10_000_000):
+            self.assertIsNone(WatermarkProcessor.add_watermark(self.path))
+
+    @unittest.skipUnless(sys.platform.startswith('linux'), "ru_maxrss в килобайтах только на Linux")
+    def test_peak_memory_is_bounded(self):
+        def peak_memory(max_pixels):
+            result = subprocess.run(
+                [sys.executable, '-c', PEAK_MEMORY_SCRIPT, self.path, str(max_pixels)],
+                cwd=settings.BASE_DIR, capture_output=True, text=True, check=True,
+                env={**os.environ, 'DJANGO_SETTINGS_MODULE': 'backend.settings'},
+            )
+            peak_kb, pixels = map(int, result.stdout.split()[-2:])
+            return peak_kb * 1024, pixels
+
+        full_peak, full_pixels = peak_memory(0)
+        limited_peak, limited_pixels = peak_memory(4_000_000)
+
+        self.assertEqual(full_pixels, 24_000_000)
+        self.assertLessEqual(limited_pixels, 4_000_000)
+        # Без ограничения в памяти полноразмерные буферы по 4 байта на пиксель
+        self.assertGreater(full_peak, 24_000_000 * 2)
+        self.assertLess(limited_peak, full_peak / 3)
+
+
+class TiledWatermarkTests(SimpleTestCase):
+    def setUp(self):
+        layer_cache.clear()
+        self.addCleanup(layer_cache.clear)
+
+    def test_tiled_layer_covers_whole_photo(self):
+        layer = WatermarkProcessor.get_layer(1600, 1000, 0.9, 0.2, 'tile')
+
+        self.assertEqual(layer.size, (1600, 1000))
+        alpha = layer.getchannel('A')
+        # Знак есть в каждой четверти фото, а не только в центре
+        for box in ((0, 0, 800, 500), (800, 0, 1600, 500), (0, 500, 800, 1000), (800, 500, 1600, 1000)):
+            self.assertIsNotNone(alpha.crop(box).getbbox(), box)
+
+    def test_tiled_render_differs_from_centered_at_corner(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'panorama.png')
+            Image.new('RGB', (1600, 500), (10, 120, 200)).save(path)
+
+            centered, _ = WatermarkProcessor.render(path)
+            tiled, image_format = WatermarkProcessor.render(path, mode='tile')
+
+        self.assertEqual(image_format, 'PNG')
+        self.assertEqual(centered.crop((0, 0, 300, 500)).getcolors(), [(300 * 500, (10, 120, 200))])
+        self.assertGreater(len(tiled.crop((0, 0, 300, 500)).getcolors(300 * 500)), 1)
+
+    def test_auto_mode_tiles_only_panoramas_and_large_photos(self):
+        self.assertEqual(WatermarkProcessor.choose_mode(4032, 3024), 'center')
+        self.assertEqual(WatermarkProcessor.choose_mode(3024, 4032), 'center')
+        self.assertEqual(WatermarkProcessor.choose_mode(8000, 2000), 'tile')
+        self.assertEqual(WatermarkProcessor.choose_mode(8000, 6000), 'tile')
+
+        with tempfile.TemporaryDirectory() as tmp:
+            photo, panorama = os.path.join(tmp, 'photo.png'), os.path.join(tmp, 'panorama.png')
+            Image.new('RGB', (1200, 800), (10, 120, 200)).save(photo)
+            Image.new('RGB', (1600, 500), (10, 120, 200)).save(panorama)
+
+            for path, mode in ((photo, 'center'), (panorama, 'tile')):
+                expected, _ = WatermarkProcessor.render(path, mode=mode)
+                with open(path, 'rb') as source:
+                    auto, _ = WatermarkProcessor.render(source, mode='auto')
+                self.assertIsNone(ImageChops.difference(auto, expected).getbbox(), mode)
+
+    def test_mode_changes_fingerprint(self):
+        self.assertNotEqual(WatermarkProcessor.fingerprint(), WatermarkProcessor.fingerprint(mode='tile'))
+        self.assertNotIn(WatermarkProcessor.fingerprint(mode='auto'), {
+            WatermarkProcessor.fingerprint(), WatermarkProcessor.fingerprint(mode='tile'),
+        })
+        with self.assertRaises(ValueError):
+            WatermarkProcessor.render(SAMPLE_IMAGE, mode='diagonal')
+
+    def test_benchmark_reports_both_modes(self):
+        out = io.StringIO()
+        call_command('benchmark_watermark', sizes=[(320, 200)], repeat=1, stdout=out)
+
+        self.assertIn('center', out.getvalue())
+        self.assertIn('tile', out.getvalue())
+
+
+class WatermarkLayerCacheTests(SimpleTestCase):
+    def setUp(self):
+        layer_cache.clear()
+        self.addCleanup(layer_cache.clear)
+
+    def test_repeated_sizes_hit_cache(self):
+        WatermarkProcessor.add_watermark(SAMPLE_IMAGE)
+        WatermarkProcessor.add_watermark(SAMPLE_IMAGE)
+        WatermarkProcessor.add_watermark(SAMPLE_IMAGE, opacity=50)
+
+        info = WatermarkProcessor.cache_info()
+        self.assertEqual(info['misses'], 2)
+        self.assertEqual(info['hits'], 1)
+        self.assertEqual(info['size'], 2)
+
+    def test_cache_is_bounded(self):
+        cache = WatermarkLayerCache(maxsize=2)
+        for width in (100, 200, 300):
+            cache.get((width, 100, 0.9, 0.5), 1, lambda: object())
+        cache.get((300, 100, 0.9, 0.5), 1, lambda: object())
+
+        info = cache.info()
+        self.assertEqual(info['size'], 2)
+        self.assertEqual(info['hits'], 1)
+        self.assertEqual(info['misses'], 3)
+
+    def test_cache_is_bounded_by_bytes(self):
+        cache = WatermarkLayerCache(maxsize=16, max_bytes=100 * 100 * 4 * 2)
+        for width in (100, 200):
+            cache.get(('tile', width), 1, lambda: Image.new('RGBA', (100, 100)))
+        cache.get(('tile', 300), 1, lambda: Image.new('RGBA', (100, 100)))
+        cache.get(('huge',), 1, lambda: Image.new('RGBA', (300, 300)))
+
+        info = cache.info()
+        self.assertEqual(info['size'], 2)
+        self.assertEqual(info['bytes'], 100 * 100 * 4 * 2)
+
+    def test_changed_watermark_invalidates_cache(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            os.makedirs(os.path.join(tmp, 'media'))
+            watermark_path = os.path.join(tmp, 'media', 'watermark.png')
+            shutil.copy(os.path.join(settings.BASE_DIR, 'media', 'watermark.png'), watermark_path)
+
+            with override_settings(BASE_DIR=tmp):
+                first = WatermarkProcessor.get_layer(1000, 667, 0.9, 0.5)
+                self.assertIs(WatermarkProcessor.get_layer(1000, 667, 0.9, 0.5), first)
+
+                Image.new('RGBA', (50, 50), (255, 0, 0, 255)).save(watermark_path)
+                stat = os.stat(watermark_path)
+                os.utime(watermark_path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+                second = WatermarkProcessor.get_layer(1000, 667, 0.9, 0.5)
+
+        self.assertIsNot(second, first)
+        self.assertEqual(second.size, (500, 500))
+        self.assertEqual(WatermarkProcessor.cache_info()['invalidations'], 1)
+
+
+class CarCardsRenditionTests(MediaRootMixin, TestCase):
+    def test_cards_return_card_rendition_and_srcset(self):
+        car = make_car(status='available')
+        CarImage.objects.create(car=car, image=make_jpeg(size=(1700, 1000)))
+        call_command('process_image_jobs', once=True, stdout=io.StringIO())
+        image = CarImage.objects.get()
+
+        response = self.client.get(reverse('car-cards'))
+
+        card = response.json()['results'][0]
+        self.assertTrue(card['first_image'].endswith(image.renditions['card']['jpeg']))
+        self.assertIn(image.renditions['thumbnail']['webp'] + ' 320w', card['first_image_srcset']['webp'])
+        self.assertIn(' 1600w', card['first_image_srcset']['jpeg'])
+        self.assertEqual(card['first_image_placeholder'], image.placeholder)
+
+
+class BookingIndexPlanTests(TestCase):
+    """Запросы проверки доступности идут по индексам, а не полным перебором таблицы"""
+    ROWS = 1_000_000
+    CARS = 50
+
+    @classmethod
+    def setUpTestData(cls):
+        cars = [make_car(title=f"Car {i}") for i in range(cls.CARS)]
+        cls.car = cars[0]
+        first_id = cars[0].id
+        # Десять лет истории: почти всё завершено, каждая десятая бронь ещё занимает даты
+        with connection.cursor() as cursor:
+            cursor.execute(
+                """
+                INSERT INTO cars_booking (car_id, telegram_id, start_date, end_date, client_name,
+                                          phone_number, status, total_price, comment, created_at)
+                WITH RECURSIVE seq(x) AS (SELECT 1 UNION ALL SELECT x + 1 FROM seq WHERE x < %s)
+                SELECT %s + x %% %s, CAST(x %% 20000 AS TEXT),
+                       date('2016-01-01', '+' || (x * 3650 / %s) || ' days'),
+                       date('2016-01-01', '+' || (x * 3650 / %s + x %% 7 + 1) || ' days'),
+                       'Клиент', '+996', CASE x %% 10 WHEN 0 THEN 'pending' WHEN 1 THEN 'confirmed'
+                       ELSE 'completed' END, 100, '', datetime('2016-01-01', '+' || (x * 5) || ' minutes')
+                FROM seq
+                """,
+                [cls.ROWS, first_id, cls.CARS, cls.ROWS, cls.ROWS],
+            )
+            cursor.execute('ANALYZE')
+
+    def assertUsesIndex(self, queryset, *names):
+        plan = queryset.explain()
+        self.assertTrue(any(f'INDEX {name}' in plan for name in names), plan)
+        self.assertNotIn('SCAN cars_booking\n', plan + '\n')
+
+    def test_table_is_seeded(self):
+        self.assertEqual(Booking.objects.count(), self.ROWS)
+
+    def test_resource_check_uses_index(self):
+        queryset = Booking.objects.filter(
+            car=self.car, status__in=ACTIVE_STATUSES,
+            start_date__lte=date(2025, 12, 10), end_date__gte=date(2025, 12, 1),
+        )
+        self.assertUsesIndex(queryset, 'cars_booking_avail_idx', 'cars_booking_search_idx')
+
+    def test_search_uses_status_date_index(self):
+        queryset = Booking.objects.filter(
+            status__in=ACTIVE_STATUSES, start_date__lte=date(2025, 12, 10), end_date__gte=date(2025, 12, 1),
+        ).values_list('car_id', flat=True)
+        self.assertUsesIndex(queryset, 'cars_booking_search_idx')
+
+    def test_telegram_and_created_at_use_indexes(self):
+        self.assertUsesIndex(Booking.objects.filter(telegram_id='42'), 'cars_booking_telegram_idx')
+        self.assertUsesIndex(Booking.objects.order_by('-created_at')[:20], 'cars_booking_created_idx')
+
+
+class BookingCalendarTests(TestCase):
+    def test_calendar_lists_bookings_per_day_in_one_query(self):
+        cars = [make_car(title=f"Car {i}") for i in range(3)]
+        for car in cars:
+            Booking.objects.create(
+                car=car, telegram_id='7', start_date=date(2025, 6, 28), end_date=date(2025, 7, 2),
+                client_name="Иван", phone_number="+996", total_price=100,
+            )
+
+        with self.assertNumQueries(1):
+            response = self.client.get(reverse('booking-calendar'), {'month': 7, 'year': 2025})
+
+        self.assertEqual(response.status_code, 200)
+        calendar = response.json()['calendar']
+        self.assertEqual(len(calendar), 31)
+        self.assertEqual([len(day['bookings']) for day in calendar[:3]], [3, 3, 0])
+        self.assertEqual(calendar[0]['bookings'][0]['client_name'], "Иван")
+        self.assertEqual(response.json()['booked_periods'][0]['total_days'], 5)
+
+    def test_invalid_month(self):
+        response = self.client.get(reverse('booking-calendar'), {'month': 13, 'year': 2025})
+        self.assertEqual(response.status_code, 400)
+
+
+class ConcurrentBookingTests(TransactionTestCase):
+    threads = 8
+
+    def setUp(self):
+        self.cars = [make_car(title=f"Car {i}") for i in range(self.threads)]
+
+    def race(self, cars):
+        """Все потоки проверяют даты, затем одновременно сохраняют брони"""
+        barrier = threading.Barrier(len(cars))
+        results = []
+
+        def book(car):
+            try:
+                serializer = CreateBookingSerializer(data={
+                    'car': car.id, 'telegram_id': '1', 'client_name': "Иван", 'phone_number': '+996',
+                    'start_date': '2025-07-01', 'end_date': '2025-07-05',
+                })
+                valid = serializer.is_valid()
+                barrier.wait()
+                if valid:
+                    serializer.save()
+                results.append('booked' if valid else 'rejected')
+            except ValidationError:
+                results.append('rejected')
+            finally:
+                connection.close()
+
+        workers = [threading.Thread(target=book, args=(car,)) for car in cars]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+        return sorted(results)
+
+    def test_same_car_is_booked_once(self):
+        results = self.race([self.cars[0]] * self.threads)
+
+        self.assertEqual(results.count('booked'), 1)
+        self.assertEqual(results.count('rejected'), self.threads - 1)
+        self.assertEqual(Booking.objects.filter(car=self.cars[0]).count(), 1)
+
+    def test_different_cars_do_not_block_each_other(self):
+        self.assertEqual(self.race(self.cars), ['booked'] * self.threads)
+        self.assertEqual(Booking.objects.count(), self.threads)
+
+    def test_duplicate_keys_are_coalesced(self):
+        barrier = threading.Barrier(self.threads)
+        responses = []
+        data = {
+            'car': self.cars[0].id, 'telegram_id': '1', 'client_name': "Иван", 'phone_number': '+996',
+            'start_date': '2025-07-01', 'end_date': '2025-07-05',
+        }
+
+        def post():
+            try:
+                barrier.wait()
+                response = self.client_class().post(
+                    reverse('booking-list'), data, content_type='application/json', headers={'Idempotency-Key': 'tap'},
+                )
+                responses.append((response.status_code, response.json()))
+            finally:
+                connection.close()
+
+        workers = [threading.Thread(target=post) for _ in range(self.threads)]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+
+        self.assertEqual(Booking.objects.count(), 1)
+        self.assertEqual(len(responses), self.threads)
+        self.assertEqual(responses, [(201, responses[0][1])] * self.threads)
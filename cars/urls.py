@@ -10,8 +10,11 @@ router.register(r'bookings', views.BookingViewSet, basename='booking')
 
 urlpatterns = [
     path('', include(router.urls)),
+    path('<int:pk>/images/bulk/', views.CarImagesBulkUploadView.as_view(), name='car-images-bulk'),
+    path('<int:pk>/images/uploads/', views.CarImageUploadView.as_view(), name='car-images-upload'),
     path('available-cars/', views.AvailableCarsView.as_view(), name='available-cars'),
     path('car-availability/<int:car_id>/', views.CarAvailabilityView.as_view(), name='car-availability'),
+    path('car-free-windows/<int:pk>/', views.CarFreeWindowsView.as_view(), name='car-free-windows'),
     path('booking-calendar/', views.BookingCalendarView.as_view(), name='booking-calendar'),
     
     # Новые endpoints для карточек
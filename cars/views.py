@@ -3,11 +3,14 @@ from rest_framework.decorators import action
 from rest_framework.response import Response
 from rest_framework.views import APIView
 from django_filters.rest_framework import DjangoFilterBackend
-from django.utils import timezone
-from datetime import datetime, timedelta
+from datetime import datetime
 from django.db.models import Q
 
-from .models import Category, Feature, Car, Booking, Brand
+from core.availability import availability
+from core.calendar import bookings_by_day, month_range
+from core.idempotency import IdempotentCreateMixin
+from core.views import BulkImageUploadView, ChunkedUploadStartView, FreeWindowsView
+from .models import Category, Feature, Car, Booking, Brand, CarImage
 from .serializers import CategorySerializer, FeatureSerializer, CarSerializer, BookingSerializer, CreateBookingSerializer, CarListSerializer, BrandSerializer
 
 class CategoryViewSet(viewsets.ModelViewSet):
@@ -35,7 +38,7 @@ class CarViewSet(viewsets.ModelViewSet):
     search_fields = ['title', 'description', 'color', 'transmission']
     ordering_fields = ['price_per_day', 'year', 'mileage', 'created_at']
 
-class BookingViewSet(viewsets.ModelViewSet):
+class BookingViewSet(IdempotentCreateMixin, viewsets.ModelViewSet):
     queryset = Booking.objects.all()
     
     def get_serializer_class(self):
@@ -68,12 +71,8 @@ class AvailableCarsView(APIView):
                 start = datetime.strptime(start_date, '%Y-%m-%d').date()
                 end = datetime.strptime(end_date, '%Y-%m-%d').date()
                 
-                # Исключаем автомобили с бронированиями на эти даты
-                booked_car_ids = Booking.objects.filter(
-                    status__in=['confirmed', 'active', 'pending'],
-                    start_date__lte=end,
-                    end_date__gte=start
-                ).values_list('car_id', flat=True)
+                # Исключаем автомобили с бронированиями на эти даты (по индексу занятости)
+                booked_car_ids = availability(Booking).booked_resources(start, end)
                 
                 cars = cars.exclude(id__in=booked_car_ids)
                 
@@ -106,15 +105,12 @@ class CarAvailabilityView(APIView):
                 start = datetime.strptime(start_date, '%Y-%m-%d').date()
                 end = datetime.strptime(end_date, '%Y-%m-%d').date()
                 
-                # Проверяем конфликтующие бронирования
-                conflicting_bookings = Booking.objects.filter(
-                    car=car,
-                    status__in=['confirmed', 'active', 'pending'],
-                    start_date__lte=end,
-                    end_date__gte=start
-                )
+                # Проверяем конфликтующие бронирования: пересечения ищем в индексе
+                # занятости, из базы читаем только найденные брони
+                conflicting_ids = availability(Booking).conflicts(car.id, start, end)
+                conflicting_bookings = Booking.objects.filter(id__in=conflicting_ids)
                 
-                is_available = not conflicting_bookings.exists() and car.status == 'available'
+                is_available = not conflicting_ids and car.status == 'available'
                 
                 return Response({
                     'car_id': car.id,
@@ -140,79 +136,60 @@ class BookingCalendarView(APIView):
     
     def get(self, request):
         car_id = request.query_params.get('car_id')
-        month = request.query_params.get('month')
-        year = request.query_params.get('year')
         
         try:
-            if month and year:
-                target_month = int(month)
-                target_year = int(year)
-                start_date = datetime(target_year, target_month, 1).date()
-                if target_month == 12:
-                    end_date = datetime(target_year + 1, 1, 1).date()
-                else:
-                    end_date = datetime(target_year, target_month + 1, 1).date()
-            else:
-                # По умолчанию текущий месяц
-                today = timezone.now().date()
-                start_date = datetime(today.year, today.month, 1).date()
-                if today.month == 12:
-                    end_date = datetime(today.year + 1, 1, 1).date()
-                else:
-                    end_date = datetime(today.year, today.month + 1, 1).date()
+            start_date, end_date = month_range(
+                request.query_params.get('month'), request.query_params.get('year')
+            )
             
-            # Получаем бронирования
+            # Получаем бронирования одним запросом вместе с автомобилями
+            # (бронь, закончившаяся 1-го числа, этот день тоже занимает)
             bookings_query = Booking.objects.filter(
                 status__in=['confirmed', 'active', 'pending'],
                 start_date__lt=end_date,
-                end_date__gt=start_date
-            )
+                end_date__gte=start_date
+            ).select_related('car')
             
             if car_id:
                 car_id = int(car_id)
                 bookings_query = bookings_query.filter(car_id=car_id)
+            bookings = list(bookings_query)
             
-            # Создаем календарь с периодами бронирования
-            calendar_data = []
-            current_date = start_date
+            def describe(booking):
+                return {
+                    'id': booking.id,
+                    'car': booking.car.title,
+                    'client_name': booking.client_name,
+                    'telegram_id': booking.telegram_id,
+                    'status': booking.status,
+                    'period': f"{booking.start_date} - {booking.end_date}",
+                    'total_days': booking.total_days
+                }
             
-            while current_date < end_date:
-                # Находим бронирования на эту дату
-                date_bookings = []
-                for booking in bookings_query:
-                    if booking.start_date <= current_date <= booking.end_date:
-                        date_bookings.append({
-                            'id': booking.id,
-                            'car': booking.car.title,
-                            'user': booking.user.username,
-                            'status': booking.status,
-                            'period': f"{booking.start_date} - {booking.end_date}",
-                            'total_days': (booking.end_date - booking.start_date).days + 1
-                        })
-                
-                is_available = len(date_bookings) == 0
-                
-                calendar_data.append({
-                    'date': current_date,
-                    'is_available': is_available,
-                    'bookings': date_bookings
-                })
-                
-                current_date += timedelta(days=1)
+            # Создаем календарь с периодами бронирования
+            calendar_data = [
+                {
+                    'date': day,
+                    'is_available': not day_bookings,
+                    'bookings': day_bookings
+                }
+                for day, day_bookings in bookings_by_day(bookings, start_date, end_date, describe)
+            ]
             
             # Группируем занятые периоды для удобного отображения
             booked_periods = []
-            for booking in bookings_query:
+            for booking in bookings:
                 booked_periods.append({
                     'id': booking.id,
-                    'car_id': booking.car.id,
+                    'car_id': booking.car_id,
                     'car_title': booking.car.title,
                     'start_date': booking.start_date,
                     'end_date': booking.end_date,
                     'status': booking.status,
-                    'user': booking.user.username,
+                    'client_name': booking.client_name,
+                    'telegram_id': booking.telegram_id,
                     'period': f"{booking.start_date} - {booking.end_date}",
-                    'total_days': (booking.end_date - booking.start_date).days + 1
+                    'total_days': booking.total_days
                 })
             
             return Response({
@@ -263,4 +240,22 @@ class CarFeaturesView(APIView):
     def get(self, request):
         features = Feature.objects.all()
         serializer = FeatureSerializer(features, many=True)
-        return Response(serializer.data)
\ No newline at end of file
+        return Response(serializer.data)
+
+
+class CarImagesBulkUploadView(BulkImageUploadView):
+    """Массовая загрузка фотографий автомобиля (только для администраторов)"""
+    image_model = CarImage
+    parent_model = Car
+    parent_field = 'car'
+
+
+class CarImageUploadView(ChunkedUploadStartView):
+    """Начало загрузки фото автомобиля по частям (только для администраторов)"""
+    image_model = CarImage
+    parent_model = Car
+
+
+class CarFreeWindowsView(FreeWindowsView):
+    """Ближайшие свободные даты автомобиля на нужное число дней"""
+    booking_model = Booking
@@ -5,6 +5,7 @@ from django.contrib.auth.admin import GroupAdmin as BaseGroupAdmin
 from django.contrib.auth.models import User, Group
 from unfold.forms import AdminPasswordChangeForm, UserChangeForm, UserCreationForm
 from unfold.admin import ModelAdmin
+from .models import ImageJob, Occupancy, UploadSession
 
 # Отменяем стандартную регистрацию
 admin.site.unregister(User)
@@ -19,4 +20,34 @@ class UserAdmin(BaseUserAdmin, ModelAdmin):
 
 @admin.register(Group)
 class GroupAdmin(BaseGroupAdmin, ModelAdmin):
-    pass
\ No newline at end of file
+    pass
+
+@admin.register(ImageJob)
+class ImageJobAdmin(ModelAdmin):
+    list_display = ['__str__', 'status', 'attempts', 'run_after', 'updated_at']
+    list_filter = ['status', 'content_type']
+    readonly_fields = ['content_type', 'object_id', 'attempts', 'last_error', 'created_at', 'updated_at']
+    list_per_page = 20
+
+
+@admin.register(UploadSession)
+class UploadSessionAdmin(ModelAdmin):
+    list_display = ['__str__', 'content_type', 'status', 'created_at', 'updated_at']
+    list_filter = ['status', 'content_type']
+    readonly_fields = ['content_type', 'parent_id', 'filename', 'size', 'checksum', 'offset', 'image_id']
+    list_per_page = 20
+
+
+@admin.register(Occupancy)
+class OccupancyAdmin(ModelAdmin):
+    list_display = ['resource_type', 'resource_id', 'date', 'booking_id', 'status']
+    list_filter = ['resource_type', 'status']
+    search_fields = ['booking_id', 'resource_id']
+    list_per_page = 50
+
+    def has_add_permission(self, request):
+        # Строки ведёт core.occupancy; расхождения чинит manage.py rebuild_occupancy
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
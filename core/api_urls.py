@@ -0,0 +1,8 @@
+from django.urls import path
+
+from . import views
+
+urlpatterns = [
+    path('<uuid:upload_id>/', views.ChunkedUploadView.as_view(), name='upload-chunk'),
+    path('<uuid:upload_id>/finalize/', views.ChunkedUploadFinalizeView.as_view(), name='upload-finalize'),
+]
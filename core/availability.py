@@ -0,0 +1,264 @@
+import threading
+import time
+from bisect import bisect_left, bisect_right
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import DatabaseError, IntegrityError, transaction
+from django.db.models import F
+from django.db.models.signals import post_delete, post_save
+
+# Брони в этих статусах занимают даты
+ACTIVE_STATUSES = ('confirmed', 'active', 'pending')
+
+
+class IntervalIndex:
+    """
+    Брони одного объекта: интервалы [start, end] (обе даты включительно),
+    отсортированные по началу, и префиксный максимум концов. Пересекается ли
+    запрос с какой-нибудь бронью — один bisect: среди броней, начавшихся не
+    позже конца запроса, достаточно проверить наибольший конец.
+    """
+
+    def __init__(self):
+        self.intervals = []  # [(start, end, id), ...] по возрастанию start
+        self.starts = []
+        self.max_ends = []
+
+    def __len__(self):
+        return len(self.intervals)
+
+    def add(self, start, end, booking_id):
+        position = bisect_right(self.starts, start)
+        self.intervals.insert(position, (start, end, booking_id))
+        self.starts.insert(position, start)
+        self.max_ends.insert(position, end)
+        self._rebuild_max_ends(position)
+
+    def remove(self, booking_id):
+        for position, interval in enumerate(self.intervals):
+            if interval[2] == booking_id:
+                del self.intervals[position]
+                del self.starts[position]
+                del self.max_ends[position]
+                self._rebuild_max_ends(position)
+                return True
+        return False
+
+    def _rebuild_max_ends(self, position):
+        for i in range(position, len(self.intervals)):
+            end = self.intervals[i][1]
+            self.max_ends[i] = max(self.max_ends[i - 1], end) if i else end
+
+    def overlaps(self, start, end):
+        """Есть ли бронь, пересекающая [start, end] — O(log n)"""
+        count = bisect_right(self.starts, end)
+        return count > 0 and self.max_ends[count - 1] >= start
+
+    def conflicts(self, start, end):
+        """id броней, пересекающих [start, end]"""
+        found = []
+        i = bisect_right(self.starts, end) - 1
+        # Левее позиции, где префиксный максимум меньше start, пересечений нет
+        while i >= 0 and self.max_ends[i] >= start:
+            if self.intervals[i][1] >= start:
+                found.append(self.intervals[i][2])
+            i -= 1
+        found.reverse()
+        return found
+
+    def free_windows(self, length, start, end, limit):
+        """
+        Первые limit свободных промежутков в [start, end], куда помещается
+        бронь на length дней, — один проход по броням в порядке начала.
+        Брони, закончившиеся до start, пропускаются bisect'ом по префиксному
+        максимуму концов (он не убывает).
+        :return: [(первый свободный день, последний свободный день), ...]
+        """
+        windows = []
+        need = timedelta(days=length - 1)
+        cursor = start  # первый день, не занятый просмотренными бронями
+        for position in range(bisect_left(self.max_ends, start), len(self.intervals)):
+            booking_start, booking_end, _ = self.intervals[position]
+            if len(windows) >= limit or booking_start > end:
+                break
+            if booking_start > cursor and booking_start - timedelta(days=1) - cursor >= need:
+                windows.append((cursor, booking_start - timedelta(days=1)))
+            cursor = max(cursor, booking_end + timedelta(days=1))
+        if len(windows) < limit and cursor <= end and end - cursor >= need:
+            windows.append((cursor, end))
+        return windows
+
+
+class AvailabilityEngine:
+    """
+    Занятость объектов одного раздела в памяти процесса. Загружается из
+    базы одним запросом и обновляется сигналами сохранения и удаления брони.
+    Другие процессы (воркеры gunicorn) меняют брони без наших сигналов,
+    поэтому каждое зафиксированное изменение увеличивает счётчик поколения
+    в базе; перед ответом поколение сверяется (запрос по первичному ключу),
+    и при расхождении индекс перечитывается.
+    """
+
+    def __init__(self, booking_model, resource_field):
+        self.booking_model = booking_model
+        self.resource_field = resource_field
+        self.resource_attname = booking_model._meta.get_field(resource_field).attname
+        self.key = booking_model._meta.label_lower
+        self._lock = threading.RLock()
+        self._indexes = None
+        self._resources = {}  # id брони -> id объекта, в индексе которого она лежит
+        self._generation = None
+        self._loaded_at = None
+
+    def _current_generation(self):
+        from .models import AvailabilityGeneration
+        return AvailabilityGeneration.objects.filter(key=self.key).values_list('value', flat=True).first() or 0
+
+    def load(self):
+        with self._lock:
+            generation = self._current_generation()
+            indexes = {}
+            resources = {}
+            rows = self.booking_model.objects.filter(status__in=ACTIVE_STATUSES).order_by('start_date').values_list(
+                self.resource_attname, 'start_date', 'end_date', 'id'
+            )
+            for resource_id, start, end, booking_id in rows:
+                index = indexes.setdefault(resource_id, IntervalIndex())
+                # Строки уже по возрастанию начала — добавляем в конец
+                index.intervals.append((start, end, booking_id))
+                index.starts.append(start)
+                index.max_ends.append(max(index.max_ends[-1], end) if index.max_ends else end)
+                resources[booking_id] = resource_id
+            self._indexes = indexes
+            self._resources = resources
+            self._generation = generation
+            self._loaded_at = time.monotonic()
+
+    def invalidate(self):
+        with self._lock:
+            self._indexes = None
+
+    def _fresh_indexes(self):
+        with self._lock:
+            # Поколение увеличивается после фиксации и может потеряться (воркер
+            # упал между ними) — поэтому индекс ещё и перечитывается не реже
+            # раза в AVAILABILITY_INDEX_TTL секунд
+            ttl = getattr(settings, 'AVAILABILITY_INDEX_TTL', 60)
+            if (
+                self._indexes is None or self._generation != self._current_generation()
+                or time.monotonic() - self._loaded_at > ttl
+            ):
+                self.load()
+            return self._indexes
+
+    def is_available(self, resource_id, start, end):
+        with self._lock:
+            index = self._fresh_indexes().get(resource_id)
+            return index is None or not index.overlaps(start, end)
+
+    def conflicts(self, resource_id, start, end):
+        """id броней объекта, пересекающих [start, end]"""
+        with self._lock:
+            index = self._fresh_indexes().get(resource_id)
+            return index.conflicts(start, end) if index else []
+
+    def free_windows(self, resource_id, length, start, end, limit):
+        """Свободные промежутки объекта (см. IntervalIndex.free_windows)"""
+        with self._lock:
+            index = self._fresh_indexes().get(resource_id) or IntervalIndex()
+            return index.free_windows(length, start, end, limit)
+
+    def booked_resources(self, start, end):
+        """id объектов, занятых хотя бы в один из дней [start, end]"""
+        with self._lock:
+            return {
+                resource_id for resource_id, index in self._fresh_indexes().items() if index.overlaps(start, end)
+            }
+
+    def booking_changed(self, booking, deleted=False):
+        """
+        Обновляет индекс и поколение в базе после фиксации транзакции брони:
+        при откате в индексе не останется лишней брони, а общая строка
+        поколения раздела не блокируется на время транзакции брони. Если
+        увеличить поколение не удалось, другие процессы увидят изменение
+        не позже чем через AVAILABILITY_INDEX_TTL секунд.
+        """
+        active = not deleted and booking.status in ACTIVE_STATUSES
+        change = (booking.pk, getattr(booking, self.resource_attname), booking.start_date, booking.end_date, active)
+        transaction.on_commit(lambda: self._apply_change(*change))
+
+    def _apply_change(self, booking_id, resource_id, start, end, active):
+        with self._lock:
+            try:
+                generation = self._bump_generation()
+            except DatabaseError as e:
+                # Бронь уже зафиксирована — ответ из-за счётчика не роняем: свой
+                # индекс перечитаем, другие процессы — по AVAILABILITY_INDEX_TTL
+                print(f"Error bumping availability generation for {self.key}: {e}")
+                self._indexes = None
+                return
+            if self._indexes is None:
+                return
+            if self._generation is None or generation != self._generation + 1:
+                # Пока мы не смотрели, брони менял другой процесс
+                self._indexes = None
+                return
+
+            # Бронь могли перенести на другой объект — убираем её оттуда, где она была
+            old_resource_id = self._resources.pop(booking_id, None)
+            if old_resource_id is not None:
+                self._indexes[old_resource_id].remove(booking_id)
+            if active:
+                self._indexes.setdefault(resource_id, IntervalIndex()).add(start, end, booking_id)
+                self._resources[booking_id] = resource_id
+            self._generation = generation
+
+    def _bump_generation(self):
+        from .models import AvailabilityGeneration
+        updated = AvailabilityGeneration.objects.filter(key=self.key).update(value=F('value') + 1)
+        if not updated:
+            try:
+                with transaction.atomic():
+                    AvailabilityGeneration.objects.create(key=self.key, value=1)
+            except IntegrityError:
+                # Строку одновременно создал другой процесс — увеличиваем её
+                AvailabilityGeneration.objects.filter(key=self.key).update(value=F('value') + 1)
+        return self._current_generation()
+
+
+_engines = {}
+
+
+def register(booking_model, resource_field):
+    """
+    Подключает движок к модели брони (вызывается из AppConfig.ready).
+    :param resource_field: внешний ключ на объект брони ('car', 'house', ...)
+    """
+    engine = _engines.get(booking_model._meta.label_lower)
+    if engine is None:
+        engine = _engines[booking_model._meta.label_lower] = AvailabilityEngine(booking_model, resource_field)
+
+    def on_save(sender, instance, **kwargs):
+        from .occupancy import sync_booking
+        sync_booking(engine, instance)
+        engine.booking_changed(instance)
+
+    def on_delete(sender, instance, **kwargs):
+        from .occupancy import sync_booking
+        sync_booking(engine, instance, deleted=True)
+        engine.booking_changed(instance, deleted=True)
+
+    post_save.connect(on_save, sender=booking_model, weak=False, dispatch_uid=f'availability-save-{engine.key}')
+    post_delete.connect(on_delete, sender=booking_model, weak=False, dispatch_uid=f'availability-delete-{engine.key}')
+    return engine
+
+
+def availability(booking_model):
+    """Движок занятости для модели брони"""
+    return _engines[booking_model._meta.label_lower]
+
+
+def engines():
+    """Движки всех подключённых разделов"""
+    return list(_engines.values())
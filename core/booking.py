@@ -0,0 +1,52 @@
+from django.db import IntegrityError, transaction
+from django.db.models import F
+
+from .availability import ACTIVE_STATUSES, availability
+from .models import BookingLock
+
+
+class BookingConflict(Exception):
+    """Даты уже заняты другой бронью этого объекта"""
+
+
+def lock_resource(resource_type, resource_id):
+    """
+    Берёт замок объекта до конца текущей транзакции: UPDATE строки-замка.
+    В PostgreSQL это блокировка одной строки — ждут только брони того же
+    объекта (общий счётчик поколения раздела увеличивается уже после
+    фиксации, см. AvailabilityEngine.booking_changed). В SQLite любая
+    запись берёт блокировку всей базы, поэтому UPDATE должен быть первым
+    запросом транзакции: если до него транзакция уже читала, SQLite
+    вместо ожидания ответит «database is locked».
+    """
+    locks = BookingLock.objects.filter(resource_type=resource_type, resource_id=resource_id)
+    if locks.update(version=F('version') + 1):
+        return
+    try:
+        with transaction.atomic():
+            BookingLock.objects.create(resource_type=resource_type, resource_id=resource_id, version=1)
+    except IntegrityError:
+        # Первую бронь объекта одновременно создаёт другой запрос — ждём его замок
+        locks.update(version=F('version') + 1)
+
+
+def create_booking(booking_model, **fields):
+    """
+    Создаёт бронь, если её даты свободны, — проверка и вставка идут под
+    замком объекта в одной транзакции, поэтому из двух одновременных броней
+    на те же даты проходит только одна.
+    :raises BookingConflict: даты заняты
+    """
+    engine = availability(booking_model)
+    resource = fields[engine.resource_field]
+    with transaction.atomic():
+        lock_resource(engine.resource_field, resource.pk)
+        conflicting = booking_model.objects.filter(
+            **{engine.resource_attname: resource.pk},
+            status__in=ACTIVE_STATUSES,
+            start_date__lte=fields['end_date'],
+            end_date__gte=fields['start_date'],
+        )
+        if conflicting.exists():
+            raise BookingConflict()
+        return booking_model.objects.create(**fields)
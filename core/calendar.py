@@ -0,0 +1,55 @@
+from datetime import date, timedelta
+
+from django.utils import timezone
+
+
+def month_range(month=None, year=None):
+    """
+    Первый день месяца и первый день следующего месяца (граница не входит).
+    Без month и year — текущий месяц.
+    """
+    if month and year:
+        start_date = date(int(year), int(month), 1)
+    else:
+        today = timezone.now().date()
+        start_date = date(today.year, today.month, 1)
+    if start_date.month == 12:
+        return start_date, date(start_date.year + 1, 1, 1)
+    return start_date, date(start_date.year, start_date.month + 1, 1)
+
+
+def bookings_by_day(bookings, start_date, end_date, describe):
+    """
+    Раскладывает брони по дням [start_date, end_date) одним проходом по
+    событиям «бронь началась» и «бронь закончилась», разложенным по дням
+    месяца: O(броней + дней + размер ответа) вместо перебора всех броней
+    для каждого дня. Внутри дня брони идут по дате начала.
+    :param bookings: брони (даты включительно), уже загруженные из базы
+    :param describe: бронь -> словарь для ответа; вызывается один раз на бронь
+    :return: [(день, [описания броней на этот день]), ...] для каждого дня
+    """
+    days = (end_date - start_date).days
+    if days <= 0:
+        return []
+
+    # starts[i] — брони, которые начинаются в день i, ends[i] — закончившиеся накануне
+    starts = [[] for _ in range(days + 1)]
+    ends = [[] for _ in range(days + 1)]
+    for booking in sorted(bookings, key=lambda booking: (booking.start_date, booking.pk)):
+        first = max((booking.start_date - start_date).days, 0)
+        last = min((booking.end_date - start_date).days, days - 1)
+        if first > last:
+            continue
+        entry = (booking.pk, describe(booking))
+        starts[first].append(entry)
+        ends[last + 1].append(booking.pk)
+
+    result = []
+    active = {}
+    for offset in range(days):
+        for booking_id in ends[offset]:
+            del active[booking_id]
+        for booking_id, description in starts[offset]:
+            active[booking_id] = description
+        result.append((start_date + timedelta(days=offset), list(active.values())))
+    return result
@@ -0,0 +1,86 @@
+import hashlib
+import json
+import time
+
+from django.conf import settings
+from rest_framework import status
+from rest_framework.exceptions import ValidationError
+from rest_framework.response import Response
+
+from .models import IdempotencyKey
+
+POLL_INTERVAL = 0.05  # секунд между проверками, готов ли ответ первого запроса
+
+
+def request_fingerprint(request):
+    """SHA-256 тела запроса: с тем же ключом нельзя прислать другие данные"""
+    body = json.dumps(request.data, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(body.encode()).hexdigest()
+
+
+def wait_for_response(record):
+    """
+    Ждёт, пока запрос, занявший ключ, сохранит ответ.
+    :return: строка с ответом; None — ключ освободился (запрос упал или
+        завис дольше IDEMPOTENCY_KEY_LOCK_TIMEOUT), можно занять его снова
+    """
+    lock_timeout = getattr(settings, 'IDEMPOTENCY_KEY_LOCK_TIMEOUT', 30)
+    deadline = time.monotonic() + lock_timeout
+    while record is not None and record.status != 'done':
+        if time.monotonic() > deadline:
+            IdempotencyKey.purge_expired()
+            return None
+        time.sleep(POLL_INTERVAL)
+        record = IdempotencyKey.objects.filter(pk=record.pk).first()
+    return record
+
+
+class IdempotentCreateMixin:
+    """
+    POST с заголовком Idempotency-Key выполняется один раз: повтор с тем же
+    ключом (Telegram WebApp повторяет запросы при плохой связи) получает
+    сохранённый ответ, не трогая таблицы броней, а одновременные повторы
+    ждут ответа первого запроса. Без заголовка create работает как обычно.
+    """
+    idempotency_header = 'Idempotency-Key'
+
+    def create(self, request, *args, **kwargs):
+        key = request.headers.get(self.idempotency_header)
+        if key is None:
+            return super().create(request, *args, **kwargs)
+        if not key or len(key) > 255:
+            return Response(
+                {'error': f'{self.idempotency_header} — непустая строка до 255 символов'},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+
+        fingerprint = request_fingerprint(request)
+        while True:
+            record, claimed = IdempotencyKey.claim(request.path, key, fingerprint)
+            if claimed:
+                break
+            if record.fingerprint != fingerprint:
+                return Response(
+                    {'error': f'{self.idempotency_header} уже использован с другими данными'},
+                    status=status.HTTP_422_UNPROCESSABLE_ENTITY,
+                )
+            record = wait_for_response(record)
+            if record is not None:
+                response = Response(record.response_body, status=record.response_status)
+                response['Idempotent-Replayed'] = 'true'
+                return response
+
+        try:
+            response = super().create(request, *args, **kwargs)
+        except ValidationError as exc:
+            # Отказ тоже ответ: повтор с теми же данными получит его же
+            response = self.handle_exception(exc)
+        except Exception:
+            record.delete()
+            raise
+
+        if response.status_code >= 500:
+            record.delete()
+        else:
+            record.finish(response.status_code, response.data)
+        return response
@@ -0,0 +1,95 @@
+import os
+import posixpath
+import re
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+
+from core.models import content_hash, watermarked_image_models
+
+# Хранилище Django при совпадении имён дописывает "_" и 7 случайных символов.
+# Старый save() сначала сохранял загрузку как есть, а затем файл с водяным
+# знаком под тем же именем — исходный файл уже лежал на диске, поэтому суффикс
+# появлялся уже при первом наложении, и ещё по одному при каждом повторном.
+# Загрузка с занятым именем добавляла свой суффикс до всех наложений.
+STORAGE_SUFFIX_RE = re.compile(r'_[A-Za-z0-9]{7}$')
+
+# Первое наложение шло в том же запросе, что и загрузка: файл с водяным знаком
+# записан через секунды после исходного. Больший промежуток — повторное
+# наложение или совпадение имени с чужой, более ранней загрузкой.
+FIRST_PASS_WINDOW = timedelta(seconds=60)
+
+
+def parent_name(name):
+    """Имя файла без последнего суффикса хранилища или None"""
+    directory, filename = posixpath.split(name)
+    stem, extension = os.path.splitext(filename)
+    match = STORAGE_SUFFIX_RE.search(stem)
+    if not match:
+        return None
+    return posixpath.join(directory, stem[:match.start()] + extension)
+
+
+def watermark_passes(storage, name):
+    """
+    Сколько раз старый save() наложил водяной знак на файл. Каждое наложение
+    оставляло свой исходный файл на диске, поэтому цепочка имя_A_B -> имя_A ->
+    имя восстанавливается по существующим файлам. Исходная загрузка — звено,
+    после которого файл с водяным знаком записан в пределах FIRST_PASS_WINDOW;
+    звенья ниже неё — совпадения имён при загрузке, а не наложения.
+    :return: число наложений или None, если исходной загрузки на диске нет
+    """
+    chain = [name]
+    parent = parent_name(name)
+    while parent and storage.exists(parent):
+        chain.append(parent)
+        parent = parent_name(parent)
+
+    modified = [storage.get_modified_time(item) for item in chain] if len(chain) > 1 else []
+    for step in range(len(chain) - 1):
+        if modified[step] - modified[step + 1] <= FIRST_PASS_WINDOW:
+            return step + 1
+    return None
+
+
+class Command(BaseCommand):
+    help = "Ищет фотографии, на которые водяной знак был наложен больше одного раза"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--verify', action='store_true',
+            help="Сверять хэш файла с сохранённым (читает каждый файл)",
+        )
+
+    def handle(self, *args, **options):
+        found = 0
+        checked = 0
+
+        for model in watermarked_image_models():
+            for image in model.objects.exclude(image='').iterator():
+                checked += 1
+                reason = None
+
+                if not image.processed_hash:
+                    # Фото обработано до появления хэшей: судим по файлам,
+                    # которые старый save() оставлял на диске при каждом наложении
+                    passes = watermark_passes(image.image.storage, image.image.name)
+                    if passes and passes > 1:
+                        reason = f"наложений водяного знака: {passes}"
+                elif options['verify']:
+                    try:
+                        with image.image.open('rb'):
+                            current_hash = content_hash(image.image)
+                    except FileNotFoundError:
+                        reason = "файл не найден"
+                    else:
+                        if current_hash != image.processed_hash:
+                            reason = "файл изменён после обработки"
+
+                if reason:
+                    found += 1
+                    self.stdout.write(
+                        f"{model._meta.label} #{image.pk}: {image.image.name} ({reason})"
+                    )
+
+        self.stdout.write(f"Проверено фото: {checked}, подозрительных: {found}")
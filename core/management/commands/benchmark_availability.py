@@ -0,0 +1,94 @@
+import random
+import statistics
+import time
+from datetime import date, timedelta
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from rest_framework.test import APIRequestFactory
+
+from cars.models import Booking, Car, Category
+from cars.views import CarAvailabilityView
+from core.views import BatchAvailabilityView
+from excursions.models import Excursion, ExcursionBooking, ExcursionCategory
+from excursions.views import ExcursionAvailabilityView
+
+
+class Command(BaseCommand):
+    help = (
+        "Сравнивает N запросов car-availability/excursion-availability подряд "
+        "с одним POST /api/availability/batch/. Данные создаются во временной "
+        "транзакции и откатываются"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--items', type=int, default=100, help="Проверок в пачке (по умолчанию 100)")
+        parser.add_argument('--repeat', type=int, default=5, help="Повторов каждого варианта")
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            queries = self._make_data(max(1, options['items']))
+            factory = APIRequestFactory()
+            single_views = {
+                'car': (CarAvailabilityView.as_view(), 'car_id'),
+                'excursion': (ExcursionAvailabilityView.as_view(), 'excursion_id'),
+            }
+            batch_view = BatchAvailabilityView.as_view()
+
+            def sequential():
+                for query in queries:
+                    view, kwarg = single_views[query['type']]
+                    request = factory.get('/', {'start_date': query['start'], 'end_date': query['end']})
+                    view(request, **{kwarg: query['id']}).render()
+
+            def batch():
+                batch_view(factory.post('/', queries, format='json')).render()
+
+            repeat = max(1, options['repeat'])
+            single = self._measure(sequential, repeat)
+            grouped = self._measure(batch, repeat)
+            transaction.set_rollback(True)
+
+        self.stdout.write(f"Проверок: {len(queries)}")
+        self.stdout.write(f"{'Запросы по одному, мс':>24} {single:>10.1f}")
+        self.stdout.write(f"{'Один пакетный, мс':>24} {grouped:>10.1f}")
+        self.stdout.write(f"{'Ускорение':>24} {single / grouped if grouped else 0:>9.1f}x")
+
+    @staticmethod
+    def _make_data(count):
+        rng = random.Random(42)
+        base = date(2031, 1, 1)
+        category = Category.objects.create(title="Бенчмарк")
+        excursion_category = ExcursionCategory.objects.create(title="Бенчмарк")
+        queries = []
+        for i in range(count):
+            if i % 2:
+                resource = Excursion.objects.create(title=f"Экскурсия {i}", category=excursion_category, price_per_person=50)
+                booking_model, field = ExcursionBooking, 'excursion'
+            else:
+                resource = Car.objects.create(
+                    title=f"Car {i}", category=category, year=2020, color="Белый", engine_volume=2.0,
+                    mileage=0, oil_type='Бензин', price_per_day=50, deposit=100,
+                )
+                booking_model, field = Booking, 'car'
+            for _ in range(3):
+                start = base + timedelta(days=rng.randrange(90))
+                booking_model.objects.create(
+                    **{field: resource}, telegram_id='1', start_date=start, end_date=start + timedelta(days=rng.randrange(7)),
+                    client_name="Бенчмарк", phone_number="+996", status='confirmed', total_price=100,
+                )
+            start = base + timedelta(days=rng.randrange(90))
+            queries.append({
+                'type': field, 'id': resource.id,
+                'start': start.isoformat(), 'end': (start + timedelta(days=rng.randrange(1, 7))).isoformat(),
+            })
+        return queries
+
+    @staticmethod
+    def _measure(run, repeat):
+        timings = []
+        for _ in range(repeat):
+            started = time.perf_counter()
+            run()
+            timings.append((time.perf_counter() - started) * 1000)
+        return statistics.median(timings)
@@ -0,0 +1,65 @@
+import random
+import statistics
+import time
+from datetime import timedelta
+from types import SimpleNamespace
+
+from django.core.management.base import BaseCommand
+
+from core.calendar import bookings_by_day, month_range
+
+
+def per_day_scan(bookings, start_date, end_date, describe):
+    """Прежний алгоритм календаря: для каждого дня перебираются все брони"""
+    result = []
+    current_date = start_date
+    while current_date < end_date:
+        result.append((current_date, [
+            describe(booking) for booking in bookings if booking.start_date <= current_date <= booking.end_date
+        ]))
+        current_date += timedelta(days=1)
+    return result
+
+
+def describe(booking):
+    return {'id': booking.pk, 'period': f"{booking.start_date} - {booking.end_date}"}
+
+
+class Command(BaseCommand):
+    help = (
+        "Сравнивает построение календаря бронирований на месяц: прежний перебор "
+        "броней для каждого дня и раскладку по дням проходом по событиям"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--bookings', type=int, default=10_000, help="Броней в месяце (по умолчанию 10000)")
+        parser.add_argument('--repeat', type=int, default=3, help="Повторов каждого варианта")
+
+    def handle(self, *args, **options):
+        start_date, end_date = month_range(7, 2025)
+        rng = random.Random(42)
+        bookings = []
+        for pk in range(options['bookings']):
+            # Брони с концом прошлого месяца по начало следующего
+            start = start_date + timedelta(days=rng.randrange(-7, 31))
+            bookings.append(SimpleNamespace(
+                pk=pk, start_date=start, end_date=start + timedelta(days=rng.randrange(0, 10)),
+            ))
+
+        repeat = max(1, options['repeat'])
+        sweep = self._measure(bookings_by_day, bookings, start_date, end_date, repeat)
+        scan = self._measure(per_day_scan, bookings, start_date, end_date, repeat)
+
+        self.stdout.write(f"Броней: {len(bookings)}, дней: {(end_date - start_date).days}")
+        self.stdout.write(f"{'Перебор по дням, мс':>24} {scan:>10.1f}")
+        self.stdout.write(f"{'Проход по событиям, мс':>24} {sweep:>10.1f}")
+        self.stdout.write(f"{'Ускорение':>24} {scan / sweep if sweep else 0:>9.1f}x")
+
+    @staticmethod
+    def _measure(build, bookings, start_date, end_date, repeat):
+        timings = []
+        for _ in range(repeat):
+            started = time.perf_counter()
+            build(bookings, start_date, end_date, describe)
+            timings.append((time.perf_counter() - started) * 1000)
+        return statistics.median(timings)
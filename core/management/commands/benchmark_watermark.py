@@ -0,0 +1,51 @@
+import io
+import statistics
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from PIL import Image
+
+from watermark import WatermarkProcessor, layer_cache
+
+
+def parse_sizes(value):
+    try:
+        return [tuple(int(part) for part in size.split('x')) for size in value.split(',')]
+    except ValueError:
+        raise CommandError(f"Размеры задаются как 800x600,1600x1067: {value}")
+
+
+class Command(BaseCommand):
+    help = (
+        "Сравнивает время наложения водяного знака по центру и плиткой на фото "
+        "разных размеров: первый вызов (со сборкой слоя) и повторные (слой из кэша)"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--sizes', type=parse_sizes, default=parse_sizes('640x480,1280x853,2048x1365,3200x2133'),
+            help="Размеры фото через запятую (по умолчанию 640x480,1280x853,2048x1365,3200x2133)",
+        )
+        parser.add_argument('--repeat', type=int, default=5, help="Повторов с готовым слоем")
+
+    def handle(self, *args, **options):
+        self.stdout.write(f"{'Размер':>11} {'Режим':>7} {'Первый, мс':>11} {'Повтор, мс':>11}")
+
+        for width, height in options['sizes']:
+            buffer = io.BytesIO()
+            Image.linear_gradient('L').resize((width, height)).convert('RGB').save(buffer, format='JPEG')
+            source = buffer.getvalue()
+
+            for mode in WatermarkProcessor.MODES:
+                layer_cache.clear()
+                cold = self._measure(source, mode)
+                warm = statistics.median(self._measure(source, mode) for _ in range(max(1, options['repeat'])))
+                self.stdout.write(f"{width:>5}x{height:<5} {mode:>7} {cold:>11.1f} {warm:>11.1f}")
+
+        layer_cache.clear()
+
+    @staticmethod
+    def _measure(source, mode):
+        started = time.perf_counter()
+        WatermarkProcessor.render(io.BytesIO(source), mode=mode)
+        return (time.perf_counter() - started) * 1000
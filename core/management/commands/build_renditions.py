@@ -0,0 +1,33 @@
+from django.core.management.base import BaseCommand
+from django.db.models import Q
+
+from core.models import watermarked_image_models
+
+
+class Command(BaseCommand):
+    help = (
+        "Создаёт уменьшенные копии и превью-заглушки для фото, обработанных до их появления. "
+        "Копии режутся из файла с водяным знаком, оригинал не нужен."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--force', action='store_true', help="Пересоздать копии и у готовых фото")
+
+    def handle(self, *args, **options):
+        built = failed = 0
+
+        for model in watermarked_image_models():
+            queryset = model.objects.exclude(image='').filter(processing_status='ready')
+            if not options['force']:
+                queryset = queryset.filter(Q(renditions={}) | Q(placeholder=''))
+
+            for image in queryset.iterator():
+                try:
+                    image.rebuild_renditions()
+                except Exception as e:
+                    failed += 1
+                    self.stderr.write(f"{model._meta.label} #{image.pk}: {e}")
+                    continue
+                built += 1
+
+        self.stdout.write(f"Создано копий для фото: {built}, ошибок: {failed}")
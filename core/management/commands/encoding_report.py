@@ -0,0 +1,98 @@
+import io
+import os
+from collections import defaultdict
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from PIL import Image
+
+from core.models import rendition_widths
+from watermark import EncodingProfile, WatermarkProcessor, encoding_profile, rendition_formats
+from .media_gc import format_size, walk_files
+
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.webp')
+
+
+def legacy_encode(image, image_format):
+    """Кодирование копий до профилей: JPEG q85 без оптимизации, WebP q80"""
+    buffer = io.BytesIO()
+    if image_format == 'webp':
+        image.save(buffer, format='WEBP', quality=80, method=4)
+    else:
+        image.save(buffer, format='JPEG', quality=85)
+    return buffer.getvalue()
+
+
+def savings(before, after):
+    return f"{(1 - after / before) * 100:+.1f}%" if before else "—"
+
+
+class Command(BaseCommand):
+    help = (
+        "Перекодирует фото из MEDIA_ROOT прежними настройками и профилями из "
+        "IMAGE_ENCODING_PROFILES и сравнивает суммарный размер. Файлы не меняются."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--root', default=None, help="Каталог с фото (по умолчанию MEDIA_ROOT)")
+        parser.add_argument('--limit', type=int, default=0, help="Взять не больше стольких фото")
+
+    def handle(self, *args, **options):
+        root = options['root'] or str(settings.MEDIA_ROOT)
+        watermark_path = os.path.abspath(WatermarkProcessor.watermark_path())
+        formats = rendition_formats()
+        if 'avif' not in formats and EncodingProfile.available('avif'):
+            # AVIF считаем для сравнения, даже если он ещё не включён
+            formats.append('avif')
+
+        # {(профиль, формат): [байт прежде, байт сейчас]}
+        totals = defaultdict(lambda: [0, 0])
+        count = 0
+        for name, entry in sorted(walk_files(root)):
+            if options['limit'] and count >= options['limit']:
+                break
+            if not name.lower().endswith(IMAGE_EXTENSIONS) or '/renditions/' in f"/{name}":
+                continue
+            if os.path.abspath(entry.path) == watermark_path:
+                continue
+
+            try:
+                image, image_format = WatermarkProcessor.open_image(entry.path)
+                image = WatermarkProcessor.flatten(image)
+            except (OSError, ValueError) as e:
+                self.stderr.write(f"{name}: {e}")
+                continue
+            count += 1
+
+            # Основной файл: раньше сохранялся в исходном формате (JPEG q95)
+            legacy = WatermarkProcessor.encode(image, image_format)
+            totals['photo', 'jpeg'][0] += len(legacy)
+            totals['photo', 'jpeg'][1] += len(encoding_profile('photo').encode(image))
+
+            for rendition, width in rendition_widths().items():
+                if width >= image.width:
+                    continue
+                height = max(1, round(image.height * width / image.width))
+                small = image.resize((width, height), Image.Resampling.LANCZOS)
+                profile = encoding_profile(rendition)
+                # AVIF раньше не было — сравниваем его с прежним JPEG
+                legacy_sizes = {fmt: len(legacy_encode(small, fmt)) for fmt in ('webp', 'jpeg')}
+                for fmt in formats:
+                    totals[rendition, fmt][0] += legacy_sizes.get(fmt, legacy_sizes['jpeg'])
+                    totals[rendition, fmt][1] += len(profile.with_format(fmt).encode(small))
+
+        self.stdout.write(f"Фото: {count} из {root}")
+        self.stdout.write(f"{'Профиль':>10} {'Формат':>7} {'Было':>10} {'Стало':>10} {'Экономия':>9}")
+        before_total = after_total = 0
+        for (profile, fmt), (before, after) in totals.items():
+            self.stdout.write(
+                f"{profile:>10} {fmt:>7} {format_size(before):>10} {format_size(after):>10} "
+                f"{savings(before, after):>9}"
+            )
+            if fmt != 'avif' or 'avif' in rendition_formats():
+                before_total += before
+                after_total += after
+        self.stdout.write(
+            f"Итого по включённым форматам: {format_size(before_total)} → {format_size(after_total)} "
+            f"({savings(before_total, after_total)})"
+        )
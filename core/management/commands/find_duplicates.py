@@ -0,0 +1,56 @@
+from django.core.management.base import BaseCommand
+
+from core import phash
+from core.models import find_similar_images, watermarked_image_models
+
+
+class Command(BaseCommand):
+    help = (
+        "Считает перцептивные хэши фото, у которых их ещё нет, и выводит "
+        "группы похожих фото во всех разделах"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--distance', type=int, default=3,
+            help="Максимальное различие хэшей в битах (0-3, по умолчанию 3)",
+        )
+
+    def handle(self, *args, **options):
+        hashed = 0
+        for model in watermarked_image_models():
+            for image in model.objects.filter(perceptual_hash='').exclude(image='').iterator():
+                # Хэш считается по оригиналу; у старых фото его нет — берём файл со знаком
+                source = image.original if image.original else image.image
+                try:
+                    with source.open('rb'):
+                        image.set_perceptual_hash(phash.dhash(source))
+                except (OSError, ValueError) as e:
+                    self.stderr.write(f"{model._meta.label} #{image.pk}: {e}")
+                    continue
+                image.save(update_fields=['perceptual_hash', *phash.BAND_FIELDS])
+                hashed += 1
+        self.stdout.write(f"Посчитано хэшей: {hashed}")
+
+        seen = set()
+        groups = 0
+        for model in watermarked_image_models():
+            for image in model.objects.exclude(perceptual_hash='').iterator():
+                key = (model._meta.label, image.pk)
+                if key in seen:
+                    continue
+                similar = find_similar_images(phash.from_hex(image.perceptual_hash), options['distance'])
+                members = [
+                    (distance, other) for distance, other in similar
+                    if (other._meta.label, other.pk) not in seen
+                ]
+                seen.update((other._meta.label, other.pk) for _, other in members)
+                if len(members) < 2:
+                    continue
+
+                groups += 1
+                self.stdout.write(f"Группа {groups}:")
+                for distance, other in members:
+                    self.stdout.write(f"  {other._meta.label} #{other.pk}: {other.image.name} (различие {distance})")
+
+        self.stdout.write(f"Групп похожих фото: {groups}")
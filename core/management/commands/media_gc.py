@@ -0,0 +1,113 @@
+import os
+import time
+from collections import defaultdict
+
+from django.apps import apps
+from django.core.management.base import BaseCommand
+from django.db import models
+
+from core.models import rendition_files, watermarked_image_models
+from watermark import WatermarkProcessor
+
+
+def referenced_files():
+    """
+    {каталог хранилища: множество имён файлов} по всем FileField/ImageField
+    всех моделей, включая уменьшенные копии фото и файл водяного знака.
+    """
+    referenced = defaultdict(set)
+
+    for model in apps.get_models():
+        for field in model._meta.get_fields():
+            if not isinstance(field, models.FileField):
+                continue
+            names = model.objects.exclude(**{field.attname: ''}).exclude(
+                **{f'{field.attname}__isnull': True}
+            ).values_list(field.attname, flat=True)
+            referenced[field.storage.location].update(names)
+
+    for model in watermarked_image_models():
+        location = model._meta.get_field('image').storage.location
+        for renditions in model.objects.exclude(renditions={}).values_list('renditions', flat=True):
+            for rendition in renditions.values():
+                referenced[location].update(rendition_files(rendition))
+
+    watermark_path = os.path.abspath(WatermarkProcessor.watermark_path())
+    for location in referenced:
+        if watermark_path.startswith(os.path.abspath(location) + os.sep):
+            referenced[location].add(os.path.relpath(watermark_path, location).replace(os.sep, '/'))
+
+    return referenced
+
+
+def walk_files(root):
+    """Обходит каталог через os.scandir: (имя относительно root, DirEntry)"""
+    stack = ['']
+    while stack:
+        relative = stack.pop()
+        try:
+            entries = os.scandir(os.path.join(root, relative))
+        except FileNotFoundError:
+            continue
+        with entries:
+            for entry in entries:
+                name = f"{relative}/{entry.name}" if relative else entry.name
+                if entry.is_dir(follow_symlinks=False):
+                    stack.append(name)
+                elif entry.is_file(follow_symlinks=False):
+                    yield name, entry
+
+
+def format_size(size):
+    for unit in ('Б', 'КБ', 'МБ'):
+        if size < 1024:
+            return f"{size:.0f} {unit}" if unit == 'Б' else f"{size:.1f} {unit}"
+        size /= 1024
+    return f"{size:.1f} ГБ"
+
+
+class Command(BaseCommand):
+    help = (
+        "Удаляет из MEDIA_ROOT и хранилища оригиналов файлы, на которые не "
+        "ссылается ни одна запись (копии от повторных сохранений, старые версии фото)"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true', help="Только показать, ничего не удалять")
+        parser.add_argument(
+            '--min-age', type=int, default=3600,
+            help="Не трогать файлы моложе стольких секунд — их может ещё записывать "
+                 "загрузка или воркер (по умолчанию час)",
+        )
+
+    def handle(self, *args, **options):
+        dry_run = options['dry_run']
+        cutoff = time.time() - options['min_age']
+
+        total_kept = total_orphans = total_young = 0
+        kept_bytes = orphan_bytes = 0
+
+        for location, names in referenced_files().items():
+            for name, entry in walk_files(location):
+                size = entry.stat().st_size
+                if name in names:
+                    total_kept += 1
+                    kept_bytes += size
+                    continue
+                if entry.stat().st_mtime > cutoff:
+                    total_young += 1
+                    continue
+
+                total_orphans += 1
+                orphan_bytes += size
+                if options['verbosity'] > 0:
+                    self.stdout.write(f"{entry.path} ({format_size(size)})")
+                if not dry_run:
+                    os.remove(entry.path)
+
+        action = "к удалению" if dry_run else "удалено"
+        self.stdout.write(
+            f"Используется файлов: {total_kept} ({format_size(kept_bytes)}), "
+            f"{action}: {total_orphans} ({format_size(orphan_bytes)}, {orphan_bytes} байт), "
+            f"пропущено новых: {total_young}"
+        )
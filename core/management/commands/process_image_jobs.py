@@ -0,0 +1,39 @@
+import time
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+
+from core.models import ImageJob
+
+
+class Command(BaseCommand):
+    help = "Воркер очереди обработки фотографий (водяной знак)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true', help="Обработать очередь и выйти")
+        parser.add_argument('--sleep', type=float, default=2.0, help="Пауза между опросами пустой очереди, сек")
+        parser.add_argument(
+            '--stale-after', type=int, default=600,
+            help="Через сколько секунд задача в статусе 'running' считается зависшей",
+        )
+
+    def handle(self, *args, **options):
+        stale_after = timedelta(seconds=options['stale_after'])
+
+        while True:
+            requeued = ImageJob.requeue_stale(stale_after)
+            if requeued:
+                self.stdout.write(f"Возвращено в очередь зависших задач: {requeued}")
+
+            job = ImageJob.claim()
+            if job is None:
+                if options['once']:
+                    return
+                time.sleep(options['sleep'])
+                continue
+
+            job.run()
+            if job.status == 'done':
+                self.stdout.write(f"Готово: {job}")
+            else:
+                self.stderr.write(f"Ошибка ({job.attempts}): {job} — {job.last_error}")
@@ -0,0 +1,50 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from core import occupancy
+from core.availability import engines
+
+
+class Command(BaseCommand):
+    help = (
+        "Пересоздаёт таблицу занятых дней по броням всех разделов. "
+        "С --check только сверяет таблицу с бронями"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--check', action='store_true',
+            help="Только проверить: при расхождениях команда завершается с ошибкой",
+        )
+        parser.add_argument(
+            '--section', action='append', default=[],
+            help="Раздел ('car', 'motorcycle', 'house', 'excursion'); можно указать несколько раз",
+        )
+
+    def handle(self, *args, **options):
+        selected = [engine for engine in engines() if not options['section'] or engine.resource_field in options['section']]
+        unknown = set(options['section']) - {engine.resource_field for engine in selected}
+        if unknown:
+            raise CommandError(f"Неизвестный раздел: {', '.join(sorted(unknown))}")
+
+        if not options['check']:
+            for engine in selected:
+                count = occupancy.rebuild(engine)
+                self.stdout.write(f"{engine.resource_field}: занятых дней {count}")
+            return
+
+        broken = 0
+        for engine in selected:
+            missing, extra, changed = occupancy.check(engine)
+            if missing or extra or changed:
+                broken += 1
+                self.stdout.write(
+                    f"{engine.resource_field}: нет строк {len(missing)}, лишних {len(extra)}, "
+                    f"с другим статусом {len(changed)}"
+                )
+                for resource_id, day, booking_id in sorted(missing | extra | changed)[:10]:
+                    self.stdout.write(f"  объект {resource_id}, {day}, бронь {booking_id}")
+            else:
+                self.stdout.write(f"{engine.resource_field}: расхождений нет")
+
+        if broken:
+            raise CommandError(f"Таблица занятости расходится с бронями в разделах: {broken}")
@@ -0,0 +1,109 @@
+import io
+import os
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+from django.core.files.base import ContentFile
+from django.core.management.base import BaseCommand
+
+from core.models import render_watermarked, watermarked_image_models
+from watermark import WatermarkProcessor
+
+
+class Command(BaseCommand):
+    help = (
+        "Перерисовывает водяной знак на всех фото из сохранённых оригиналов. "
+        "Фото, уже обработанные текущим watermark.png, пропускаются, "
+        "поэтому прерванный запуск можно просто повторить."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--workers', type=int, default=os.cpu_count() or 1,
+            help="Число процессов (по умолчанию — число ядер)",
+        )
+        parser.add_argument('--force', action='store_true', help="Перерисовать даже актуальные фото")
+
+    def handle(self, *args, **options):
+        workers = max(1, options['workers'])
+
+        targets = []
+        without_original = 0
+        for model in watermarked_image_models():
+            version = WatermarkProcessor.fingerprint(mode=model.watermark_mode)
+            queryset = model.objects.exclude(image='')
+            without_original += queryset.filter(original='').count()
+            queryset = queryset.exclude(original='')
+            if not options['force']:
+                queryset = queryset.exclude(watermark_version=version)
+            targets.extend(
+                (model, pk, original, version) for pk, original in queryset.values_list('pk', 'original')
+            )
+
+        total = len(targets)
+        self.stdout.write(f"К перерисовке: {total}, процессов: {workers}")
+        if without_original:
+            self.stdout.write(f"Пропущено без оригинала (загружены до его сохранения): {without_original}")
+        if not total:
+            return
+
+        done = failed = 0
+        started = time.monotonic()
+        queue = iter(targets)
+
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            running = {}
+
+            def submit_next():
+                target = next(queue, None)
+                if target is not None:
+                    model, pk, original, _ = target
+                    storage = model._meta.get_field('original').storage
+                    # Читаем через API хранилища: дочернему процессу передаём байты
+                    with storage.open(original, 'rb') as f:
+                        source = io.BytesIO(f.read())
+                    running[executor.submit(render_watermarked, source, model.watermark_mode)] = target
+
+            # Держим в работе ограниченное окно задач, а не всю очередь сразу
+            for _ in range(workers * 2):
+                submit_next()
+
+            try:
+                while running:
+                    finished, _ = wait(running, return_when=FIRST_COMPLETED)
+                    for future in finished:
+                        model, pk, original, version = running.pop(future)
+                        submit_next()
+
+                        try:
+                            content, renditions, placeholder = future.result()
+                            stored = self._store(model, pk, original, content, renditions, placeholder, version)
+                        except Exception as e:
+                            failed += 1
+                            self.stderr.write(f"{model._meta.label} #{pk}: {e}")
+                            continue
+
+                        done += 1
+                        rate = done / (time.monotonic() - started)
+                        status = "готово" if stored else "пропущено, файл заменён"
+                        self.stdout.write(
+                            f"[{done + failed}/{total}] {model._meta.label} #{pk} {status} — {rate:.1f} фото/с"
+                        )
+            except KeyboardInterrupt:
+                executor.shutdown(wait=False, cancel_futures=True)
+                self.stderr.write("Прервано: повторный запуск продолжит с необработанных фото")
+                raise
+
+        elapsed = time.monotonic() - started
+        self.stdout.write(
+            f"Перерисовано: {done}, ошибок: {failed}, за {elapsed:.1f} с "
+            f"({done / elapsed if elapsed else 0:.1f} фото/с)"
+        )
+
+    def _store(self, model, pk, original, content, renditions, placeholder, version):
+        image = model.objects.filter(pk=pk, original=original).first()
+        if image is None:
+            return False
+        return image.store_watermarked(
+            ContentFile(content), image.image.name, version, renditions, placeholder
+        )
@@ -0,0 +1,25 @@
+# Generated by Django 5.1.2 on 2026-10-17 06:46
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0002_upload_session'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AvailabilityGeneration',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('key', models.CharField(max_length=100, unique=True, verbose_name='Модель брони')),
+                ('value', models.PositiveBigIntegerField(default=0, verbose_name='Поколение')),
+            ],
+            options={
+                'verbose_name': 'Поколение занятости',
+                'verbose_name_plural': 'Поколения занятости',
+            },
+        ),
+    ]
@@ -0,0 +1,60 @@
+# Generated by Django 5.1.2 on 2026-10-17 06:54
+
+from datetime import timedelta
+
+from django.db import migrations, models
+
+BOOKINGS = [
+    ('cars', 'Booking', 'car'),
+    ('motorcycles', 'MotoBooking', 'motorcycle'),
+    ('houses', 'HouseBooking', 'house'),
+    ('excursions', 'ExcursionBooking', 'excursion'),
+]
+
+
+def fill_occupancy(apps, schema_editor):
+    # Занятые дни существующих броней; дальше их ведут сигналы (core.occupancy)
+    Occupancy = apps.get_model('core', 'Occupancy')
+    for app_label, model_name, resource_type in BOOKINGS:
+        booking_model = apps.get_model(app_label, model_name)
+        rows = []
+        bookings = booking_model.objects.filter(status__in=['confirmed', 'active', 'pending'])
+        for booking in bookings.iterator():
+            for offset in range((booking.end_date - booking.start_date).days + 1):
+                rows.append(Occupancy(
+                    resource_type=resource_type, resource_id=getattr(booking, f'{resource_type}_id'),
+                    date=booking.start_date + timedelta(days=offset), booking_id=booking.pk, status=booking.status,
+                ))
+        Occupancy.objects.bulk_create(rows, batch_size=5000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0003_availability_generation'),
+        ('cars', '0010_booking_indexes'),
+        ('motorcycles', '0010_booking_indexes'),
+        ('houses', '0012_booking_indexes'),
+        ('excursions', '0012_booking_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Occupancy',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('resource_type', models.CharField(max_length=20, verbose_name='Раздел')),
+                ('resource_id', models.PositiveBigIntegerField(verbose_name='Объект')),
+                ('date', models.DateField(verbose_name='Дата')),
+                ('booking_id', models.PositiveBigIntegerField(verbose_name='Бронь')),
+                ('status', models.CharField(max_length=20, verbose_name='Статус брони')),
+            ],
+            options={
+                'verbose_name': 'Занятый день',
+                'verbose_name_plural': 'Занятые дни',
+                'indexes': [models.Index(fields=['resource_type', 'resource_id', 'date'], name='core_occupancy_lookup_idx'), models.Index(fields=['resource_type', 'date', 'resource_id'], name='core_occupancy_date_idx')],
+                'constraints': [models.UniqueConstraint(fields=('resource_type', 'booking_id', 'date'), name='core_occupancy_day_unique')],
+            },
+        ),
+        migrations.RunPython(fill_occupancy, migrations.RunPython.noop),
+    ]
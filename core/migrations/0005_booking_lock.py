@@ -0,0 +1,27 @@
+# Generated by Django 5.1.2 on 2026-10-17 07:02
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0004_occupancy'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BookingLock',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('resource_type', models.CharField(max_length=20, verbose_name='Раздел')),
+                ('resource_id', models.PositiveBigIntegerField(verbose_name='Объект')),
+                ('version', models.PositiveBigIntegerField(default=0, verbose_name='Бронирований')),
+            ],
+            options={
+                'verbose_name': 'Замок бронирования',
+                'verbose_name_plural': 'Замки бронирования',
+                'constraints': [models.UniqueConstraint(fields=('resource_type', 'resource_id'), name='core_booking_lock_unique')],
+            },
+        ),
+    ]
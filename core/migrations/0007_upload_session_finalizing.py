@@ -0,0 +1,18 @@
+# Generated by Django 5.1.2 on 2026-10-17 07:45
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0006_idempotency_key'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='uploadsession',
+            name='status',
+            field=models.CharField(choices=[('uploading', 'Загружается'), ('finalizing', 'Проверяется'), ('complete', 'Завершена'), ('failed', 'Ошибка')], default='uploading', max_length=20, verbose_name='Статус'),
+        ),
+    ]
@@ -0,0 +1,840 @@
+import hashlib
+import os
+import uuid
+from datetime import timedelta
+
+from django.apps import apps
+from django.conf import settings
+from django.contrib.contenttypes.fields import GenericForeignKey
+from django.contrib.contenttypes.models import ContentType
+from django.core.exceptions import ValidationError
+from django.core.files.base import ContentFile, File
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import IntegrityError, models, transaction
+from django.db.models import F, Q
+from django.urls import reverse
+from django.utils import timezone
+from PIL import Image
+
+from watermark import EncodingProfile, WatermarkProcessor, encoding_profile
+from . import phash
+from .storage import originals_storage
+
+
+def content_hash(file):
+    """SHA-256 содержимого файла Django (загруженного или из хранилища)"""
+    digest = hashlib.sha256()
+    for chunk in file.chunks():
+        digest.update(chunk)
+    file.seek(0)
+    return digest.hexdigest()
+
+
+def original_upload_to(instance, filename):
+    return f"{instance._meta.app_label}/{filename}"
+
+
+def rendition_widths():
+    return getattr(settings, 'IMAGE_RENDITIONS', {'thumbnail': 320, 'card': 768, 'full': 1600})
+
+
+def render_watermarked(source, mode='center'):
+    """
+    Фото с водяным знаком (закодированное), его уменьшенные копии и превью-заглушка.
+    Только Pillow, без обращений к базе — можно вызывать в дочернем процессе.
+    :param source: открытый файл (из любого хранилища) или путь
+    :param mode: режим водяного знака ('center', 'tile' или 'auto')
+    """
+    watermarked, _ = WatermarkProcessor.render(source, mode=mode)
+    content = encoding_profile('photo').encode(watermarked)
+    renditions = WatermarkProcessor.make_renditions(watermarked, rendition_widths())
+    return content, renditions, WatermarkProcessor.make_placeholder(watermarked)
+
+
+def render_rendition(source, width, profile, mode='center'):
+    """Копия с водяным знаком шириной width для выдачи по запросу (см. views.rendition)"""
+    watermarked, _ = WatermarkProcessor.render(source, mode=mode)
+    return WatermarkProcessor.make_rendition(watermarked, width, profile)
+
+
+def rendition_files(rendition):
+    """Пути файлов одной копии во всех форматах"""
+    return [path for key, path in rendition.items() if key not in ('width', 'height')]
+
+
+def watermarked_image_models():
+    """Все модели фотографий с водяным знаком (машины, мотоциклы, дома, экскурсии)"""
+    return [model for model in apps.get_models() if issubclass(model, WatermarkedImage)]
+
+
+def find_similar_images(value, max_distance=3):
+    """
+    Фото всех разделов с перцептивным хэшем не дальше max_distance бит от value.
+    Кандидаты выбираются по индексу полос, поэтому max_distance больше 3
+    может пропустить часть похожих фото.
+    :return: [(расстояние, фото), ...] по возрастанию расстояния
+    """
+    condition = Q()
+    for field, band in zip(phash.BAND_FIELDS, phash.bands(value)):
+        condition |= Q(**{field: band})
+
+    found = []
+    for model in watermarked_image_models():
+        for image in model.objects.filter(condition).exclude(perceptual_hash=''):
+            distance = phash.hamming(value, phash.from_hex(image.perceptual_hash))
+            if distance <= max_distance:
+                found.append((distance, image))
+    found.sort(key=lambda item: item[0])
+    return found
+
+
+def find_image_by_source_hash(source_hash):
+    """
+    Фото с сохранённым оригиналом по хэшу исходника. Оригиналы фото с одним
+    хэшем побайтно одинаковы, поэтому подходит любое; модели перебираются
+    в постоянном порядке.
+    """
+    for model in watermarked_image_models():
+        image = model.objects.filter(source_hash=source_hash).exclude(original='').first()
+        if image is not None:
+            return image
+    return None
+
+
+def image_in_use(name):
+    """Ссылается ли на файл хоть одно фото (файлы дубликатов общие)"""
+    return any(model.objects.filter(image=name).exists() for model in watermarked_image_models())
+
+
+class WatermarkedImage(models.Model):
+    """Общая часть моделей фотографий: водяной знак накладывается в фоне"""
+    PROCESSING_STATUS_CHOICES = [
+        ('processing', 'Обрабатывается'),
+        ('ready', 'Готово'),
+        ('failed', 'Ошибка'),
+    ]
+
+    processing_status = models.CharField(
+        max_length=20, choices=PROCESSING_STATUS_CHOICES, default='ready', verbose_name="Обработка"
+    )
+    source_hash = models.CharField(max_length=64, blank=True, db_index=True, verbose_name="Хэш исходника")
+    processed_hash = models.CharField(max_length=64, blank=True, verbose_name="Хэш результата")
+    # Исходник без водяного знака: из него фото перерисовывается при смене watermark.png
+    original = models.FileField(
+        upload_to=original_upload_to, storage=originals_storage,
+        blank=True, editable=False, verbose_name="Оригинал"
+    )
+    watermark_version = models.CharField(max_length=16, blank=True, verbose_name="Версия водяного знака")
+    # {'card': {'width': 768, 'height': 512, 'webp': 'cars/images/renditions/...', 'jpeg': ...}, ...}
+    renditions = models.JSONField(default=dict, blank=True, editable=False, verbose_name="Уменьшенные копии")
+    # data:image/jpeg;base64,... шириной 20px — показывается до загрузки фото
+    placeholder = models.TextField(blank=True, editable=False, verbose_name="Превью-заглушка")
+    # dHash исходника (16 hex) и его полосы по 16 бит для поиска похожих фото
+    perceptual_hash = models.CharField(max_length=16, blank=True, editable=False, verbose_name="Перцептивный хэш")
+    phash_band0 = models.PositiveIntegerField(null=True, blank=True, db_index=True, editable=False)
+    phash_band1 = models.PositiveIntegerField(null=True, blank=True, db_index=True, editable=False)
+    phash_band2 = models.PositiveIntegerField(null=True, blank=True, db_index=True, editable=False)
+    phash_band3 = models.PositiveIntegerField(null=True, blank=True, db_index=True, editable=False)
+    # Перцептивный хэш близок к хэшу другого фото — подсказка для проверки в админке
+    possible_duplicate = models.BooleanField(default=False, editable=False, verbose_name="Похоже на другое фото")
+
+    # Режим водяного знака для фото этого раздела: 'center', 'tile' или 'auto'
+    # (узор только панорамам и очень большим фото, см. WatermarkProcessor.choose_mode)
+    watermark_mode = 'center'
+
+    class Meta:
+        abstract = True
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Запоминаем имя файла из базы, чтобы отличать новую загрузку от
+        # сохранения, в котором поменяли только порядок или подпись
+        instance._loaded_image_name = instance.__dict__.get('image')
+        return instance
+
+    def refresh_from_db(self, using=None, fields=None, from_queryset=None):
+        super().refresh_from_db(using=using, fields=fields, from_queryset=from_queryset)
+        if fields is None or 'image' in fields:
+            # Воркер мог сменить файл: иначе сохранение после refresh выглядело бы новой загрузкой
+            self._loaded_image_name = self.image.name
+
+    def save(self, *args, **kwargs):
+        upload = self.image if self.image and not self.image._committed else None
+        needs_processing = self._source_changed()
+        if needs_processing:
+            self.processing_status = 'processing'
+
+        super().save(*args, **kwargs)
+        self._loaded_image_name = self.image.name
+
+        if needs_processing:
+            if getattr(settings, 'IMAGE_PROCESSING_ASYNC', True):
+                ImageJob.enqueue(self)
+            else:
+                try:
+                    # Загрузка ещё в памяти — не перечитываем её из хранилища
+                    self.process(source=upload)
+                except Exception as e:
+                    print(f"Error processing watermark for {self._meta.verbose_name}: {e}")
+                    self.mark_failed()
+
+    def clean(self):
+        super().clean()
+        if not self.image and not self.original:
+            raise ValidationError({'image': "Загрузите фотографию"})
+
+    def _source_changed(self):
+        """Нужно ли накладывать водяной знак при этом сохранении"""
+        if not self.image:
+            return False
+
+        if self.image._committed:
+            loaded_name = getattr(self, '_loaded_image_name', None)
+            if loaded_name is None and self.pk:
+                loaded_name = self._stored_image_name()
+            return self.image.name != loaded_name
+
+        # Файл мог смениться воркером после загрузки экземпляра — при новой
+        # загрузке сверяемся с базой, это редкая операция
+        loaded_name = self._stored_image_name() if self.pk else None
+
+        source_hash = content_hash(self.image)
+        if loaded_name and source_hash == self.source_hash and self.processed_hash:
+            # Повторно загрузили тот же файл — оставляем уже обработанный
+            self.image = loaded_name
+            return False
+
+        value = phash.dhash(self.image)
+        self.image.seek(0)
+        self.set_perceptual_hash(value)
+        self.possible_duplicate = self.has_similar(value)
+        donor = self.find_duplicate(source_hash)
+        if donor is not None:
+            # Тот же файл уже обработан (в этом или другом разделе) — берём
+            # его файлы со знаком вместо повторной обработки, оригинал свой
+            self._reuse_processed(donor, self.image)
+            return False
+
+        # Новая загрузка сразу уходит в приватное хранилище как оригинал.
+        # В публичном поле остаётся прежнее фото (у нового — пусто), пока
+        # воркер не запишет результат, поэтому фото без водяного знака
+        # никогда не попадает в MEDIA_ROOT.
+        self.source_hash = source_hash
+        # Хэш результата относится к прежнему исходнику
+        self.processed_hash = ''
+        self.original.save(os.path.basename(self.image.name), self.image, save=False)
+        self.image = loaded_name or ''
+        return True
+
+    def set_perceptual_hash(self, value):
+        self.perceptual_hash = phash.to_hex(value)
+        for field, band in zip(phash.BAND_FIELDS, phash.bands(value)):
+            setattr(self, field, band)
+
+    def has_similar(self, value):
+        """Есть ли другое фото с перцептивным хэшем не дальше IMAGE_DUPLICATE_DISTANCE"""
+        max_distance = getattr(settings, 'IMAGE_DUPLICATE_DISTANCE', 2)
+        return any(
+            not (type(image) is type(self) and image.pk == self.pk)
+            for _, image in find_similar_images(value, max_distance)
+        )
+
+    def find_duplicate(self, source_hash):
+        """
+        Готовое фото из точно такого же файла (совпадает SHA-256 исходника).
+        Похожесть по перцептивному хэшу не годится: однотонные и малоконтрастные
+        фото дают один и тот же dHash, и загрузка подменилась бы чужим фото.
+        """
+        version = WatermarkProcessor.fingerprint(mode=self.watermark_mode)
+        for model in watermarked_image_models():
+            image = model.objects.filter(
+                source_hash=source_hash, processing_status='ready', watermark_version=version,
+            ).exclude(image='').exclude(processed_hash='').first()
+            if image is not None:
+                return image
+        return None
+
+    def _reuse_processed(self, donor, upload):
+        """Файлы со знаком и копии — общие с donor, оригинал — из своей загрузки"""
+        upload.seek(0)
+        self.original.save(os.path.basename(upload.name), upload, save=False)
+        self.image = donor.image.name
+        self.source_hash = donor.source_hash
+        self.processed_hash = donor.processed_hash
+        self.watermark_version = donor.watermark_version
+        self.renditions = donor.renditions
+        self.placeholder = donor.placeholder
+        self.processing_status = 'ready'
+
+    @classmethod
+    def parent_field(cls):
+        """Внешний ключ на объект, к которому относится фото (car, house, ...)"""
+        return next(field for field in cls._meta.fields if field.many_to_one)
+
+    def _stored_image_name(self):
+        return type(self).objects.filter(pk=self.pk).values_list('image', flat=True).first()
+
+    def process(self, source=None):
+        """
+        Накладывает водяной знак на оригинал. Вызывается воркером.
+        :param source: уже открытый файл оригинала (например, загрузка в памяти)
+        """
+        version = WatermarkProcessor.fingerprint(mode=self.watermark_mode)
+
+        if self.original:
+            if self.processed_hash and self.watermark_version == version:
+                # Уже обработано текущим водяным знаком (задача попала в очередь дважды)
+                self._mark_ready()
+                return
+        else:
+            # Имя файла записали в поле напрямую (или фото старше оригиналов):
+            # сам файл и есть исходник
+            with self.image.open('rb'):
+                current_hash = content_hash(self.image)
+                if current_hash == self.processed_hash:
+                    # Файл уже с водяным знаком, а исходника нет
+                    self._mark_ready()
+                    return
+                self.original.save(os.path.basename(self.image.name), self.image, save=False)
+                self.image.seek(0)
+                self.set_perceptual_hash(phash.dhash(self.image))
+            self.source_hash = current_hash
+
+        if source is not None:
+            source.seek(0)
+            content, renditions, placeholder = render_watermarked(source, self.watermark_mode)
+        else:
+            with self.original.open('rb') as original:
+                content, renditions, placeholder = render_watermarked(original, self.watermark_mode)
+        self.store_watermarked(ContentFile(content), self.image.name, version, renditions, placeholder)
+
+    def store_watermarked(self, content, previous_name, version, renditions=None, placeholder=''):
+        """
+        Записывает фото с водяным знаком (одна запись через API хранилища)
+        вместо previous_name. Возвращает False, если пока шла обработка
+        загрузили другой файл.
+        """
+        processed_hash = content_hash(content)
+        old_renditions = self.renditions
+        # Основной файл кодируется профилем 'photo' — расширение берём из него
+        stem = os.path.splitext(os.path.basename(self.original.name))[0]
+        self.image.save(f"{stem}.{encoding_profile('photo').extension}", content, save=False)
+        stored_renditions = self._save_renditions(renditions or {})
+
+        # update() вместо save(): не ставим задачу повторно и не затираем
+        # поля, которые могли измениться в админке, пока шла обработка.
+        # Условие по оригиналу и прежнему файлу отбрасывает результат,
+        # если за это время загрузили другой исходник (пустой оригинал в
+        # базе — первая обработка фото, сохранённого без него).
+        updated = type(self).objects.filter(
+            Q(original=self.original.name) | Q(original=''),
+            pk=self.pk, image=previous_name or '',
+        ).update(
+            image=self.image.name,
+            original=self.original.name,
+            source_hash=self.source_hash,
+            processed_hash=processed_hash,
+            watermark_version=version,
+            renditions=stored_renditions,
+            placeholder=placeholder,
+            perceptual_hash=self.perceptual_hash,
+            **{field: getattr(self, field) for field in phash.BAND_FIELDS},
+            processing_status='ready',
+        )
+        if not updated:
+            self._delete_renditions(stored_renditions)
+            self.image.delete(save=False)
+            return False
+
+        # Прежняя версия фото больше не нужна, если её не делят дубликаты
+        if previous_name and previous_name != self.image.name and not image_in_use(previous_name):
+            self.image.storage.delete(previous_name)
+            self._delete_renditions(old_renditions)
+
+        self.renditions = stored_renditions
+        self.placeholder = placeholder
+        self.processed_hash = processed_hash
+        self.watermark_version = version
+        self.processing_status = 'ready'
+        self._loaded_image_name = self.image.name
+        return True
+
+    def rebuild_renditions(self):
+        """Пересобирает уменьшенные копии и превью из текущего файла (водяной знак уже на нём)"""
+        with self.image.open('rb'):
+            with Image.open(self.image) as source:
+                renditions = WatermarkProcessor.make_renditions(source, rendition_widths())
+                placeholder = WatermarkProcessor.make_placeholder(source)
+
+        old_renditions = self.renditions
+        stored_renditions = self._save_renditions(renditions)
+        updated = type(self).objects.filter(pk=self.pk, image=self.image.name).update(
+            renditions=stored_renditions, placeholder=placeholder
+        )
+        if not updated:
+            self._delete_renditions(stored_renditions)
+            return False
+
+        if not self._image_shared():
+            self._delete_renditions(old_renditions)
+        self.renditions = stored_renditions
+        self.placeholder = placeholder
+        return True
+
+    def _save_renditions(self, renditions):
+        storage = self.image.storage
+        directory = os.path.dirname(self.image.name)
+        stem = os.path.splitext(os.path.basename(self.image.name))[0]
+
+        stored = {}
+        for name, rendition in renditions.items():
+            entry = {'width': rendition['width'], 'height': rendition['height']}
+            for image_format in sorted(rendition.keys() - {'width', 'height'}):
+                extension = EncodingProfile.EXTENSIONS[image_format]
+                entry[image_format] = storage.save(
+                    f"{directory}/renditions/{stem}_{rendition['width']}.{extension}",
+                    ContentFile(rendition[image_format]),
+                )
+            stored[name] = entry
+        return stored
+
+    def _image_shared(self):
+        """Делит ли это фото файлы с дубликатами"""
+        return sum(
+            model.objects.filter(image=self.image.name).count() for model in watermarked_image_models()
+        ) > 1
+
+    def _delete_renditions(self, renditions):
+        for rendition in (renditions or {}).values():
+            for path in rendition_files(rendition):
+                self.image.storage.delete(path)
+
+    def rendition_url(self, name, image_format='jpeg'):
+        """URL уменьшенной копии; если её нет (фото меньше нужной ширины) — полного фото"""
+        rendition = (self.renditions or {}).get(name)
+        if rendition and rendition.get(image_format):
+            return self.image.storage.url(rendition[image_format])
+        return self.image.url if self.image else None
+
+    def on_demand_url(self, size, extension='webp'):
+        """URL копии, создаваемой по запросу из оригинала (core.views.rendition)"""
+        if not self.source_hash or not self.original:
+            return None
+        return reverse('rendition', kwargs={'size': size, 'source_hash': self.source_hash, 'extension': extension})
+
+    def srcset(self, image_format='jpeg'):
+        """[(url, ширина), ...] по возрастанию ширины"""
+        renditions = sorted(
+            (rendition for rendition in (self.renditions or {}).values() if rendition.get(image_format)),
+            key=lambda rendition: rendition['width'],
+        )
+        return [(self.image.storage.url(rendition[image_format]), rendition['width']) for rendition in renditions]
+
+    def _mark_ready(self):
+        self.processing_status = 'ready'
+        type(self).objects.filter(pk=self.pk).update(processing_status='ready')
+
+    def mark_failed(self):
+        self.processing_status = 'failed'
+        type(self).objects.filter(pk=self.pk).update(processing_status='failed')
+
+
+class ImageJob(models.Model):
+    """Задача фоновой обработки фотографии (очередь в базе данных)"""
+    STATUS_CHOICES = [
+        ('queued', 'В очереди'),
+        ('running', 'Выполняется'),
+        ('done', 'Выполнена'),
+        ('failed', 'Ошибка'),
+    ]
+
+    content_type = models.ForeignKey(ContentType, on_delete=models.CASCADE)
+    object_id = models.PositiveBigIntegerField()
+    image = GenericForeignKey('content_type', 'object_id')
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='queued', verbose_name="Статус")
+    attempts = models.IntegerField(default=0, verbose_name="Попыток")
+    run_after = models.DateTimeField(default=timezone.now, verbose_name="Не раньше")
+    last_error = models.TextField(blank=True, verbose_name="Последняя ошибка")
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        verbose_name = "Задача обработки фото"
+        verbose_name_plural = "Задачи обработки фото"
+        indexes = [
+            models.Index(fields=['status', 'run_after'], name='core_imagejob_due_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.content_type.model} #{self.object_id} ({self.status})"
+
+    @classmethod
+    def enqueue(cls, image):
+        """Ставит фото в очередь, если для него ещё нет ожидающей задачи"""
+        content_type = ContentType.objects.get_for_model(image)
+        job = cls.objects.filter(
+            content_type=content_type, object_id=image.pk, status='queued'
+        ).first()
+        if job is None:
+            job = cls.objects.create(content_type=content_type, object_id=image.pk)
+        return job
+
+    @classmethod
+    def claim(cls):
+        """
+        Забирает следующую готовую к выполнению задачу.
+        Захват — условный UPDATE, поэтому несколько воркеров не возьмут одну задачу.
+        """
+        while True:
+            job = cls.objects.filter(
+                status='queued', run_after__lte=timezone.now()
+            ).order_by('run_after', 'id').first()
+            if job is None:
+                return None
+
+            claimed = cls.objects.filter(pk=job.pk, status='queued').update(
+                status='running', attempts=F('attempts') + 1, updated_at=timezone.now()
+            )
+            if claimed:
+                job.refresh_from_db()
+                return job
+
+    @classmethod
+    def requeue_stale(cls, older_than):
+        """Возвращает в очередь задачи, зависшие после падения воркера"""
+        return cls.objects.filter(
+            status='running', updated_at__lt=timezone.now() - older_than
+        ).update(status='queued', updated_at=timezone.now())
+
+    def run(self):
+        image = self.image
+        if image is None:
+            # Фото удалили, пока задача ждала в очереди
+            self.status = 'done'
+            self.save(update_fields=['status', 'updated_at'])
+            return
+
+        try:
+            with transaction.atomic():
+                image.process()
+        except Exception as e:
+            self.last_error = str(e)
+            max_attempts = getattr(settings, 'IMAGE_JOB_MAX_ATTEMPTS', 3)
+            if self.attempts >= max_attempts:
+                self.status = 'failed'
+                image.mark_failed()
+            else:
+                # Экспоненциальная задержка перед повтором
+                delay = getattr(settings, 'IMAGE_JOB_RETRY_DELAY', 30) * 2 ** (self.attempts - 1)
+                self.status = 'queued'
+                self.run_after = timezone.now() + timedelta(seconds=delay)
+            self.save(update_fields=['status', 'run_after', 'last_error', 'updated_at'])
+            return
+
+        self.status = 'done'
+        self.last_error = ''
+        self.save(update_fields=['status', 'last_error', 'updated_at'])
+
+
+class UploadSession(models.Model):
+    """
+    Загрузка большого фото частями: части дописываются во временный файл
+    по смещению, поэтому оборванный запрос можно просто повторить.
+    Фото создаётся только после проверки размера и SHA-256 всего файла.
+    """
+    STATUS_CHOICES = [
+        ('uploading', 'Загружается'),
+        ('finalizing', 'Проверяется'),
+        ('complete', 'Завершена'),
+        ('failed', 'Ошибка'),
+    ]
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    # Модель фото (CarImage, HouseImage, ...) и объект, к которому оно относится
+    content_type = models.ForeignKey(ContentType, on_delete=models.CASCADE)
+    parent_id = models.PositiveBigIntegerField()
+    filename = models.CharField(max_length=255, verbose_name="Имя файла")
+    size = models.PositiveBigIntegerField(verbose_name="Размер")
+    checksum = models.CharField(max_length=64, verbose_name="SHA-256")
+    offset = models.PositiveBigIntegerField(default=0, verbose_name="Получено байт")
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='uploading', verbose_name="Статус")
+    image_id = models.PositiveBigIntegerField(null=True, blank=True, verbose_name="Созданное фото")
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        verbose_name = "Загрузка по частям"
+        verbose_name_plural = "Загрузки по частям"
+
+    def __str__(self):
+        return f"{self.filename} ({self.offset}/{self.size})"
+
+    @property
+    def image_model(self):
+        return self.content_type.model_class()
+
+    @property
+    def temp_path(self):
+        return os.path.join(settings.UPLOAD_TEMP_ROOT, f"{self.pk}.part")
+
+    @classmethod
+    def start(cls, image_model, parent, filename, size, checksum):
+        session = cls.objects.create(
+            content_type=ContentType.objects.get_for_model(image_model),
+            parent_id=parent.pk, filename=os.path.basename(filename), size=size, checksum=checksum.lower(),
+        )
+        os.makedirs(settings.UPLOAD_TEMP_ROOT, exist_ok=True)
+        open(session.temp_path, 'wb').close()
+        return session
+
+    @classmethod
+    def purge_expired(cls):
+        """Удаляет брошенные загрузки старше UPLOAD_SESSION_TTL вместе с временными файлами"""
+        ttl = getattr(settings, 'UPLOAD_SESSION_TTL', 24 * 3600)
+        expired = cls.objects.filter(
+            status__in=['uploading', 'finalizing'], updated_at__lt=timezone.now() - timedelta(seconds=ttl)
+        )
+        for session in expired:
+            session.discard()
+        return expired.delete()[0]
+
+    def write_chunk(self, offset, stream, max_size):
+        """
+        Пишет часть, начинающуюся с offset, и сдвигает смещение. Запись идёт
+        по смещению, а не в конец файла, поэтому повтор части безопасен;
+        смещение в базе сдвигается условным UPDATE — из двух одновременных
+        повторов засчитывается один.
+        :return: новое смещение или None, если offset не совпал с полученным
+        """
+        if offset != self.offset:
+            return None
+
+        written = 0
+        with open(self.temp_path, 'r+b') as f:
+            f.seek(offset)
+            while True:
+                block = stream.read(64 * 1024)
+                if not block:
+                    break
+                written += len(block)
+                if written > max_size or offset + written > self.size:
+                    raise ValueError("Часть больше допустимого размера")
+                f.write(block)
+
+        updated = type(self).objects.filter(pk=self.pk, offset=offset, status='uploading').update(
+            offset=offset + written, updated_at=timezone.now()
+        )
+        if not updated:
+            self.refresh_from_db()
+            return None
+        self.offset = offset + written
+        return self.offset
+
+    def verify(self):
+        digest = hashlib.sha256()
+        with open(self.temp_path, 'rb') as f:
+            for block in iter(lambda: f.read(1024 * 1024), b''):
+                digest.update(block)
+        return digest.hexdigest() == self.checksum
+
+    def finalize(self):
+        """
+        Проверяет файл и создаёт из него фото: дальше оно проходит обычный
+        путь save() — оригинал в приватное хранилище, водяной знак в воркере.
+        Сессию сначала занимает условный UPDATE: из двух одновременных
+        повторов фото создаёт только один.
+        :return: созданное фото; None — сессию уже завершает другой запрос
+            (её текущее состояние перечитано в self)
+        """
+        claimed = type(self).objects.filter(pk=self.pk, status='uploading').update(
+            status='finalizing', updated_at=timezone.now()
+        )
+        if not claimed:
+            self.refresh_from_db()
+            return None
+        self.status = 'finalizing'
+
+        if self.offset != self.size or not self.verify():
+            self.status = 'failed'
+            self.save(update_fields=['status', 'updated_at'])
+            self.discard()
+            raise ValueError("Файл загружен не полностью или контрольная сумма не совпала")
+
+        model = self.image_model
+        field = model.parent_field()
+        try:
+            with transaction.atomic():
+                last = model.objects.filter(**{field.attname: self.parent_id}).aggregate(last=models.Max('order'))['last']
+                image = model(**{field.attname: self.parent_id}, order=0 if last is None else last + 1)
+                with open(self.temp_path, 'rb') as f:
+                    image.image = File(f, name=self.filename)
+                    image.save()
+                self.status = 'complete'
+                self.image_id = image.pk
+                self.save(update_fields=['status', 'image_id', 'updated_at'])
+        except BaseException:
+            # Файл на месте — возвращаем сессию, чтобы finalize можно было повторить
+            self.status = 'uploading'
+            type(self).objects.filter(pk=self.pk).update(status='uploading', updated_at=timezone.now())
+            raise
+        self.discard()
+        return image
+
+    def discard(self):
+        try:
+            os.remove(self.temp_path)
+        except FileNotFoundError:
+            pass
+
+
+class AvailabilityGeneration(models.Model):
+    """
+    Счётчик изменений броней раздела (см. core.availability): по нему
+    процесс узнаёт, что его индекс занятости устарел.
+    """
+    key = models.CharField(max_length=100, unique=True, verbose_name="Модель брони")
+    value = models.PositiveBigIntegerField(default=0, verbose_name="Поколение")
+
+    class Meta:
+        verbose_name = "Поколение занятости"
+        verbose_name_plural = "Поколения занятости"
+
+    def __str__(self):
+        return f"{self.key}: {self.value}"
+
+
+class Occupancy(models.Model):
+    """
+    Занятые дни: строка на каждый день каждой брони, занимающей даты
+    (см. core.occupancy). Свободен ли объект — поиск по индексу
+    (раздел, объект, дата) вместо сравнения диапазонов дат броней.
+    """
+    resource_type = models.CharField(max_length=20, verbose_name="Раздел")  # 'car', 'house', ...
+    resource_id = models.PositiveBigIntegerField(verbose_name="Объект")
+    date = models.DateField(verbose_name="Дата")
+    booking_id = models.PositiveBigIntegerField(verbose_name="Бронь")
+    status = models.CharField(max_length=20, verbose_name="Статус брони")
+
+    class Meta:
+        verbose_name = "Занятый день"
+        verbose_name_plural = "Занятые дни"
+        constraints = [
+            models.UniqueConstraint(fields=['resource_type', 'booking_id', 'date'], name='core_occupancy_day_unique'),
+        ]
+        indexes = [
+            models.Index(fields=['resource_type', 'resource_id', 'date'], name='core_occupancy_lookup_idx'),
+            models.Index(fields=['resource_type', 'date', 'resource_id'], name='core_occupancy_date_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.resource_type} #{self.resource_id}: {self.date}"
+
+
+class BookingLock(models.Model):
+    """
+    Строка-замок объекта брони (см. core.booking): бронирование сначала
+    обновляет её, и до конца транзакции другие брони этого объекта ждут.
+    """
+    resource_type = models.CharField(max_length=20, verbose_name="Раздел")
+    resource_id = models.PositiveBigIntegerField(verbose_name="Объект")
+    version = models.PositiveBigIntegerField(default=0, verbose_name="Бронирований")
+
+    class Meta:
+        verbose_name = "Замок бронирования"
+        verbose_name_plural = "Замки бронирования"
+        constraints = [
+            models.UniqueConstraint(fields=['resource_type', 'resource_id'], name='core_booking_lock_unique'),
+        ]
+
+    def __str__(self):
+        return f"{self.resource_type} #{self.resource_id}"
+
+
+class IdempotencyKey(models.Model):
+    """
+    Ответ на POST с заголовком Idempotency-Key (см. core.idempotency).
+    Повтор запроса с тем же ключом получает сохранённый ответ, пока не
+    истёк IDEMPOTENCY_KEY_TTL; пока первый запрос выполняется, строка
+    в статусе 'processing' и повторы ждут его ответа.
+    """
+    STATUS_CHOICES = [
+        ('processing', 'Выполняется'),
+        ('done', 'Готов'),
+    ]
+
+    scope = models.CharField(max_length=200, verbose_name="Адрес запроса")
+    key = models.CharField(max_length=255, verbose_name="Ключ")
+    fingerprint = models.CharField(max_length=64, verbose_name="Хэш тела запроса")
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='processing', verbose_name="Статус")
+    response_status = models.PositiveSmallIntegerField(null=True, blank=True, verbose_name="Код ответа")
+    response_body = models.JSONField(null=True, blank=True, encoder=DjangoJSONEncoder, verbose_name="Тело ответа")
+    created_at = models.DateTimeField(auto_now_add=True)
+    expires_at = models.DateTimeField(db_index=True, verbose_name="Хранится до")
+
+    class Meta:
+        verbose_name = "Ключ идемпотентности"
+        verbose_name_plural = "Ключи идемпотентности"
+        constraints = [
+            models.UniqueConstraint(fields=['scope', 'key'], name='core_idempotency_key_unique'),
+        ]
+
+    def __str__(self):
+        return f"{self.scope} {self.key}"
+
+    @classmethod
+    def purge_expired(cls):
+        """Удаляет ключи с истёкшим сроком и брошенные на середине запросы"""
+        lock_timeout = getattr(settings, 'IDEMPOTENCY_KEY_LOCK_TIMEOUT', 30)
+        now = timezone.now()
+        return cls.objects.filter(
+            Q(expires_at__lte=now) | Q(status='processing', created_at__lt=now - timedelta(seconds=lock_timeout))
+        ).delete()[0]
+
+    @classmethod
+    def claim(cls, scope, key, fingerprint):
+        """
+        Занимает ключ для запроса.
+        :return: (строка, True) — ключ наш, запрос выполняем мы;
+            (строка, False) — ключ уже занят другим запросом
+        """
+        while True:
+            existing = cls.objects.filter(scope=scope, key=key, expires_at__gt=timezone.now()).first()
+            if existing is not None:
+                return existing, False
+
+            cls.purge_expired()
+            ttl = getattr(settings, 'IDEMPOTENCY_KEY_TTL', 24 * 3600)
+            try:
+                with transaction.atomic():
+                    return cls.objects.create(
+                        scope=scope, key=key, fingerprint=fingerprint,
+                        expires_at=timezone.now() + timedelta(seconds=ttl),
+                    ), True
+            except IntegrityError:
+                # Тот же ключ одновременно занял другой запрос; если его строку
+                # уже удалил purge_expired — пробуем занять ключ снова
+                existing = cls.objects.filter(scope=scope, key=key).first()
+                if existing is not None:
+                    return existing, False
+
+    def finish(self, response_status, response_body):
+        """
+        Сохраняет ответ. Пока запрос выполнялся дольше
+        IDEMPOTENCY_KEY_LOCK_TIMEOUT, ожидающий повтор мог счесть его
+        брошенным и удалить строку — тогда ответ записывается заново,
+        если ключ не успел занять другой запрос.
+        """
+        self.status = 'done'
+        self.response_status = response_status
+        self.response_body = response_body
+        updated = type(self).objects.filter(pk=self.pk).update(
+            status=self.status, response_status=response_status, response_body=response_body,
+        )
+        if updated:
+            return
+        try:
+            with transaction.atomic():
+                self.save(force_insert=True)
+        except IntegrityError:
+            pass
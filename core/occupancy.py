@@ -0,0 +1,116 @@
+from bisect import bisect_left
+from collections import defaultdict
+from datetime import timedelta
+
+from django.db import transaction
+
+from .availability import ACTIVE_STATUSES
+from .models import Occupancy
+
+
+def booking_days(booking, resource_type, resource_attname):
+    """Строки Occupancy для брони: по одной на каждый день (даты включительно)"""
+    if booking.status not in ACTIVE_STATUSES or booking.end_date < booking.start_date:
+        return []
+    resource_id = getattr(booking, resource_attname)
+    return [
+        Occupancy(
+            resource_type=resource_type, resource_id=resource_id, date=booking.start_date + timedelta(days=offset),
+            booking_id=booking.pk, status=booking.status,
+        )
+        for offset in range((booking.end_date - booking.start_date).days + 1)
+    ]
+
+
+def sync_booking(engine, booking, deleted=False):
+    """
+    Приводит занятые дни брони в соответствие с ней. Вызывается сигналом
+    сразу после сохранения или удаления — в той же транзакции (save броней
+    открывает её сам, delete идёт в транзакции Collector), поэтому бронь
+    и её дни фиксируются или откатываются вместе.
+    """
+    with transaction.atomic():
+        Occupancy.objects.filter(resource_type=engine.resource_field, booking_id=booking.pk).delete()
+        if not deleted:
+            Occupancy.objects.bulk_create(booking_days(booking, engine.resource_field, engine.resource_attname))
+
+
+def occupied(resource_type, start, end):
+    """Занятые дни раздела в [start, end] — для фильтров Exists/NOT EXISTS"""
+    return Occupancy.objects.filter(resource_type=resource_type, date__gte=start, date__lte=end)
+
+
+def busy_queries(resource_type, queries):
+    """
+    Какие из запросов раздела пересекаются с занятыми днями — одним запросом
+    к таблице занятости на все объекты: дни объектов за общий диапазон дат
+    (в мини-приложении даты у всех карточек обычно одни и те же), а дальше
+    для каждого запроса bisect по дням его объекта.
+    :param queries: [(id объекта, начало, конец), ...], даты включительно
+    :return: множество номеров занятых запросов
+    """
+    if not queries:
+        return set()
+    days = defaultdict(list)
+    rows = Occupancy.objects.filter(
+        resource_type=resource_type,
+        resource_id__in={resource_id for resource_id, _, _ in queries},
+        date__gte=min(start for _, start, _ in queries),
+        date__lte=max(end for _, _, end in queries),
+    ).values_list('resource_id', 'date').distinct().order_by('resource_id', 'date')
+    for resource_id, day in rows:
+        days[resource_id].append(day)
+
+    busy = set()
+    for number, (resource_id, start, end) in enumerate(queries):
+        resource_days = days.get(resource_id, [])
+        position = bisect_left(resource_days, start)
+        if position < len(resource_days) and resource_days[position] <= end:
+            busy.add(number)
+    return busy
+
+
+def expected_rows(engine):
+    """{(объект, дата, бронь): статус} по самим броням раздела"""
+    rows = {}
+    bookings = engine.booking_model.objects.filter(status__in=ACTIVE_STATUSES).only(
+        engine.resource_attname, 'start_date', 'end_date', 'status'
+    )
+    for booking in bookings.iterator():
+        for day in booking_days(booking, engine.resource_field, engine.resource_attname):
+            rows[day.resource_id, day.date, day.booking_id] = day.status
+    return rows
+
+
+def check(engine):
+    """
+    Сверяет таблицу занятости раздела с бронями.
+    :return: (недостающие строки, лишние строки, строки с другим статусом)
+    """
+    expected = expected_rows(engine)
+    actual = {
+        (resource_id, day, booking_id): status
+        for resource_id, day, booking_id, status in Occupancy.objects.filter(
+            resource_type=engine.resource_field
+        ).values_list('resource_id', 'date', 'booking_id', 'status').iterator()
+    }
+    missing = expected.keys() - actual.keys()
+    extra = actual.keys() - expected.keys()
+    changed = {key for key in expected.keys() & actual.keys() if expected[key] != actual[key]}
+    return missing, extra, changed
+
+
+def rebuild(engine, batch_size=5000):
+    """Пересоздаёт таблицу занятости раздела по броням; возвращает число строк"""
+    expected = expected_rows(engine)
+    rows = [
+        Occupancy(
+            resource_type=engine.resource_field, resource_id=resource_id, date=day,
+            booking_id=booking_id, status=status,
+        )
+        for (resource_id, day, booking_id), status in expected.items()
+    ]
+    with transaction.atomic():
+        Occupancy.objects.filter(resource_type=engine.resource_field).delete()
+        Occupancy.objects.bulk_create(rows, batch_size=batch_size)
+    return len(rows)
@@ -0,0 +1,52 @@
+from PIL import Image
+
+# 64-битный хэш режется на 4 полосы по 16 бит. Если хэши отличаются
+# не больше чем в 3 битах, хотя бы одна полоса у них совпадает целиком —
+# поэтому кандидатов ищем точным совпадением по индексированной полосе,
+# а расстояние Хэмминга досчитываем только для них.
+BAND_COUNT = 4
+BAND_BITS = 64 // BAND_COUNT
+BAND_FIELDS = tuple(f'phash_band{i}' for i in range(BAND_COUNT))
+
+
+def dhash(source):
+    """
+    Разностный перцептивный хэш (dHash) изображения: 64 бита, каждый —
+    «левый пиксель ярче правого» на уменьшенной до 9x8 серой копии.
+    Не меняется при пересжатии, масштабировании и небольшой цветокоррекции.
+    :param source: путь, открытый файл или изображение PIL
+    """
+    if isinstance(source, Image.Image):
+        return _dhash(source)
+    with Image.open(source) as image:
+        return _dhash(image)
+
+
+def _dhash(image):
+    # Для JPEG сразу раскодируем в 1/8 размера — хэшу больше не нужно
+    image.draft('L', (64, 64))
+    pixels = image.convert('L').resize((9, 8), Image.Resampling.LANCZOS).tobytes()
+
+    value = 0
+    for row in range(8):
+        for col in range(8):
+            value = value << 1 | (pixels[row * 9 + col] > pixels[row * 9 + col + 1])
+    return value
+
+
+def to_hex(value):
+    return f"{value:016x}"
+
+
+def from_hex(text):
+    return int(text, 16)
+
+
+def bands(value):
+    """Полосы хэша в порядке BAND_FIELDS"""
+    mask = (1 << BAND_BITS) - 1
+    return [(value >> (BAND_BITS * (BAND_COUNT - 1 - i))) & mask for i in range(BAND_COUNT)]
+
+
+def hamming(first, second):
+    return (first ^ second).bit_count()
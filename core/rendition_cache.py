@@ -0,0 +1,122 @@
+import os
+import tempfile
+import threading
+import time
+
+from django.conf import settings
+
+
+class RenditionCache:
+    """
+    Дисковый кэш копий фото, созданных по запросу.
+    Запись атомарная (временный файл + os.replace), поэтому читатель никогда
+    не увидит недописанный файл. Давность использования — mtime: при
+    попадании файл «трогается», при переполнении удаляются самые старые.
+    Объём кэша считается на ходу, а каталог обходится только при
+    переполнении и раз в SCAN_INTERVAL секунд — в тот же каталог пишут
+    и другие процессы, их файлы видны только при обходе.
+    """
+    SCAN_INTERVAL = 300
+
+    def __init__(self, root=None, max_bytes=None):
+        self._root = root
+        self._max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._total = None  # байт в кэше по последнему обходу и нашим записям
+        self._scanned_at = None
+
+    @property
+    def root(self):
+        return str(self._root or settings.RENDITION_CACHE_ROOT)
+
+    @property
+    def max_bytes(self):
+        if self._max_bytes is not None:
+            return self._max_bytes
+        return getattr(settings, 'RENDITION_CACHE_MAX_BYTES', 512 * 1024 * 1024)
+
+    def path(self, key):
+        return os.path.join(self.root, *key.split('/'))
+
+    def get(self, key):
+        """Путь к файлу в кэше или None; попадание продлевает жизнь файла"""
+        path = self.path(key)
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            return None
+        return path
+
+    def put(self, key, content):
+        path = self.path(key)
+        directory = os.path.dirname(path)
+        os.makedirs(directory, exist_ok=True)
+
+        fd, tmp_path = tempfile.mkstemp(dir=directory, prefix='.tmp-')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(content)
+            try:
+                replaced = os.stat(path).st_size
+            except FileNotFoundError:
+                replaced = 0
+            os.replace(tmp_path, path)
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+
+        with self._lock:
+            if self._total is not None:
+                self._total += len(content) - replaced
+            scan = (
+                self._total is None or self._total > self.max_bytes
+                or time.monotonic() - self._scanned_at > self.SCAN_INTERVAL
+            )
+        if scan:
+            self.evict()
+        return path
+
+    def evict(self):
+        """Удаляет давно не использованные файлы, пока кэш не станет меньше лимита"""
+        with self._lock:
+            entries = []
+            total = 0
+            stack = [self.root]
+            while stack:
+                try:
+                    scanner = os.scandir(stack.pop())
+                except FileNotFoundError:
+                    continue
+                with scanner:
+                    for entry in scanner:
+                        if entry.is_dir(follow_symlinks=False):
+                            stack.append(entry.path)
+                        elif entry.is_file(follow_symlinks=False):
+                            stat = entry.stat()
+                            # Чужие временные файлы моложе минуты — ещё пишутся
+                            if entry.name.startswith('.tmp-') and stat.st_mtime > time.time() - 60:
+                                continue
+                            entries.append((stat.st_mtime, stat.st_size, entry.path))
+                            total += stat.st_size
+
+            self._total = total
+            self._scanned_at = time.monotonic()
+            if total <= self.max_bytes:
+                return 0
+
+            removed = 0
+            # Чистим с запасом до 90% лимита, чтобы не сканировать кэш на каждом промахе
+            for _, size, path in sorted(entries):
+                if total <= self.max_bytes * 0.9:
+                    break
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+                total -= size
+                removed += 1
+            self._total = total
+            return removed
+
+
+rendition_cache = RenditionCache()
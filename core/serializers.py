@@ -0,0 +1,48 @@
+from rest_framework import serializers
+
+from watermark import rendition_formats
+
+
+class FirstImageMixin(serializers.Serializer):
+    """
+    Первое фото для карточек: уменьшенная копия вместо полноразмерного файла
+    и srcset, чтобы браузер сам выбрал подходящую ширину, а также
+    размытое превью, которое видно до загрузки фото.
+    """
+    card_rendition = 'card'
+
+    first_image = serializers.SerializerMethodField()
+    first_image_srcset = serializers.SerializerMethodField()
+    first_image_placeholder = serializers.SerializerMethodField()
+
+    def _first_image(self, obj):
+        # Все поля first_image_* берут одно и то же фото одним запросом
+        if not hasattr(obj, '_first_image_cache'):
+            obj._first_image_cache = obj.images.first()
+        return obj._first_image_cache
+
+    def get_first_image(self, obj):
+        first_image = self._first_image(obj)
+        if first_image and first_image.image:
+            url = first_image.rendition_url(self.card_rendition)
+            return self.context['request'].build_absolute_uri(url)
+        return None
+
+    def get_first_image_srcset(self, obj):
+        first_image = self._first_image(obj)
+        if not first_image or not first_image.renditions:
+            return None
+
+        request = self.context['request']
+        return {
+            image_format: ", ".join(
+                f"{request.build_absolute_uri(url)} {width}w"
+                for url, width in first_image.srcset(image_format)
+            )
+            for image_format in rendition_formats()
+        }
+
+    def get_first_image_placeholder(self, obj):
+        """data URI размытого превью — рисуется сразу, без запроса к серверу"""
+        first_image = self._first_image(obj)
+        return first_image.placeholder if first_image and first_image.placeholder else None
@@ -0,0 +1,29 @@
+from django.conf import settings
+from django.core.files.storage import FileSystemStorage
+from django.utils.functional import cached_property
+
+
+class PrivateMediaStorage(FileSystemStorage):
+    """Хранилище в PRIVATE_MEDIA_ROOT: файлы не раздаются по MEDIA_URL"""
+
+    @cached_property
+    def base_location(self):
+        return self._value_or_setting(self._location, settings.PRIVATE_MEDIA_ROOT)
+
+    @cached_property
+    def base_url(self):
+        return None
+
+    def _clear_cached_properties(self, setting, **kwargs):
+        super()._clear_cached_properties(setting, **kwargs)
+        if setting == 'PRIVATE_MEDIA_ROOT':
+            self.__dict__.pop('base_location', None)
+            self.__dict__.pop('location', None)
+
+
+private_storage = PrivateMediaStorage()
+
+
+def originals_storage():
+    """Исходники фотографий без водяного знака"""
+    return private_storage
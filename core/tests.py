@@ -0,0 +1,1387 @@
+import base64
+import hashlib
+import io
+import os
+import random
+import shutil
+import tempfile
+import time
+from datetime import date, timedelta
+from types import SimpleNamespace
+from unittest import mock
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.exceptions import ValidationError
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.db import DatabaseError, IntegrityError, connection, transaction
+from django.db.models import F
+from django.utils import timezone
+from PIL import Image, ImageDraw
+
+from cars.models import Booking, Car, CarImage, Category
+from cars.serializers import CreateBookingSerializer
+from excursions.models import Excursion, ExcursionBooking, ExcursionCategory, ExcursionImage
+from houses.models import House, HouseCategory, HouseImage
+from watermark import EncodingProfile, WatermarkProcessor
+from . import occupancy, phash
+from .availability import IntervalIndex, availability
+from .booking import create_booking
+from .calendar import bookings_by_day, month_range
+from .management.commands.benchmark_calendar import per_day_scan
+from .models import (
+    AvailabilityGeneration, IdempotencyKey, ImageJob, Occupancy, UploadSession, content_hash, find_similar_images,
+    render_watermarked,
+)
+from .rendition_cache import RenditionCache
+
+
+def make_photo(size=(640, 480), color=(30, 90, 160)):
+    """Фон цвета color с узором, зависящим от цвета: разные цвета — разные фото"""
+    image = Image.new('RGB', size, color)
+    draw = ImageDraw.Draw(image)
+    rng = random.Random(str(color))
+    width, height = size
+    for _ in range(8):
+        left, top = rng.randrange(width), rng.randrange(height)
+        right, bottom = left + rng.randrange(width // 4, width // 2), top + rng.randrange(height // 4, height // 2)
+        draw.rectangle((left, top, right, bottom), fill=tuple(rng.randrange(256) for _ in range(3)))
+    return image
+
+
+def make_jpeg(name='photo.jpg', size=(640, 480), color=(30, 90, 160), photo=None):
+    buffer = io.BytesIO()
+    (photo or make_photo(size, color)).save(buffer, format='JPEG')
+    return SimpleUploadedFile(name, buffer.getvalue(), content_type='image/jpeg')
+
+
+def make_car(**kwargs):
+    category = Category.objects.create(title="Седан")
+    defaults = dict(
+        title="Camry", category=category, year=2020, color="Белый", engine_volume=2.5,
+        mileage=10000, oil_type='Бензин', price_per_day=50, deposit=100,
+    )
+    defaults.update(kwargs)
+    return Car.objects.create(**defaults)
+
+
+class MediaRootMixin:
+    def setUp(self):
+        super().setUp()
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root, ignore_errors=True)
+        settings_override = override_settings(
+            MEDIA_ROOT=os.path.join(media_root, 'media'),
+            PRIVATE_MEDIA_ROOT=os.path.join(media_root, 'private'),
+            RENDITION_CACHE_ROOT=os.path.join(media_root, 'cache'),
+            UPLOAD_TEMP_ROOT=os.path.join(media_root, 'uploads'),
+        )
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+
+class ImageJobQueueTests(MediaRootMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.car = make_car()
+
+    def test_save_enqueues_instead_of_processing(self):
+        with mock.patch('core.models.render_watermarked') as render_watermarked:
+            image = CarImage.objects.create(car=self.car, image=make_jpeg())
+
+        render_watermarked.assert_not_called()
+        self.assertEqual(image.processing_status, 'processing')
+        job = ImageJob.objects.get()
+        self.assertEqual(job.image, image)
+        self.assertEqual(job.status, 'queued')
+
+    def test_worker_watermarks_image(self):
+        image = CarImage.objects.create(car=self.car, image=make_jpeg())
+        raw_name = image.image.name
+
+        call_command('process_image_jobs', once=True, stdout=io.StringIO())
+
+        image.refresh_from_db()
+        self.assertEqual(image.processing_status, 'ready')
+        self.assertNotEqual(image.image.name, raw_name)
+        self.assertEqual(ImageJob.objects.get().status, 'done')
+
+    def test_pending_job_is_not_duplicated(self):
+        image = CarImage.objects.create(car=self.car, image=make_jpeg())
+        image.save()
+        self.assertEqual(ImageJob.objects.count(), 1)
+
+    @override_settings(IMAGE_JOB_MAX_ATTEMPTS=2, IMAGE_JOB_RETRY_DELAY=10)
+    def test_failed_job_is_retried_then_marked_failed(self):
+        image = CarImage.objects.create(car=self.car, image=make_jpeg())
+
+        broken = OSError("Не удалось открыть изображение")
+        with mock.patch('core.models.render_watermarked', side_effect=broken):
+            ImageJob.claim().run()
+            job = ImageJob.objects.get()
+            self.assertEqual(job.status, 'queued')
+            self.assertEqual(job.attempts, 1)
+            self.assertGreater(job.run_after, timezone.now() + timedelta(seconds=5))
+            self.assertIsNone(ImageJob.claim())
+
+            ImageJob.objects.update(run_after=timezone.now())
+            ImageJob.claim().run()
+
+        job.refresh_from_db()
+        image.refresh_from_db()
+        self.assertEqual(job.status, 'failed')
+        self.assertIn('Не удалось', job.last_error)
+        self.assertEqual(image.processing_status, 'failed')
+
+    def test_stale_running_job_is_requeued(self):
+        CarImage.objects.create(car=self.car, image=make_jpeg())
+        job = ImageJob.claim()
+        ImageJob.objects.filter(pk=job.pk).update(updated_at=timezone.now() - timedelta(hours=1))
+
+        self.assertEqual(ImageJob.requeue_stale(timedelta(minutes=10)), 1)
+        self.assertEqual(ImageJob.claim().pk, job.pk)
+
+    def test_deleted_image_job_completes(self):
+        image = CarImage.objects.create(car=self.car, image=make_jpeg())
+        CarImage.objects.filter(pk=image.pk).delete()
+
+        job = ImageJob.claim()
+        job.run()
+        self.assertEqual(job.status, 'done')
+
+    @override_settings(IMAGE_PROCESSING_ASYNC=False)
+    def test_sync_mode_processes_immediately(self):
+        image = CarImage.objects.create(car=self.car, image=make_jpeg())
+        self.assertEqual(image.processing_status, 'ready')
+        self.assertFalse(ImageJob.objects.exists())
+
+
+class IdempotentWatermarkTests(MediaRootMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.car = make_car()
+        self.image = CarImage.objects.create(car=self.car, image=make_jpeg())
+        call_command('process_image_jobs', once=True, stdout=io.StringIO())
+        self.image = CarImage.objects.get(pk=self.image.pk)
+
+    def test_processing_records_hashes(self):
+        self.assertEqual(len(self.image.source_hash), 64)
+        with self.image.image.open('rb'):
+            self.assertEqual(content_hash(self.image.image), self.image.processed_hash)
+
+    def test_order_change_does_not_reprocess(self):
+        name = self.image.image.name
+        self.image.order = 5
+        self.image.save()
+
+        self.image.refresh_from_db()
+        self.assertEqual(self.image.image.name, name)
+        self.assertEqual(self.image.processing_status, 'ready')
+        self.assertFalse(ImageJob.objects.filter(status='queued').exists())
+
+    def test_order_change_after_refresh_does_not_reprocess(self):
+        image = CarImage.objects.create(car=self.car, image=make_jpeg(color=(10, 200, 10)))
+        call_command('process_image_jobs', once=True, stdout=io.StringIO())
+
+        # Воркер сменил имя файла в базе; экземпляр узнаёт его из refresh_from_db
+        image.refresh_from_db()
+        image.order = 3
+        image.save()
+
+        image.refresh_from_db()
+        self.assertEqual(image.processing_status, 'ready')
+        self.assertFalse(ImageJob.objects.filter(status='queued').exists())
+
+    def test_same_upload_keeps_processed_file(self):
+        name = self.image.image.name
+        self.image.image = make_jpeg()
+        self.image.save()
+
+        self.image.refresh_from_db()
+        self.assertEqual(self.image.image.name, name)
+        self.assertFalse(ImageJob.objects.filter(status='queued').exists())
+
+    def test_new_upload_is_processed(self):
+        old_source = self.image.source_hash
+        self.image.image = make_jpeg(color=(200, 10, 10))
+        self.image.save()
+        self.assertEqual(ImageJob.objects.filter(status='queued').count(), 1)
+
+        call_command('process_image_jobs', once=True, stdout=io.StringIO())
+        self.image.refresh_from_db()
+        self.assertNotEqual(self.image.source_hash, old_source)
+        self.assertEqual(self.image.processing_status, 'ready')
+
+    def test_duplicate_job_does_not_stack_watermark(self):
+        name = self.image.image.name
+        ImageJob.enqueue(self.image)
+        call_command('process_image_jobs', once=True, stdout=io.StringIO())
+
+        self.image.refresh_from_db()
+        self.assertEqual(self.image.image.name, name)
+
+    def test_result_for_replaced_source_is_discarded(self):
+        stale = CarImage.objects.get(pk=self.image.pk)
+        self.image.image = make_jpeg(color=(200, 10, 10))
+        self.image.save()
+        stale.processed_hash = ''
+        storage = stale.image.storage
+        files_before = set(storage.listdir('cars/images')[1])
+
+        stale.process()
+
+        self.image.refresh_from_db()
+        self.assertEqual(self.image.processing_status, 'processing')
+        self.assertEqual(set(storage.listdir('cars/images')[1]), files_before)
+
+    def legacy_file(self, name, modified):
+        """Файл, оставленный старым save(), с заданным временем изменения"""
+        path = self.image.image.storage.path(name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'wb') as file:
+            file.write(b'jpeg')
+        os.utime(path, (modified, modified))
+
+    def legacy_image(self, name):
+        image = CarImage.objects.create(car=self.car, image=make_jpeg(color=(len(name), 2, 3)))
+        CarImage.objects.filter(pk=image.pk).update(image=name, processed_hash='')
+
+    def test_audit_reports_stacked_legacy_files(self):
+        uploaded = time.time() - 30 * 24 * 3600
+        # Загрузка + одно наложение; следующая загрузка с тем же именем
+        # получила суффикс ещё до наложения — это не двойной водяной знак
+        self.legacy_file('cars/images/Photo_with_classmates.jpg', uploaded)
+        self.legacy_file('cars/images/Photo_with_classmates_vr91mT3.jpg', uploaded + 2)
+        self.legacy_file('cars/images/Photo_with_classmates_clgAUmf.jpg', uploaded + 3600)
+        self.legacy_file('cars/images/Photo_with_classmates_clgAUmf_frHzpgV.jpg', uploaded + 3601)
+        self.legacy_image('cars/images/Photo_with_classmates_vr91mT3.jpg')
+        self.legacy_image('cars/images/Photo_with_classmates_clgAUmf_frHzpgV.jpg')
+        # Наложение при загрузке и ещё одно при пересохранении через день
+        self.legacy_file('cars/images/IMG_0156.JPG', uploaded)
+        self.legacy_file('cars/images/IMG_0156_B9bWddh.JPG', uploaded + 1)
+        self.legacy_file('cars/images/IMG_0156_B9bWddh_tqUPf4n.JPG', uploaded + 24 * 3600)
+        self.legacy_image('cars/images/IMG_0156_B9bWddh_tqUPf4n.JPG')
+        # Исходной загрузки на диске нет — судить не по чему
+        self.legacy_image('cars/images/BC0B1421_DoaHXYk_tqUPf4n.JPG')
+
+        out = io.StringIO()
+        call_command('audit_watermarks', stdout=out)
+
+        self.assertIn('IMG_0156_B9bWddh_tqUPf4n.JPG (наложений водяного знака: 2)', out.getvalue())
+        self.assertNotIn('Photo_with_classmates', out.getvalue())
+        self.assertNotIn('BC0B1421', out.getvalue())
+        self.assertIn('подозрительных: 1', out.getvalue())
+
+
+class RewatermarkTests(MediaRootMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.car = make_car()
+        self.image = CarImage.objects.create(car=self.car, image=make_jpeg())
+        self.raw_name = self.image.image.name
+        call_command('process_image_jobs', once=True, stdout=io.StringIO())
+        self.image.refresh_from_db()
+
+    def use_new_watermark(self):
+        base_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, base_dir, ignore_errors=True)
+        os.makedirs(os.path.join(base_dir, 'media'))
+        Image.new('RGBA', (40, 40), (255, 0, 0, 200)).save(os.path.join(base_dir, 'media', 'watermark.png'))
+        settings_override = override_settings(BASE_DIR=base_dir)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+    def test_upload_keeps_private_original(self):
+        self.assertEqual(self.raw_name, '')
+        self.assertTrue(self.image.original)
+        self.assertTrue(self.image.original.storage.exists(self.image.original.name))
+        self.assertEqual(self.image.image.storage.listdir('cars/images')[1], [os.path.basename(self.image.image.name)])
+        with self.assertRaises(ValueError):
+            self.image.original.url
+        with self.image.original.open('rb'):
+            self.assertEqual(content_hash(self.image.original), self.image.source_hash)
+
+    def test_rewatermark_renders_from_original(self):
+        old_name = self.image.image.name
+        old_version = self.image.watermark_version
+        self.use_new_watermark()
+
+        out = io.StringIO()
+        call_command('rewatermark', workers=2, stdout=out)
+
+        self.image.refresh_from_db()
+        self.assertNotEqual(self.image.watermark_version, old_version)
+        self.assertNotEqual(self.image.image.name, old_name)
+        self.assertFalse(self.image.image.storage.exists(old_name))
+        with Image.open(self.image.image.path) as result:
+            red, green, blue = result.getpixel((320, 240))
+            self.assertGreater(red, blue)
+        self.assertIn('Перерисовано: 1', out.getvalue())
+        self.assertIn('фото/с', out.getvalue())
+
+    def test_rewatermark_resumes_with_unprocessed_only(self):
+        out = io.StringIO()
+        call_command('rewatermark', workers=1, stdout=out)
+        self.assertIn('К перерисовке: 0', out.getvalue())
+
+        legacy = CarImage.objects.create(car=self.car, image=make_jpeg(color=(1, 2, 3)))
+        call_command('process_image_jobs', once=True, stdout=io.StringIO())
+        CarImage.objects.filter(pk=legacy.pk).update(original='')
+        self.use_new_watermark()
+
+        out = io.StringIO()
+        call_command('rewatermark', workers=1, stdout=out)
+        self.assertIn('К перерисовке: 1', out.getvalue())
+        self.assertIn('без оригинала', out.getvalue())
+
+
+class RenditionTests(MediaRootMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.car = make_car()
+
+    def process(self, upload):
+        image = CarImage.objects.create(car=self.car, image=upload)
+        call_command('process_image_jobs', once=True, stdout=io.StringIO())
+        image.refresh_from_db()
+        return image
+
+    def test_large_photo_gets_all_renditions(self):
+        image = self.process(make_jpeg(size=(1700, 1000)))
+
+        self.assertEqual(set(image.renditions), {'thumbnail', 'card', 'full'})
+        storage = image.image.storage
+        for rendition in image.renditions.values():
+            with Image.open(storage.path(rendition['webp'])) as webp:
+                self.assertEqual(webp.format, 'WEBP')
+                self.assertEqual(webp.size, (rendition['width'], rendition['height']))
+            with Image.open(storage.path(rendition['jpeg'])) as jpeg:
+                self.assertEqual(jpeg.format, 'JPEG')
+                self.assertEqual(jpeg.size, (rendition['width'], rendition['height']))
+        self.assertEqual(image.renditions['card']['height'], round(1000 * 768 / 1700))
+        self.assertEqual([width for _, width in image.srcset('webp')], [320, 768, 1600])
+
+    def test_placeholder_is_tiny_inline_jpeg(self):
+        image = self.process(make_jpeg(size=(1700, 1000)))
+
+        prefix = 'data:image/jpeg;base64,'
+        self.assertTrue(image.placeholder.startswith(prefix))
+        self.assertLess(len(image.placeholder), 1500)
+        with Image.open(io.BytesIO(base64.b64decode(image.placeholder[len(prefix):]))) as placeholder:
+            self.assertEqual(placeholder.size, (20, 12))
+
+    def test_small_photo_is_not_upscaled(self):
+        image = self.process(make_jpeg(size=(500, 300)))
+
+        self.assertEqual(set(image.renditions), {'thumbnail'})
+        self.assertEqual(image.rendition_url('card'), image.image.url)
+
+    def test_new_upload_replaces_renditions(self):
+        image = self.process(make_jpeg(size=(1000, 600)))
+        old_files = [rendition['jpeg'] for rendition in image.renditions.values()]
+
+        image.image = make_jpeg(size=(1000, 600), color=(200, 10, 10))
+        image.save()
+        call_command('process_image_jobs', once=True, stdout=io.StringIO())
+
+        for name in old_files:
+            self.assertFalse(image.image.storage.exists(name))
+
+    def test_build_renditions_backfills_old_rows(self):
+        image = self.process(make_jpeg(size=(1000, 600)))
+        image._delete_renditions(image.renditions)
+        CarImage.objects.filter(pk=image.pk).update(renditions={}, placeholder='')
+
+        out = io.StringIO()
+        call_command('build_renditions', stdout=out)
+
+        image.refresh_from_db()
+        self.assertEqual(set(image.renditions), {'thumbnail', 'card'})
+        self.assertTrue(image.placeholder)
+        self.assertIn('Создано копий для фото: 1', out.getvalue())
+
+
+class SinglePassPipelineTests(MediaRootMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.car = make_car()
+
+    def test_raw_upload_never_reaches_public_storage(self):
+        image = CarImage.objects.create(car=self.car, image=make_jpeg())
+
+        self.assertEqual(image.image.name, '')
+        self.assertEqual(image.processing_status, 'processing')
+        self.assertFalse(image.image.storage.exists('cars/images'))
+
+    def test_worker_writes_one_output_through_storage_api(self):
+        image = CarImage.objects.create(car=self.car, image=make_jpeg())
+        storage = CarImage._meta.get_field('image').storage
+
+        no_path = mock.PropertyMock(side_effect=NotImplementedError)
+        with mock.patch.object(storage, 'save', wraps=storage.save) as save, \
+                mock.patch('django.db.models.fields.files.FieldFile.path', new=no_path):
+            call_command('process_image_jobs', once=True, stdout=io.StringIO())
+
+        image.refresh_from_db()
+        self.assertEqual(image.processing_status, 'ready')
+        saved = [call.args[0] for call in save.call_args_list if '/renditions/' not in call.args[0]]
+        self.assertEqual(saved, ['cars/images/photo.jpg'])
+
+    def test_replacement_keeps_previous_photo_until_processed(self):
+        image = CarImage.objects.create(car=self.car, image=make_jpeg())
+        call_command('process_image_jobs', once=True, stdout=io.StringIO())
+        image.refresh_from_db()
+        first_name = image.image.name
+
+        image.image = make_jpeg(color=(200, 10, 10))
+        image.save()
+        image.refresh_from_db()
+        self.assertEqual(image.image.name, first_name)
+
+        call_command('process_image_jobs', once=True, stdout=io.StringIO())
+        image.refresh_from_db()
+        self.assertNotEqual(image.image.name, first_name)
+        self.assertEqual(image.image.storage.listdir('cars/images')[1], [os.path.basename(image.image.name)])
+
+    def test_photo_without_file_or_original_is_invalid(self):
+        with self.assertRaises(ValidationError):
+            CarImage(car=self.car).full_clean()
+
+
+class MediaGarbageCollectorTests(MediaRootMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.image = CarImage.objects.create(car=make_car(), image=make_jpeg(size=(1000, 600)))
+        call_command('process_image_jobs', once=True, stdout=io.StringIO())
+        self.image.refresh_from_db()
+
+        self.media_root = self.image.image.storage.location
+        self.orphan = os.path.join(self.media_root, 'cars', 'images', 'photo_DoaHXYk_tqUPf4n.jpg')
+        self.young = os.path.join(self.media_root, 'cars', 'images', 'uploading.jpg')
+        for path, content in ((self.orphan, b'x' * 1000), (self.young, b'y')):
+            with open(path, 'wb') as f:
+                f.write(content)
+        old = time.time() - 7200
+        os.utime(self.orphan, (old, old))
+
+    def referenced_paths(self):
+        paths = [self.image.image.path, self.image.original.path]
+        paths += [self.image.image.storage.path(rendition['webp']) for rendition in self.image.renditions.values()]
+        return paths
+
+    def test_dry_run_only_reports(self):
+        out = io.StringIO()
+        call_command('media_gc', dry_run=True, stdout=out)
+
+        self.assertIn('photo_DoaHXYk_tqUPf4n.jpg', out.getvalue())
+        self.assertIn('к удалению: 1 (1000 Б, 1000 байт)', out.getvalue())
+        self.assertIn('пропущено новых: 1', out.getvalue())
+        self.assertTrue(os.path.exists(self.orphan))
+
+    def test_deletes_only_old_orphans(self):
+        call_command('media_gc', stdout=io.StringIO())
+
+        self.assertFalse(os.path.exists(self.orphan))
+        self.assertTrue(os.path.exists(self.young))
+        for path in self.referenced_paths():
+            self.assertTrue(os.path.exists(path), path)
+
+
+class PerceptualHashTests(SimpleTestCase):
+    def test_hash_survives_resize_and_reencoding(self):
+        photo = make_photo(size=(1200, 900))
+        small = Image.open(make_jpeg(photo=photo.resize((400, 300))))
+
+        self.assertLessEqual(phash.hamming(phash.dhash(photo), phash.dhash(small)), 2)
+
+    def test_different_photos_are_far_apart(self):
+        first = phash.dhash(make_photo(color=(30, 90, 160)))
+        second = phash.dhash(make_photo(color=(200, 10, 10)))
+        self.assertGreater(phash.hamming(first, second), 10)
+
+    def test_close_hashes_share_a_band(self):
+        value = 0x0123456789abcdef
+        close = value ^ (1 << 3) ^ (1 << 20) ^ (1 << 40)
+        self.assertTrue(any(a == b for a, b in zip(phash.bands(value), phash.bands(close))))
+        self.assertEqual(phash.from_hex(phash.to_hex(value)), value)
+
+
+class DuplicateReuseTests(MediaRootMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.car = make_car()
+        self.image = CarImage.objects.create(car=self.car, image=make_jpeg(size=(1000, 600)))
+        call_command('process_image_jobs', once=True, stdout=io.StringIO())
+        self.image.refresh_from_db()
+
+    def make_excursion(self):
+        category = ExcursionCategory.objects.create(title="Горы")
+        return Excursion.objects.create(title="Ала-Арча", category=category, price_per_person=30)
+
+    def make_house(self):
+        category = HouseCategory.objects.create(title="Коттедж")
+        return House.objects.create(title="Дом", category=category, area=120, price_per_day=100, deposit=200)
+
+    def test_same_photo_in_other_section_reuses_processed_files(self):
+        excursion_image = ExcursionImage.objects.create(
+            excursion=self.make_excursion(), image=make_jpeg(size=(1000, 600))
+        )
+
+        self.assertFalse(ImageJob.objects.filter(status='queued').exists())
+        self.assertEqual(excursion_image.processing_status, 'ready')
+        self.assertEqual(excursion_image.image.name, self.image.image.name)
+        self.assertEqual(excursion_image.renditions, self.image.renditions)
+        self.assertEqual(excursion_image.perceptual_hash, self.image.perceptual_hash)
+        # Оригинал у каждого фото свой
+        self.assertNotEqual(excursion_image.original.name, self.image.original.name)
+        self.assertTrue(excursion_image.original.storage.exists(excursion_image.original.name))
+        self.assertTrue(excursion_image.possible_duplicate)
+
+    def test_section_with_other_watermark_mode_does_not_reuse(self):
+        house_image = HouseImage.objects.create(house=self.make_house(), image=make_jpeg(size=(1000, 600)))
+
+        self.assertEqual(house_image.processing_status, 'processing')
+        call_command('process_image_jobs', once=True, stdout=io.StringIO())
+        house_image.refresh_from_db()
+        self.assertNotEqual(house_image.image.name, self.image.image.name)
+        self.assertEqual(house_image.watermark_version, WatermarkProcessor.fingerprint(mode='auto'))
+
+    def test_near_duplicate_is_only_flagged(self):
+        resized = make_photo(size=(1000, 600)).resize((800, 480))
+        duplicate = CarImage.objects.create(car=self.car, image=make_jpeg(photo=resized))
+
+        self.assertEqual(duplicate.processing_status, 'processing')
+        self.assertTrue(duplicate.possible_duplicate)
+        self.assertFalse(self.image.possible_duplicate)
+        self.assertEqual(len(find_similar_images(phash.from_hex(self.image.perceptual_hash))), 2)
+
+    def test_uniform_photos_are_not_swapped(self):
+        # Однотонные фото дают одинаковый dHash, но это разные фото
+        red = CarImage.objects.create(car=self.car, image=make_jpeg('red.jpg', photo=Image.new('RGB', (640, 480), 'red')))
+        blue_upload = make_jpeg('blue.jpg', photo=Image.new('RGB', (640, 480), 'blue'))
+        blue_bytes = blue_upload.read()
+        blue = CarImage.objects.create(car=make_car(title="Civic"), image=blue_upload)
+        call_command('process_image_jobs', once=True, stdout=io.StringIO())
+        red.refresh_from_db()
+        blue.refresh_from_db()
+
+        self.assertEqual(red.perceptual_hash, blue.perceptual_hash)
+        self.assertTrue(blue.possible_duplicate)
+        self.assertNotEqual(blue.image.name, red.image.name)
+        self.assertNotEqual(blue.source_hash, red.source_hash)
+        with blue.original.open('rb') as original:
+            self.assertEqual(original.read(), blue_bytes)
+
+    def test_different_photo_is_processed(self):
+        other = CarImage.objects.create(car=self.car, image=make_jpeg(size=(1000, 600), color=(200, 10, 10)))
+
+        self.assertEqual(other.processing_status, 'processing')
+        self.assertEqual(ImageJob.objects.filter(status='queued').count(), 1)
+
+    def test_replacing_shared_photo_keeps_files_of_duplicate(self):
+        duplicate = CarImage.objects.create(car=self.car, image=make_jpeg(size=(1000, 600)))
+        shared = self.image.image.name
+
+        duplicate.image = make_jpeg(size=(1000, 600), color=(200, 10, 10))
+        duplicate.save()
+        call_command('process_image_jobs', once=True, stdout=io.StringIO())
+
+        duplicate.refresh_from_db()
+        self.assertNotEqual(duplicate.image.name, shared)
+        self.assertTrue(self.image.image.storage.exists(shared))
+        for rendition in self.image.renditions.values():
+            self.assertTrue(self.image.image.storage.exists(rendition['jpeg']))
+
+    def test_find_duplicates_backfills_hashes(self):
+        CarImage.objects.filter(pk=self.image.pk).update(perceptual_hash='', phash_band0=None)
+        CarImage.objects.create(car=self.car, image=make_jpeg(size=(1000, 600)))
+
+        out = io.StringIO()
+        call_command('find_duplicates', stdout=out)
+
+        self.image.refresh_from_db()
+        self.assertEqual(len(self.image.perceptual_hash), 16)
+        self.assertIn('Посчитано хэшей: 1', out.getvalue())
+        self.assertIn('Групп похожих фото: 1', out.getvalue())
+
+
+class OnDemandRenditionTests(MediaRootMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.image = CarImage.objects.create(car=make_car(), image=make_jpeg(size=(1000, 600)))
+        call_command('process_image_jobs', once=True, stdout=io.StringIO())
+        self.image.refresh_from_db()
+        self.url = self.image.on_demand_url('thumbnail', 'webp')
+
+    def test_first_request_renders_and_caches(self):
+        response = self.client.get(self.url)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'image/webp')
+        self.assertTrue(response['ETag'].startswith(f'"{self.image.source_hash}-'))
+        with Image.open(io.BytesIO(response.content)) as rendition:
+            self.assertEqual(rendition.size, (320, 192))
+        self.assertEqual(len(os.listdir(os.path.join(settings.RENDITION_CACHE_ROOT, '320'))), 1)
+
+    def test_cached_copy_is_served_without_rendering(self):
+        first = self.client.get(self.url)
+
+        with mock.patch('core.views.render_rendition') as render:
+            second = self.client.get(self.url)
+
+        render.assert_not_called()
+        self.assertEqual(b''.join(second.streaming_content), first.content)
+        self.assertEqual(second['ETag'], first['ETag'])
+
+    def test_matching_etag_returns_not_modified(self):
+        etag = self.client.get(self.url)['ETag']
+
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response['ETag'], etag)
+
+    def test_not_modified_skips_database_and_watermark_file(self):
+        etag = self.client.get(self.url)['ETag']
+
+        with self.assertNumQueries(0), mock.patch('watermark.open', side_effect=AssertionError, create=True):
+            response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+
+        self.assertEqual(response.status_code, 304)
+
+    def test_new_watermark_changes_etag(self):
+        etag = self.client.get(self.url)['ETag']
+        with mock.patch('core.views.WatermarkProcessor.fingerprint', return_value='0' * 16):
+            response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_unknown_size_or_photo_is_404(self):
+        self.assertEqual(self.client.get(self.url.replace('thumbnail', '333')).status_code, 404)
+        self.assertEqual(self.client.get(self.url.replace(self.image.source_hash, 'a' * 64)).status_code, 404)
+        self.assertEqual(self.client.get(self.url.replace('thumbnail', '768')).status_code, 200)
+
+
+class RenditionCacheTests(SimpleTestCase):
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.root, ignore_errors=True)
+        self.cache = RenditionCache(root=self.root, max_bytes=2500)
+
+    def test_put_is_atomic_and_get_finds_file(self):
+        self.assertIsNone(self.cache.get('320/a.webp'))
+        path = self.cache.put('320/a.webp', b'x' * 100)
+
+        self.assertEqual(self.cache.get('320/a.webp'), path)
+        self.assertEqual(os.listdir(os.path.dirname(path)), ['a.webp'])
+
+    def test_least_recently_used_files_are_evicted(self):
+        for age, name in enumerate(['old', 'used', 'new']):
+            path = self.cache.put(f'320/{name}.webp', b'x' * 1000)
+            os.utime(path, (time.time() - 100 + age, time.time() - 100 + age))
+        # Последний put превысил лимит и вытеснил самый старый файл
+        self.assertIsNone(self.cache.get('320/old.webp'))
+
+        self.cache.get('320/used.webp')
+        self.cache.put('320/newest.webp', b'x' * 1000)
+
+        self.assertIsNotNone(self.cache.get('320/used.webp'))
+        self.assertIsNone(self.cache.get('320/new.webp'))
+
+    def test_put_under_limit_does_not_walk_cache(self):
+        self.cache.put('320/a.webp', b'x' * 100)
+
+        with mock.patch('core.rendition_cache.os.scandir', wraps=os.scandir) as scandir:
+            self.cache.put('320/b.webp', b'x' * 100)
+            self.cache.put('320/a.webp', b'x' * 100)
+            scandir.assert_not_called()
+            self.cache.put('320/c.webp', b'x' * 2400)
+            scandir.assert_called()
+        self.assertIsNone(self.cache.get('320/a.webp'))
+
+
+class EncodingProfileTests(MediaRootMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.car = make_car()
+
+    def process(self, upload):
+        image = CarImage.objects.create(car=self.car, image=upload)
+        call_command('process_image_jobs', once=True, stdout=io.StringIO())
+        image.refresh_from_db()
+        return image
+
+    def test_photo_is_progressive_without_metadata(self):
+        exif = Image.Exif()
+        exif[0x0112] = 6  # Orientation: повернуть на 90° по часовой
+        buffer = io.BytesIO()
+        make_photo((640, 480)).save(buffer, format='JPEG', exif=exif, icc_profile=b'')
+        image = self.process(SimpleUploadedFile('rotated.jpg', buffer.getvalue(), content_type='image/jpeg'))
+
+        with Image.open(image.image.path) as stored:
+            self.assertEqual(stored.size, (480, 640))
+            self.assertTrue(stored.info.get('progressive'))
+            self.assertNotIn('exif', stored.info)
+            self.assertNotIn('icc_profile', stored.info)
+
+    def test_png_upload_is_stored_as_jpeg(self):
+        buffer = io.BytesIO()
+        make_photo().save(buffer, format='PNG')
+        image = self.process(SimpleUploadedFile('scan.png', buffer.getvalue(), content_type='image/png'))
+
+        self.assertEqual(image.image.name, 'cars/images/scan.jpg')
+        with Image.open(image.image.path) as stored:
+            self.assertEqual(stored.format, 'JPEG')
+
+    def test_rendition_quality_comes_from_its_profile(self):
+        sizes = {}
+        for quality in (30, 95):
+            profiles = {'thumbnail': {'quality': quality}}
+            with override_settings(IMAGE_ENCODING_PROFILES=profiles):
+                image = self.process(make_jpeg(size=(1000, 600), color=(quality, 90, 160)))
+            sizes[quality] = image.image.storage.size(image.renditions['thumbnail']['jpeg'])
+
+        self.assertLess(sizes[30] * 2, sizes[95])
+
+    @override_settings(IMAGE_RENDITION_FORMATS=['avif', 'jpeg'])
+    def test_avif_renditions_when_enabled(self):
+        if not EncodingProfile.available('avif'):
+            self.skipTest("Pillow собран без AVIF")
+        image = self.process(make_jpeg(size=(1000, 600)))
+
+        self.assertTrue(image.renditions['thumbnail']['avif'].endswith('_320.avif'))
+        response = self.client.get(image.on_demand_url('thumbnail', 'avif'))
+        self.assertEqual(response['Content-Type'], 'image/avif')
+
+    def test_encoding_report_compares_sizes(self):
+        root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, root, ignore_errors=True)
+        make_photo((1000, 600)).save(os.path.join(root, 'photo.jpg'), quality=95)
+
+        out = io.StringIO()
+        call_command('encoding_report', root=root, stdout=out)
+
+        self.assertIn('Фото: 1', out.getvalue())
+        self.assertIn('thumbnail', out.getvalue())
+        self.assertIn('Итого', out.getvalue())
+
+
+class BulkUploadTests(MediaRootMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.car = make_car()
+        self.url = f'/api/cars/{self.car.pk}/images/bulk/'
+        self.admin = User.objects.create_superuser('admin', 'admin@example.com', 'password')
+        self.client.force_login(self.admin)
+
+    def test_files_are_processed_and_appended_in_order(self):
+        existing = CarImage.objects.create(car=self.car, image=make_jpeg(), order=4)
+        uploads = [make_jpeg(f'{i}.jpg', color=(40 * i, 200, 10)) for i in range(1, 4)]
+
+        response = self.client.post(self.url, {'files': uploads})
+
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual([item['order'] for item in response.json()['images']], [5, 6, 7])
+        images = list(self.car.images.exclude(pk=existing.pk))
+        self.assertEqual([os.path.basename(image.image.name) for image in images], ['1.jpg', '2.jpg', '3.jpg'])
+        for image in images:
+            self.assertEqual(image.processing_status, 'ready')
+            self.assertTrue(image.original.storage.exists(image.original.name))
+            self.assertIn('thumbnail', image.renditions)
+        # Очередь не нужна: ждёт только задача фото, созданного обычным save()
+        self.assertEqual(ImageJob.objects.count(), 1)
+
+    def test_repeated_file_is_rendered_once(self):
+        photo = make_photo()
+        uploads = [make_jpeg('a.jpg', photo=photo), make_jpeg('b.jpg', photo=photo)]
+        with mock.patch('core.uploads.render_watermarked', wraps=render_watermarked) as render:
+            response = self.client.post(self.url, {'files': uploads})
+
+        self.assertEqual(response.status_code, 201)
+        render.assert_called_once()
+        first, second = self.car.images.all()
+        self.assertEqual(first.image.name, second.image.name)
+
+    def test_broken_file_is_reported_others_created(self):
+        broken = SimpleUploadedFile('broken.jpg', b'not an image', content_type='image/jpeg')
+
+        response = self.client.post(self.url, {'files': [broken, make_jpeg()]})
+
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.json()['errors'][0]['file'], 'broken.jpg')
+        self.assertEqual(self.car.images.count(), 1)
+
+    def test_only_admins_can_upload(self):
+        self.client.logout()
+        self.assertEqual(self.client.post(self.url, {'files': [make_jpeg()]}).status_code, 403)
+        self.assertFalse(self.car.images.exists())
+
+
+@override_settings(UPLOAD_CHUNK_SIZE=16 * 1024)
+class ChunkedUploadTests(MediaRootMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.car = make_car()
+        self.client.force_login(User.objects.create_superuser('admin', 'admin@example.com', 'password'))
+        buffer = io.BytesIO()
+        make_photo((1200, 900)).save(buffer, format='JPEG', quality=98)
+        self.content = buffer.getvalue()
+
+    def start(self, checksum=None):
+        response = self.client.post(f'/api/cars/{self.car.pk}/images/uploads/', {
+            'filename': 'phone.jpg',
+            'size': len(self.content),
+            'checksum': checksum or hashlib.sha256(self.content).hexdigest(),
+        })
+        self.assertEqual(response.status_code, 201)
+        return response.json()
+
+    def put(self, upload_id, offset, chunk):
+        return self.client.put(
+            f'/api/uploads/{upload_id}/', chunk,
+            content_type='application/offset+octet-stream', HTTP_UPLOAD_OFFSET=str(offset),
+        )
+
+    def upload_all(self, upload):
+        chunk_size = upload['chunk_size']
+        for offset in range(0, len(self.content), chunk_size):
+            response = self.put(upload['id'], offset, self.content[offset:offset + chunk_size])
+            self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def test_upload_in_chunks_creates_photo(self):
+        upload = self.start()
+        self.assertGreater(len(self.content), upload['chunk_size'])
+        self.assertEqual(self.upload_all(upload)['offset'], len(self.content))
+
+        response = self.client.post(f"/api/uploads/{upload['id']}/finalize/")
+        self.assertEqual(response.status_code, 201)
+        call_command('process_image_jobs', once=True, stdout=io.StringIO())
+
+        image = CarImage.objects.get(pk=response.json()['image_id'])
+        self.assertEqual(image.processing_status, 'ready')
+        self.assertEqual(image.source_hash, hashlib.sha256(self.content).hexdigest())
+        self.assertFalse(os.listdir(settings.UPLOAD_TEMP_ROOT))
+        # Повтор после оборванного ответа не создаёт второе фото
+        self.assertEqual(self.client.post(f"/api/uploads/{upload['id']}/finalize/").status_code, 200)
+        self.assertEqual(self.car.images.count(), 1)
+
+    def test_overlapping_finalize_creates_one_photo(self):
+        upload = self.start()
+        self.upload_all(upload)
+        # Второй повтор прочитал сессию, пока первый ещё не завершил её
+        stale = UploadSession.objects.get(pk=upload['id'])
+
+        self.assertEqual(self.client.post(f"/api/uploads/{upload['id']}/finalize/").status_code, 201)
+
+        self.assertIsNone(stale.finalize())
+        self.assertEqual(stale.status, 'complete')
+        self.assertEqual(self.car.images.count(), 1)
+
+    def test_finalize_in_progress_is_conflict(self):
+        upload = self.start()
+        self.upload_all(upload)
+        UploadSession.objects.filter(pk=upload['id']).update(status='finalizing')
+
+        response = self.client.post(f"/api/uploads/{upload['id']}/finalize/")
+
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(response.json()['status'], 'finalizing')
+        self.assertEqual(self.car.images.count(), 0)
+
+    def test_resume_after_lost_chunk(self):
+        upload = self.start()
+        chunk = self.content[:upload['chunk_size']]
+        self.assertEqual(self.put(upload['id'], 0, chunk).status_code, 200)
+
+        # Ответ потерялся, клиент повторил ту же часть — смещение уже другое
+        retry = self.put(upload['id'], 0, chunk)
+        self.assertEqual(retry.status_code, 409)
+        self.assertEqual(retry.json()['offset'], len(chunk))
+        self.assertEqual(self.client.get(f"/api/uploads/{upload['id']}/").json()['offset'], len(chunk))
+
+    def test_checksum_mismatch_rejects_file(self):
+        upload = self.start(checksum='0' * 64)
+        self.upload_all(upload)
+
+        response = self.client.post(f"/api/uploads/{upload['id']}/finalize/")
+
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json()['status'], 'failed')
+        self.assertFalse(self.car.images.exists())
+        self.assertFalse(os.listdir(settings.UPLOAD_TEMP_ROOT))
+
+    def test_oversized_chunk_is_refused(self):
+        upload = self.start()
+
+        response = self.put(upload['id'], 0, self.content[:upload['chunk_size'] + 1])
+
+        self.assertEqual(response.status_code, 413)
+        self.assertEqual(self.client.get(f"/api/uploads/{upload['id']}/").json()['offset'], 0)
+
+
+class IntervalIndexTests(SimpleTestCase):
+    def test_matches_brute_force(self):
+        rng = random.Random(17)
+        base = date(2025, 1, 1)
+        index = IntervalIndex()
+        intervals = {}
+        for booking_id in range(300):
+            if intervals and rng.random() < 0.3:
+                removed = rng.choice(list(intervals))
+                self.assertTrue(index.remove(removed))
+                del intervals[removed]
+            start = base + timedelta(days=rng.randrange(365))
+            end = start + timedelta(days=rng.randrange(1, 20))
+            index.add(start, end, booking_id)
+            intervals[booking_id] = (start, end)
+
+            start = base + timedelta(days=rng.randrange(-10, 380))
+            end = start + timedelta(days=rng.randrange(0, 30))
+            expected = sorted(i for i, (s, e) in intervals.items() if s <= end and e >= start)
+            self.assertEqual(sorted(index.conflicts(start, end)), expected)
+            self.assertEqual(index.overlaps(start, end), bool(expected))
+
+    def test_free_windows_match_day_probing(self):
+        rng = random.Random(23)
+        base = date(2025, 1, 1)
+        index = IntervalIndex()
+        for booking_id in range(60):
+            start = base + timedelta(days=rng.randrange(200))
+            index.add(start, start + timedelta(days=rng.randrange(0, 8)), booking_id)
+
+        def probe(length, start, end):
+            # Свободные дни подряд, собранные перебором каждого дня
+            windows, run = [], None
+            day = start
+            while day <= end + timedelta(days=1):
+                free = day <= end and not index.overlaps(day, day)
+                if free and run is None:
+                    run = day
+                elif not free and run is not None:
+                    if (day - run).days >= length:
+                        windows.append((run, day - timedelta(days=1)))
+                    run = None
+                day += timedelta(days=1)
+            return windows
+
+        for _ in range(200):
+            length = rng.randrange(1, 6)
+            start = base + timedelta(days=rng.randrange(-10, 210))
+            end = start + timedelta(days=rng.randrange(0, 60))
+            limit = rng.randrange(1, 5)
+            self.assertEqual(index.free_windows(length, start, end, limit), probe(length, start, end)[:limit])
+        self.assertEqual(IntervalIndex().free_windows(3, base, base, 1), [])
+
+
+class AvailabilityEngineTests(TestCase):
+    def setUp(self):
+        self.engine = availability(Booking)
+        self.cars = [make_car(title=f"Car {i}") for i in range(5)]
+
+    def book(self, car, start, end, status='pending'):
+        # Индекс и поколение обновляются после фиксации — в тестах её нет, выполняем вручную
+        with self.captureOnCommitCallbacks(execute=True):
+            return Booking.objects.create(
+                car=car, telegram_id='1', start_date=start, end_date=end,
+                client_name="Иван", phone_number="+996", status=status, total_price=100,
+            )
+
+    def sql_booked(self, start, end):
+        return set(Booking.objects.filter(
+            status__in=['confirmed', 'active', 'pending'], start_date__lte=end, end_date__gte=start,
+        ).values_list('car_id', flat=True))
+
+    def test_random_bookings_match_sql(self):
+        rng = random.Random(2025)
+        base = date(2025, 6, 1)
+        bookings = []
+        statuses = ['pending', 'confirmed', 'active', 'completed', 'cancelled']
+        for step in range(150):
+            action = rng.random()
+            if bookings and action < 0.15:
+                with self.captureOnCommitCallbacks(execute=True):
+                    bookings.pop(rng.randrange(len(bookings))).delete()
+            elif bookings and action < 0.35:
+                booking = rng.choice(bookings)
+                booking.status = rng.choice(statuses)
+                with self.captureOnCommitCallbacks(execute=True):
+                    booking.save()
+            else:
+                start = base + timedelta(days=rng.randrange(120))
+                bookings.append(self.book(
+                    rng.choice(self.cars), start, start + timedelta(days=rng.randrange(1, 10)), rng.choice(statuses)
+                ))
+
+            start = base + timedelta(days=rng.randrange(-5, 130))
+            end = start + timedelta(days=rng.randrange(0, 14))
+            self.assertEqual(self.engine.booked_resources(start, end), self.sql_booked(start, end))
+            car = rng.choice(self.cars)
+            self.assertEqual(
+                self.engine.is_available(car.id, start, end), car.id not in self.sql_booked(start, end)
+            )
+
+    def test_own_changes_do_not_reload(self):
+        self.book(self.cars[0], date(2025, 6, 1), date(2025, 6, 5))
+        self.engine.load()
+
+        self.book(self.cars[1], date(2025, 6, 3), date(2025, 6, 4))
+        # Только сверка поколения, без перечитывания броней
+        with self.assertNumQueries(1):
+            self.assertEqual(
+                self.engine.booked_resources(date(2025, 6, 4), date(2025, 6, 4)), {self.cars[0].id, self.cars[1].id}
+            )
+
+    def test_moved_and_rolled_back_bookings_leave_no_trace(self):
+        booking = self.book(self.cars[0], date(2025, 6, 1), date(2025, 6, 5))
+        self.engine.load()
+
+        with self.captureOnCommitCallbacks(execute=True):
+            booking.car = self.cars[1]
+            booking.save()
+        with self.captureOnCommitCallbacks(execute=True) as callbacks:
+            with self.assertRaises(RuntimeError), transaction.atomic():
+                Booking.objects.create(
+                    car=self.cars[2], telegram_id='1', start_date=date(2025, 6, 1), end_date=date(2025, 6, 5),
+                    client_name="Иван", phone_number="+996", status='pending', total_price=100,
+                )
+                raise RuntimeError()
+        self.assertEqual(callbacks, [])
+
+        with self.assertNumQueries(1):
+            self.assertEqual(self.engine.booked_resources(date(2025, 6, 2), date(2025, 6, 2)), {self.cars[1].id})
+
+    def test_change_from_other_process_is_detected(self):
+        booking = self.book(self.cars[0], date(2025, 6, 1), date(2025, 6, 5))
+        self.assertFalse(self.engine.is_available(self.cars[0].id, date(2025, 6, 2), date(2025, 6, 3)))
+
+        # Другой процесс отменил бронь: сигналов здесь нет, только счётчик в базе
+        Booking.objects.filter(pk=booking.pk).update(status='cancelled')
+        AvailabilityGeneration.objects.filter(key='cars.booking').update(value=F('value') + 1)
+
+        self.assertTrue(self.engine.is_available(self.cars[0].id, date(2025, 6, 2), date(2025, 6, 3)))
+
+    def test_lost_generation_bump_is_bounded_by_ttl(self):
+        booking = self.book(self.cars[0], date(2025, 6, 1), date(2025, 6, 5))
+        self.engine.load()
+        # Бронь отменили, а счётчик поколения так и не увеличился
+        Booking.objects.filter(pk=booking.pk).update(status='cancelled')
+        self.assertFalse(self.engine.is_available(self.cars[0].id, date(2025, 6, 2), date(2025, 6, 3)))
+
+        later = time.monotonic() + 61
+        with mock.patch('core.availability.time.monotonic', return_value=later):
+            self.assertTrue(self.engine.is_available(self.cars[0].id, date(2025, 6, 2), date(2025, 6, 3)))
+
+    def test_failed_generation_bump_does_not_fail_booking(self):
+        self.engine.load()
+        with mock.patch.object(self.engine, '_bump_generation', side_effect=DatabaseError("database is locked")):
+            self.book(self.cars[0], date(2025, 6, 1), date(2025, 6, 5))
+
+        self.assertFalse(self.engine.is_available(self.cars[0].id, date(2025, 6, 2), date(2025, 6, 3)))
+
+    def test_create_booking_rejects_overlap(self):
+        self.book(self.cars[0], date(2025, 6, 1), date(2025, 6, 5))
+        data = {
+            'car': self.cars[0].id, 'telegram_id': '2', 'client_name': "Пётр", 'phone_number': '+996',
+            'start_date': '2025-06-05', 'end_date': '2025-06-08',
+        }
+
+        self.assertFalse(CreateBookingSerializer(data=data).is_valid())
+        data.update(start_date='2025-06-06')
+        self.assertTrue(CreateBookingSerializer(data=data).is_valid())
+
+    def test_create_booking_bumps_generation_after_commit(self):
+        generation = self.engine._current_generation()
+        with self.captureOnCommitCallbacks() as callbacks, CaptureQueriesContext(connection) as queries:
+            create_booking(
+                Booking, car=self.cars[0], telegram_id='1', start_date=date(2025, 6, 1), end_date=date(2025, 6, 5),
+                client_name="Иван", phone_number="+996", total_price=100,
+            )
+
+        # В транзакции брони общая строка поколения раздела не трогается
+        self.assertFalse(any('availabilitygeneration' in query['sql'] for query in queries.captured_queries))
+        for callback in callbacks:
+            callback()
+        self.assertEqual(self.engine._current_generation(), generation + 1)
+
+
+class OccupancyTests(TestCase):
+    def setUp(self):
+        self.engine = availability(Booking)
+        self.car = make_car()
+
+    def book(self, start, end, status='pending'):
+        return Booking.objects.create(
+            car=self.car, telegram_id='1', start_date=start, end_date=end,
+            client_name="Иван", phone_number="+996", status=status, total_price=100,
+        )
+
+    def days(self, booking):
+        return list(Occupancy.objects.filter(resource_type='car', booking_id=booking.pk).order_by('date').values_list(
+            'resource_id', 'date', 'status'
+        ))
+
+    def test_rows_follow_booking(self):
+        booking = self.book(date(2025, 6, 1), date(2025, 6, 3))
+        self.assertEqual(self.days(booking), [
+            (self.car.id, date(2025, 6, day), 'pending') for day in (1, 2, 3)
+        ])
+
+        booking.end_date = date(2025, 6, 2)
+        booking.status = 'confirmed'
+        booking.save()
+        self.assertEqual(self.days(booking), [
+            (self.car.id, date(2025, 6, day), 'confirmed') for day in (1, 2)
+        ])
+
+        booking.status = 'cancelled'
+        booking.save()
+        self.assertEqual(self.days(booking), [])
+
+        booking.status = 'active'
+        booking.save()
+        pk = booking.pk
+        booking.delete()
+        self.assertFalse(Occupancy.objects.filter(booking_id=pk).exists())
+
+    def test_failed_sync_rolls_back_booking(self):
+        with mock.patch.object(Occupancy.objects, 'bulk_create', side_effect=DatabaseError("диск заполнен")):
+            with self.assertRaises(DatabaseError):
+                self.book(date(2025, 6, 1), date(2025, 6, 3))
+
+        self.assertFalse(Booking.objects.filter(car=self.car).exists())
+
+    def test_check_and_rebuild(self):
+        booking = self.book(date(2025, 6, 1), date(2025, 6, 4))
+        self.book(date(2025, 7, 1), date(2025, 7, 1), status='completed')
+        call_command('rebuild_occupancy', '--check', '--section', 'car', stdout=io.StringIO())
+
+        # Изменения мимо сигналов: update() и ручная правка таблицы
+        Booking.objects.filter(pk=booking.pk).update(end_date=date(2025, 6, 5))
+        Occupancy.objects.filter(booking_id=booking.pk, date=date(2025, 6, 1)).update(status='active')
+        missing, extra, changed = occupancy.check(self.engine)
+        self.assertEqual(len(missing), 1)
+        self.assertEqual(extra, set())
+        self.assertEqual(len(changed), 1)
+        with self.assertRaises(CommandError):
+            call_command('rebuild_occupancy', '--check', stdout=io.StringIO())
+
+        call_command('rebuild_occupancy', '--section', 'car', stdout=io.StringIO())
+        self.assertEqual(occupancy.check(self.engine), (set(), set(), set()))
+        self.assertEqual(len(self.days(booking)), 5)
+
+
+class BatchAvailabilityTests(TestCase):
+    def setUp(self):
+        self.cars = [make_car(title=f"Car {i}") for i in range(3)]
+        self.excursion = Excursion.objects.create(
+            title="Ала-Арча", category=ExcursionCategory.objects.create(title="Горы"), price_per_person=50,
+        )
+        self.cars[2].status = 'booked'
+        self.cars[2].save()
+        for car, start, end, status in [
+            (self.cars[0], date(2025, 7, 3), date(2025, 7, 5), 'confirmed'),
+            (self.cars[1], date(2025, 7, 1), date(2025, 7, 2), 'cancelled'),
+        ]:
+            Booking.objects.create(
+                car=car, telegram_id='1', start_date=start, end_date=end,
+                client_name="Иван", phone_number="+996", status=status, total_price=100,
+            )
+        ExcursionBooking.objects.create(
+            excursion=self.excursion, telegram_id='1', start_date=date(2025, 7, 10), end_date=date(2025, 7, 10),
+            client_name="Иван", phone_number="+996", status='pending', total_price=50,
+        )
+
+    def post(self, items):
+        return self.client.post(reverse('availability-batch'), items, content_type='application/json')
+
+    def test_results_by_index(self):
+        car, free_car, booked_car = self.cars
+        items = [
+            {'type': 'car', 'id': car.id, 'start': '2025-07-05', 'end': '2025-07-08'},
+            {'type': 'car', 'id': car.id, 'start': '2025-07-06', 'end': '2025-07-08'},
+            {'type': 'car', 'id': free_car.id, 'start': '2025-07-01', 'end': '2025-07-02'},
+            {'type': 'excursion', 'id': self.excursion.id, 'start': '2025-07-10', 'end': '2025-07-10'},
+            {'type': 'car', 'id': booked_car.id, 'start': '2025-08-01', 'end': '2025-08-02'},
+            {'type': 'excursion', 'id': self.excursion.id, 'start': '2025-07-11', 'end': '2025-07-12'},
+            {'type': 'car', 'id': 999, 'start': '2025-07-01', 'end': '2025-07-02'},
+            {'type': 'boat', 'id': 1, 'start': '2025-07-01', 'end': '2025-07-02'},
+            {'type': 'car', 'id': car.id, 'start': '2025-07-05', 'end': '2025-07-01'},
+        ]
+        # По два запроса на раздел: объекты и занятые дни
+        with self.assertNumQueries(4):
+            response = self.post(items)
+
+        self.assertEqual(response.status_code, 200)
+        results = response.json()['results']
+        self.assertEqual(list(results), [str(number) for number in range(len(items))])
+        self.assertEqual(
+            [results[str(number)].get('is_available') for number in range(6)],
+            [False, True, True, False, False, True],
+        )
+        self.assertEqual(results['3']['type'], 'excursion')
+        self.assertEqual(results['6'], {'type': 'car', 'id': 999, 'error': 'Объект не найден'})
+        self.assertIn('error', results['7'])
+        self.assertIn('error', results['8'])
+
+    def test_invalid_batch(self):
+        self.assertEqual(self.post({'items': []}).status_code, 400)
+        self.assertEqual(self.post({'type': 'car'}).status_code, 400)
+        item = {'type': 'car', 'id': self.cars[0].id, 'start': '2025-07-01', 'end': '2025-07-02'}
+        with override_settings(AVAILABILITY_BATCH_MAX_ITEMS=2):
+            self.assertEqual(self.post({'items': [item] * 3}).status_code, 400)
+            self.assertEqual(self.post({'items': [item] * 2}).status_code, 200)
+
+
+class FreeWindowsViewTests(TestCase):
+    def setUp(self):
+        self.car = make_car()
+        with self.captureOnCommitCallbacks(execute=True):
+            for start, end in [(date(2025, 7, 3), date(2025, 7, 5)), (date(2025, 7, 8), date(2025, 7, 12))]:
+                Booking.objects.create(
+                    car=self.car, telegram_id='1', start_date=start, end_date=end,
+                    client_name="Иван", phone_number="+996", status='confirmed', total_price=100,
+                )
+
+    def get(self, url_name, pk, **params):
+        return self.client.get(reverse(url_name, args=[pk]), params)
+
+    def test_next_windows(self):
+        response = self.get('car-free-windows', self.car.id, days=2, start_date='2025-07-01', horizon=20)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['windows'], [
+            {'start_date': '2025-07-01', 'end_date': '2025-07-02', 'free_until': '2025-07-02'},
+            {'start_date': '2025-07-06', 'end_date': '2025-07-07', 'free_until': '2025-07-07'},
+            {'start_date': '2025-07-13', 'end_date': '2025-07-14', 'free_until': '2025-07-20'},
+        ])
+        windows = self.get('car-free-windows', self.car.id, days=3, start_date='2025-07-01', limit=1).json()['windows']
+        self.assertEqual(windows, [{'start_date': '2025-07-13', 'end_date': '2025-07-15', 'free_until': '2025-09-28'}])
+
+    def test_all_sections(self):
+        excursion = Excursion.objects.create(
+            title="Ала-Арча", category=ExcursionCategory.objects.create(title="Горы"), price_per_person=50,
+        )
+        response = self.get('excursion-free-windows', excursion.id, days=1, start_date='2025-07-01', horizon=1)
+        self.assertEqual(response.json()['windows'][0]['start_date'], '2025-07-01')
+        self.assertEqual(self.get('house-free-windows', 999, days=1).status_code, 404)
+        self.assertEqual(self.get('moto-free-windows', 999, days=1).status_code, 404)
+
+    def test_invalid_params(self):
+        self.assertEqual(self.get('car-free-windows', self.car.id).status_code, 400)
+        self.assertEqual(self.get('car-free-windows', self.car.id, days=10, horizon=5).status_code, 400)
+        self.assertEqual(self.get('car-free-windows', self.car.id, days=2, limit=50).status_code, 400)
+        self.assertEqual(self.get('car-free-windows', self.car.id, days=2, start_date='завтра').status_code, 400)
+
+
+class IdempotencyKeyTests(TestCase):
+    def setUp(self):
+        self.car = make_car()
+        self.data = {
+            'car': self.car.id, 'telegram_id': '1', 'client_name': "Иван", 'phone_number': '+996',
+            'start_date': '2025-07-01', 'end_date': '2025-07-03',
+        }
+
+    def post(self, data, key='retry-1'):
+        headers = {'Idempotency-Key': key} if key else {}
+        return self.client.post(reverse('booking-list'), data, content_type='application/json', headers=headers)
+
+    def test_replay_returns_saved_response(self):
+        first = self.post(self.data)
+        self.assertEqual(first.status_code, 201)
+
+        # Только чтение ключа — ни проверки дат, ни таблиц броней
+        with self.assertNumQueries(1):
+            replay = self.post(self.data)
+        self.assertEqual(replay.status_code, 201)
+        self.assertEqual(replay.json(), first.json())
+        self.assertEqual(replay['Idempotent-Replayed'], 'true')
+        self.assertEqual(Booking.objects.count(), 1)
+
+        # Другой ключ — новая попытка, и даты уже заняты
+        self.assertEqual(self.post(self.data, key='retry-2').status_code, 400)
+        self.assertEqual(self.post(self.data, key=None).status_code, 400)
+
+    def test_key_reused_with_other_data(self):
+        self.post(self.data)
+        response = self.post(dict(self.data, end_date='2025-07-04'))
+        self.assertEqual(response.status_code, 422)
+        self.assertEqual(Booking.objects.count(), 1)
+
+    def test_rejection_is_replayed(self):
+        bad = dict(self.data, end_date='2025-06-30')
+        self.assertEqual(self.post(bad).status_code, 400)
+        self.assertEqual(self.post(bad).status_code, 400)
+        self.assertEqual(IdempotencyKey.objects.get().response_status, 400)
+
+    def test_expired_key_is_purged(self):
+        self.post(self.data)
+        IdempotencyKey.objects.update(expires_at=timezone.now() - timedelta(seconds=1))
+        Booking.objects.all().delete()
+
+        self.assertEqual(self.post(self.data).status_code, 201)
+        self.assertEqual(Booking.objects.count(), 1)
+        self.assertEqual(IdempotencyKey.objects.count(), 1)
+
+    def test_slow_owner_still_saves_response_after_purge(self):
+        record, claimed = IdempotencyKey.claim('/api/bookings/', 'slow', 'a' * 64)
+        self.assertTrue(claimed)
+        # Ожидающий повтор счёл запрос зависшим и удалил ключ
+        IdempotencyKey.objects.filter(pk=record.pk).delete()
+
+        record.finish(201, {'id': 1, 'created_at': timezone.now()})
+
+        saved = IdempotencyKey.objects.get(scope='/api/bookings/', key='slow')
+        self.assertEqual((saved.status, saved.response_status), ('done', 201))
+
+    def test_claim_retries_when_racing_row_was_purged(self):
+        create = IdempotencyKey.objects.create
+        calls = []
+
+        def racing_create(**fields):
+            calls.append(fields)
+            if len(calls) == 1:
+                # Другой запрос занял ключ, и его строку тут же удалил purge_expired
+                raise IntegrityError()
+            return create(**fields)
+
+        with mock.patch.object(IdempotencyKey.objects, 'create', side_effect=racing_create):
+            record, claimed = IdempotencyKey.claim('/api/bookings/', 'race', 'a' * 64)
+
+        self.assertTrue(claimed)
+        self.assertEqual(len(calls), 2)
+        self.assertEqual(IdempotencyKey.objects.get().pk, record.pk)
+
+
+class CalendarBuilderTests(SimpleTestCase):
+    def test_matches_per_day_scan(self):
+        rng = random.Random(20)
+        start_date, end_date = month_range(2, 2024)
+        bookings = []
+        for pk in range(400):
+            start = start_date + timedelta(days=rng.randrange(-15, 40))
+            bookings.append(SimpleNamespace(pk=pk, start_date=start, end_date=start + timedelta(days=rng.randrange(12))))
+        rng.shuffle(bookings)
+
+        def describe(booking):
+            return booking.pk
+
+        # Внутри дня брони упорядочены по дате начала
+        starts = {booking.pk: booking.start_date for booking in bookings}
+        expected = [
+            (day, sorted(ids, key=lambda pk: (starts[pk], pk)))
+            for day, ids in per_day_scan(bookings, start_date, end_date, describe)
+        ]
+        self.assertEqual(bookings_by_day(bookings, start_date, end_date, describe), expected)
+        self.assertEqual(len(expected), 29)
+
+    def test_month_range(self):
+        self.assertEqual(month_range('12', '2025'), (date(2025, 12, 1), date(2026, 1, 1)))
+        with self.assertRaises(ValueError):
+            month_range('13', '2025')
@@ -0,0 +1,143 @@
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.db import transaction
+from django.db.models import Max
+
+from watermark import WatermarkProcessor, encoding_profile
+from . import phash
+from .models import content_hash, render_watermarked
+
+
+def upload_source(upload):
+    """Путь к временному файлу загрузки, если он есть, иначе сам файл"""
+    if hasattr(upload, 'temporary_file_path'):
+        return upload.temporary_file_path()
+    upload.seek(0)
+    return upload
+
+
+def render_upload(model, upload):
+    """
+    Обрабатывает одну загрузку и записывает файлы в хранилища. Без обращений
+    к базе — выполняется в потоке (Pillow отпускает GIL на декодировании,
+    масштабировании и кодировании).
+    :return: значения полей фото (без родителя и порядка)
+    """
+    content, renditions, placeholder = render_watermarked(upload_source(upload), model.watermark_mode)
+
+    image = model()
+    upload.seek(0)
+    image.original.save(os.path.basename(upload.name), upload, save=False)
+    stem = os.path.splitext(os.path.basename(image.original.name))[0]
+    image.image.save(f"{stem}.{encoding_profile('photo').extension}", ContentFile(content), save=False)
+    return {
+        'image': image.image.name,
+        'original': image.original.name,
+        'processed_hash': content_hash(ContentFile(content)),
+        'renditions': image._save_renditions(renditions),
+        'placeholder': placeholder,
+    }
+
+
+def delete_rendered(model, fields):
+    image = model(image=fields['image'], original=fields['original'])
+    image._delete_renditions(fields['renditions'])
+    image.image.delete(save=False)
+    image.original.delete(save=False)
+
+
+def bulk_upload(model, parent_field, parent, uploads, workers=None):
+    """
+    Создаёт фото для parent из нескольких загрузок: обработка идёт
+    параллельно в пуле потоков, записи создаются одним bulk_create и
+    получают порядок после уже существующих фото. Фото сразу готовы —
+    очередь ImageJob не используется.
+    :return: (созданные фото, [(имя файла, ошибка), ...])
+    """
+    version = WatermarkProcessor.fingerprint(mode=model.watermark_mode)
+    workers = workers or getattr(settings, 'IMAGE_BULK_WORKERS', None) or os.cpu_count() or 1
+
+    # Хэши считаем сразу: повторы и уже обработанные фото не рендерим
+    errors = []
+    entries = []
+    for upload in uploads:
+        try:
+            source_hash = content_hash(upload)
+            value = phash.dhash(upload_source(upload))
+        except (OSError, ValueError) as e:
+            errors.append((upload.name, str(e)))
+            continue
+        entries.append((upload, source_hash, value))
+
+    # Готовые файлы берём только у фото из точно такого же файла (SHA-256);
+    # близкий перцептивный хэш — лишь пометка «похоже на другое фото»
+    max_distance = getattr(settings, 'IMAGE_DUPLICATE_DISTANCE', 2)
+    probe = model()
+    donors = {}
+    to_render = {}
+    for upload, source_hash, value in entries:
+        if source_hash in donors or source_hash in to_render:
+            continue
+        donor = probe.find_duplicate(source_hash)
+        if donor is not None:
+            donors[source_hash] = donor
+        else:
+            to_render[source_hash] = upload
+
+    rendered = {}
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = {
+            source_hash: executor.submit(render_upload, model, upload)
+            for source_hash, upload in to_render.items()
+        }
+        for source_hash, future in futures.items():
+            try:
+                rendered[source_hash] = future.result()
+            except Exception as e:
+                errors.append((to_render[source_hash].name, str(e)))
+
+    images = []
+    own_originals = []  # оригиналы повторов, записанные отдельно от рендера
+    try:
+        for upload, source_hash, value in entries:
+            image = model(**{parent_field: parent})
+            if source_hash in donors:
+                image._reuse_processed(donors[source_hash], upload)
+                own_originals.append(image)
+            elif source_hash in rendered:
+                for field, field_value in rendered[source_hash].items():
+                    setattr(image, field, field_value)
+                if to_render[source_hash] is not upload:
+                    # Тот же файл второй раз в пачке: файлы со знаком общие, оригинал свой
+                    upload.seek(0)
+                    image.original.save(os.path.basename(upload.name), upload, save=False)
+                    own_originals.append(image)
+                image.source_hash = source_hash
+                image.watermark_version = version
+                image.processing_status = 'ready'
+            else:
+                continue
+            image.set_perceptual_hash(value)
+            image.possible_duplicate = probe.has_similar(value) or any(
+                other is not upload and phash.hamming(value, other_value) <= max_distance
+                for other, _, other_value in entries
+            )
+            images.append(image)
+
+        with transaction.atomic():
+            start = model.objects.filter(**{parent_field: parent}).aggregate(last=Max('order'))['last']
+            start = -1 if start is None else start
+            for offset, image in enumerate(images, start=1):
+                image.order = start + offset
+            model.objects.bulk_create(images)
+    except Exception:
+        for fields in rendered.values():
+            delete_rendered(model, fields)
+        for image in own_originals:
+            image.original.delete(save=False)
+        raise
+
+    return images, errors
@@ -0,0 +1,11 @@
+from django.urls import re_path
+
+from . import views
+
+urlpatterns = [
+    re_path(
+        r'^(?P<size>[a-z0-9]+)/(?P<source_hash>[0-9a-f]{64})\.(?P<extension>webp|jpg|avif)$',
+        views.rendition,
+        name='rendition',
+    ),
+]
@@ -0,0 +1,369 @@
+import io
+from collections import defaultdict
+from datetime import datetime, timedelta
+
+from django.conf import settings
+from django.core.files.uploadhandler import TemporaryFileUploadHandler
+from django.http import FileResponse, Http404, HttpResponse, HttpResponseNotModified
+from django.shortcuts import get_object_or_404
+from django.utils import timezone
+from django.utils.http import parse_etags
+from django.views.decorators.http import require_safe
+from rest_framework import permissions, status
+from rest_framework.parsers import MultiPartParser
+from rest_framework.response import Response
+from rest_framework.views import APIView
+
+from watermark import EncodingProfile, WatermarkProcessor, encoding_profile
+from .availability import availability, engines
+from .models import UploadSession, find_image_by_source_hash, render_rendition, rendition_widths
+from .occupancy import busy_queries
+from .rendition_cache import rendition_cache
+from .uploads import bulk_upload
+
+RENDITION_FORMATS = {
+    'webp': 'webp',
+    'jpg': 'jpeg',
+    'avif': 'avif',
+}
+RENDITION_CACHE_CONTROL = 'public, max-age=86400'
+
+
+def rendition_width(size):
+    """Ширина по имени копии ('card') или числу; произвольные ширины не принимаем"""
+    widths = rendition_widths()
+    if size in widths:
+        return widths[size]
+    if size.isdigit() and int(size) in widths.values():
+        return int(size)
+    return None
+
+
+def rendition_profile(width, image_format):
+    """Профиль копии этой ширины: качество у каждой копии своё"""
+    name = next((name for name, value in rendition_widths().items() if value == width), None)
+    return encoding_profile(name).with_format(image_format)
+
+
+@require_safe
+def rendition(request, size, source_hash, extension):
+    """
+    Копия фото с водяным знаком нужной ширины, создаётся при первом запросе
+    из приватного оригинала и дальше отдаётся из дискового кэша.
+    """
+    width = rendition_width(size)
+    if width is None:
+        raise Http404("Неизвестный размер")
+    image_format = RENDITION_FORMATS[extension]
+    if not EncodingProfile.available(image_format):
+        raise Http404("Формат не поддерживается")
+    profile = rendition_profile(width, image_format)
+    content_type = profile.content_type
+
+    # Версия водяного знака входит и в ETag, и в ключ кэша: после замены
+    # watermark.png старые копии просто перестают запрашиваться и вытесняются
+    def make_etag(version):
+        return f'"{source_hash}-{version}-{width}-{image_format}-q{profile.quality}"'
+
+    # Режим знака задан моделью фото, но все части ETag известны и без базы:
+    # совпадение с ETag любого режима — это копия, выданная раньше по этому
+    # адресу, и 304 отвечаем, не трогая ни базу, ни диск
+    if_none_match = parse_etags(request.headers.get('If-None-Match', ''))
+    for mode in WatermarkProcessor.MODES + (WatermarkProcessor.AUTO,):
+        etag = make_etag(WatermarkProcessor.fingerprint(mode=mode))
+        if etag in if_none_match:
+            return HttpResponseNotModified(headers={'ETag': etag, 'Cache-Control': RENDITION_CACHE_CONTROL})
+
+    image = find_image_by_source_hash(source_hash)
+    if image is None:
+        raise Http404("Фото не найдено")
+
+    version = WatermarkProcessor.fingerprint(mode=image.watermark_mode)
+    etag = make_etag(version)
+    headers = {'ETag': etag, 'Cache-Control': RENDITION_CACHE_CONTROL}
+    if '*' in if_none_match:
+        return HttpResponseNotModified(headers=headers)
+
+    key = f"{width}/{source_hash}-{version}-q{profile.quality}.{extension}"
+    path = rendition_cache.get(key)
+    response = None
+    if path is not None:
+        try:
+            response = FileResponse(open(path, 'rb'), content_type=content_type)
+        except FileNotFoundError:
+            # Файл вытеснили между проверкой и открытием — создадим заново
+            pass
+
+    if response is None:
+        with image.original.open('rb') as original:
+            content = render_rendition(original, width, profile, image.watermark_mode)
+        rendition_cache.put(key, content)
+        response = HttpResponse(content, content_type=content_type)
+
+    for header, value in headers.items():
+        response[header] = value
+    return response
+
+
+class BulkImageUploadView(APIView):
+    """
+    Загрузка нескольких фото одним multipart-запросом (поле files).
+    Файлы пишутся во временный каталог, а не в память, и обрабатываются
+    параллельно; в разделах задаются image_model, parent_model и parent_field.
+    """
+    permission_classes = [permissions.IsAdminUser]
+    parser_classes = [MultiPartParser]
+    image_model = None
+    parent_model = None
+    parent_field = None
+
+    def initialize_request(self, request, *args, **kwargs):
+        # Обработчики загрузки меняются до того, как кто-либо прочитает тело
+        # запроса (в том числе проверка CSRF в SessionAuthentication)
+        request.upload_handlers = [TemporaryFileUploadHandler(request)]
+        return super().initialize_request(request, *args, **kwargs)
+
+    def post(self, request, pk):
+        parent = get_object_or_404(self.parent_model, pk=pk)
+        uploads = request.FILES.getlist('files')
+        if not uploads:
+            return Response({'error': 'Не переданы файлы (поле files)'}, status=status.HTTP_400_BAD_REQUEST)
+
+        max_files = getattr(settings, 'IMAGE_BULK_MAX_FILES', 50)
+        if len(uploads) > max_files:
+            return Response(
+                {'error': f'Не больше {max_files} файлов за раз'}, status=status.HTTP_400_BAD_REQUEST
+            )
+
+        images, errors = bulk_upload(self.image_model, self.parent_field, parent, uploads)
+        data = {
+            'images': [
+                {'id': image.pk, 'order': image.order, 'image': request.build_absolute_uri(image.image.url)}
+                for image in images
+            ],
+            'errors': [{'file': name, 'error': error} for name, error in errors],
+        }
+        return Response(data, status=status.HTTP_201_CREATED if images else status.HTTP_400_BAD_REQUEST)
+
+
+class ChunkedUploadStartView(APIView):
+    """
+    Начало загрузки фото по частям: POST {filename, size, checksum (SHA-256 hex)}.
+    Дальше части отправляются PUT на /api/uploads/<id>/ с заголовком
+    Upload-Offset, а после последней — POST /api/uploads/<id>/finalize/.
+    В разделах задаются image_model и parent_model.
+    """
+    permission_classes = [permissions.IsAdminUser]
+    image_model = None
+    parent_model = None
+
+    def post(self, request, pk):
+        parent = get_object_or_404(self.parent_model, pk=pk)
+        filename = request.data.get('filename')
+        checksum = str(request.data.get('checksum', ''))
+        try:
+            size = int(request.data.get('size'))
+        except (TypeError, ValueError):
+            size = 0
+
+        max_size = getattr(settings, 'UPLOAD_MAX_SIZE', 64 * 1024 * 1024)
+        if not filename or not 0 < size <= max_size:
+            return Response(
+                {'error': f'Укажите имя файла и размер от 1 до {max_size} байт'},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        if len(checksum) != 64 or any(c not in '0123456789abcdef' for c in checksum.lower()):
+            return Response({'error': 'checksum — SHA-256 файла в hex'}, status=status.HTTP_400_BAD_REQUEST)
+
+        UploadSession.purge_expired()
+        session = UploadSession.start(self.image_model, parent, filename, size, checksum)
+        return Response(upload_session_data(session), status=status.HTTP_201_CREATED)
+
+
+def upload_session_data(session):
+    return {
+        'id': str(session.pk),
+        'offset': session.offset,
+        'size': session.size,
+        'status': session.status,
+        'chunk_size': getattr(settings, 'UPLOAD_CHUNK_SIZE', 4 * 1024 * 1024),
+        'image_id': session.image_id,
+    }
+
+
+class ChunkedUploadView(APIView):
+    """GET — сколько байт уже получено (для продолжения), PUT — очередная часть"""
+    permission_classes = [permissions.IsAdminUser]
+
+    def get(self, request, upload_id):
+        session = get_object_or_404(UploadSession, pk=upload_id)
+        return Response(upload_session_data(session))
+
+    def put(self, request, upload_id):
+        session = get_object_or_404(UploadSession, pk=upload_id)
+        if session.status != 'uploading':
+            return Response(upload_session_data(session), status=status.HTTP_409_CONFLICT)
+        try:
+            offset = int(request.headers['Upload-Offset'])
+        except (KeyError, ValueError):
+            return Response({'error': 'Нужен заголовок Upload-Offset'}, status=status.HTTP_400_BAD_REQUEST)
+
+        # Тело читаем потоком прямо в файл, а не в память
+        stream = request.stream or io.BytesIO()
+        try:
+            new_offset = session.write_chunk(
+                offset, stream, getattr(settings, 'UPLOAD_CHUNK_SIZE', 4 * 1024 * 1024)
+            )
+        except ValueError as e:
+            return Response({'error': str(e)}, status=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE)
+
+        if new_offset is None:
+            # Часть уже получена или пришла не по порядку — клиент продолжит с offset
+            return Response(upload_session_data(session), status=status.HTTP_409_CONFLICT)
+        return Response(upload_session_data(session))
+
+
+class ChunkedUploadFinalizeView(APIView):
+    permission_classes = [permissions.IsAdminUser]
+
+    def post(self, request, upload_id):
+        session = get_object_or_404(UploadSession, pk=upload_id)
+        if session.status == 'complete':
+            # Повтор после оборванного ответа — фото уже создано
+            return Response(upload_session_data(session))
+        if session.status != 'uploading':
+            return Response(upload_session_data(session), status=status.HTTP_409_CONFLICT)
+
+        try:
+            image = session.finalize()
+        except ValueError as e:
+            return Response({'error': str(e), **upload_session_data(session)}, status=status.HTTP_400_BAD_REQUEST)
+        if image is None:
+            # Одновременный повтор уже завершает сессию — отдаём её состояние
+            code = status.HTTP_200_OK if session.status == 'complete' else status.HTTP_409_CONFLICT
+            return Response(upload_session_data(session), status=code)
+        return Response(upload_session_data(session), status=status.HTTP_201_CREATED)
+
+
+def parse_availability_query(item, sections):
+    """{type, id, start, end} -> (раздел, id, начало, конец) или текст ошибки"""
+    if not isinstance(item, dict):
+        return 'Ожидается объект {type, id, start, end}'
+    if item.get('type') not in sections:
+        return f"Неизвестный тип; допустимые: {', '.join(sorted(sections))}"
+    try:
+        resource_id = int(item.get('id'))
+        start = datetime.strptime(str(item.get('start')), '%Y-%m-%d').date()
+        end = datetime.strptime(str(item.get('end')), '%Y-%m-%d').date()
+    except (TypeError, ValueError):
+        return 'Укажите id и даты start, end в формате YYYY-MM-DD'
+    if end < start:
+        return 'Дата окончания раньше даты начала'
+    return item['type'], resource_id, start, end
+
+
+class BatchAvailabilityView(APIView):
+    """
+    Доступность многих объектов разных разделов за один запрос:
+    POST [{"type": "car", "id": 1, "start": "2025-07-01", "end": "2025-07-05"}, ...]
+    (или {"items": [...]}). Ответ — {"results": {"0": {...}, ...}} по номерам
+    в запросе. На каждый раздел два запроса к базе — объекты и их занятые дни
+    (core.occupancy.busy_queries), сколько бы проверок ни пришло.
+    """
+
+    def post(self, request):
+        items = request.data.get('items') if isinstance(request.data, dict) else request.data
+        max_items = getattr(settings, 'AVAILABILITY_BATCH_MAX_ITEMS', 200)
+        if not isinstance(items, list) or not items:
+            return Response(
+                {'error': 'Передайте список проверок [{type, id, start, end}, ...]'},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        if len(items) > max_items:
+            return Response(
+                {'error': f'Не больше {max_items} проверок за запрос'}, status=status.HTTP_400_BAD_REQUEST
+            )
+
+        sections = {engine.resource_field: engine for engine in engines()}
+        results = {}
+        queries = defaultdict(list)  # раздел -> [(номер в запросе, id, начало, конец), ...]
+        for number, item in enumerate(items):
+            parsed = parse_availability_query(item, sections)
+            if isinstance(parsed, str):
+                results[str(number)] = {'error': parsed}
+            else:
+                resource_type, resource_id, start, end = parsed
+                queries[resource_type].append((number, resource_id, start, end))
+
+        for resource_type, section_queries in queries.items():
+            engine = sections[resource_type]
+            resource_model = engine.booking_model._meta.get_field(engine.resource_field).related_model
+            resource_statuses = dict(resource_model.objects.filter(
+                id__in={resource_id for _, resource_id, _, _ in section_queries}
+            ).values_list('id', 'status'))
+            found = [query for query in section_queries if query[1] in resource_statuses]
+            busy = {found[i][0] for i in busy_queries(resource_type, [query[1:] for query in found])}
+
+            for number, resource_id, start, end in section_queries:
+                result = {'type': resource_type, 'id': resource_id}
+                if resource_id not in resource_statuses:
+                    result['error'] = 'Объект не найден'
+                else:
+                    result['is_available'] = number not in busy and resource_statuses[resource_id] == 'available'
+                    result['message'] = 'Свободен' if result['is_available'] else 'Занят на указанные даты'
+                results[str(number)] = result
+
+        return Response({'results': {str(number): results[str(number)] for number in range(len(items))}})
+
+
+class FreeWindowsView(APIView):
+    """
+    Ближайшие свободные даты объекта: GET ?days=<длина брони>[&start_date=
+    YYYY-MM-DD][&horizon=<дней вперёд>][&limit=<сколько вариантов>].
+    Каждый вариант — свободный промежуток, куда помещается бронь на days
+    дней: start_date и end_date первой такой брони и free_until — последний
+    свободный день промежутка (в пределах горизонта).
+    В разделах задаётся booking_model.
+    """
+    booking_model = None
+    default_horizon = 90
+    max_horizon = 365
+    default_limit = 3
+    max_limit = 10
+
+    def get(self, request, pk):
+        engine = availability(self.booking_model)
+        resource_model = self.booking_model._meta.get_field(engine.resource_field).related_model
+        resource = get_object_or_404(resource_model, pk=pk)
+
+        try:
+            days = int(request.query_params.get('days', ''))
+            horizon = int(request.query_params.get('horizon', self.default_horizon))
+            limit = int(request.query_params.get('limit', self.default_limit))
+            start_date = request.query_params.get('start_date')
+            start = datetime.strptime(start_date, '%Y-%m-%d').date() if start_date else timezone.now().date()
+        except ValueError:
+            return Response(
+                {'error': 'Укажите days числом и start_date в формате YYYY-MM-DD'},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        if not 1 <= days <= horizon <= self.max_horizon or not 1 <= limit <= self.max_limit:
+            return Response(
+                {'error': f'Нужно 1 ≤ days ≤ horizon ≤ {self.max_horizon} и 1 ≤ limit ≤ {self.max_limit}'},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+
+        end = start + timedelta(days=horizon - 1)
+        windows = []
+        if resource.status == 'available':
+            windows = engine.free_windows(resource.pk, days, start, end, limit)
+
+        return Response({
+            'id': resource.pk,
+            'days': days,
+            'windows': [
+                {'start_date': first, 'end_date': first + timedelta(days=days - 1), 'free_until': last}
+                for first, last in windows
+            ],
+            'message': 'Есть свободные даты' if windows else 'Нет свободных дат на указанный период',
+        })
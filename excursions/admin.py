@@ -8,8 +8,8 @@ from .models import ExcursionCategory, ExcursionFeature, Excursion, ExcursionIma
 class ExcursionImageInline(admin.TabularInline):
     model = ExcursionImage
     extra = 1
-    fields = ['image', 'order', 'image_preview']
-    readonly_fields = ['image_preview']
+    fields = ['image', 'order', 'processing_status', 'image_preview']
+    readonly_fields = ['processing_status', 'image_preview']
     
     def image_preview(self, obj):
         if obj.image:
@@ -74,9 +74,9 @@ class ExcursionAdmin(ModelAdmin):
 
 @admin.register(ExcursionImage)
 class ExcursionImageAdmin(ModelAdmin):
-    list_display = ['excursion', 'order', 'image_preview']
+    list_display = ['excursion', 'order', 'processing_status', 'possible_duplicate', 'image_preview']
     list_editable = ['order']
-    list_filter = ['excursion']
+    list_filter = ['excursion', 'processing_status', 'possible_duplicate']
     list_per_page = 20
     
     @display(description="Изображение")
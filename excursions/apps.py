@@ -4,3 +4,8 @@ from django.apps import AppConfig
 class ExcursionsConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'excursions'
+
+    def ready(self):
+        from core.availability import register
+        from .models import ExcursionBooking
+        register(ExcursionBooking, 'excursion')
@@ -0,0 +1,18 @@
+# Generated by Django 5.1.2 on 2026-10-17 06:31
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('excursions', '0010_excursionimage_perceptual_hash_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='excursionimage',
+            name='placeholder',
+            field=models.TextField(blank=True, editable=False, verbose_name='Превью-заглушка'),
+        ),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 5.1.2 on 2026-10-17 06:48
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('excursions', '0011_excursionimage_placeholder'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='excursionbooking',
+            index=models.Index(fields=['excursion', 'status', 'start_date', 'end_date'], name='exc_booking_avail_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='excursionbooking',
+            index=models.Index(fields=['status', 'end_date', 'start_date', 'excursion'], name='exc_booking_search_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='excursionbooking',
+            index=models.Index(fields=['telegram_id'], name='exc_booking_telegram_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='excursionbooking',
+            index=models.Index(fields=['created_at'], name='exc_booking_created_idx'),
+        ),
+    ]
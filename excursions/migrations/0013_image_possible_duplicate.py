@@ -0,0 +1,18 @@
+# Generated by Django 5.1.2 on 2026-10-17 07:15
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('excursions', '0012_booking_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='excursionimage',
+            name='possible_duplicate',
+            field=models.BooleanField(default=False, editable=False, verbose_name='Похоже на другое фото'),
+        ),
+    ]
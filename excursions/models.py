@@ -1,11 +1,11 @@
-from django.db import models
+from django.db import models, transaction
 from django.contrib.auth.models import User
 from django.utils import timezone
 from PIL import Image, ImageDraw, ImageFont
 import os
 from django.core.files.base import ContentFile
 import io
-from watermark import WatermarkProcessor
+from core.models import WatermarkedImage
 
 
 
@@ -112,9 +112,9 @@ class ExcursionWatermark:
             print(f"Error adding watermark: {e}")
             return None
 
-class ExcursionImage(models.Model):
+class ExcursionImage(WatermarkedImage):
     excursion = models.ForeignKey(Excursion, related_name='images', on_delete=models.CASCADE)
-    image = models.ImageField(upload_to='excursions/images/')
+    image = models.ImageField(upload_to='excursions/images/', blank=True)
     order = models.IntegerField(default=0, verbose_name="Порядок")
     
     class Meta:
@@ -124,25 +124,6 @@ class ExcursionImage(models.Model):
     
     def __str__(self):
         return f"Фото {self.excursion.title}"
-    
-    def save(self, *args, **kwargs):
-        if not self.pk:
-            super().save(*args, **kwargs)
-        
-        if self.image:
-            try:
-                watermarked_image = WatermarkProcessor.add_watermark(self.image.path)
-                if watermarked_image:
-                    self.image.save(
-                        os.path.basename(self.image.name),
-                        watermarked_image,
-                        save=False
-                    )
-            except Exception as e:
-                print(f"Error processing watermark for excursion image: {e}")
-        
-        super().save(*args, **kwargs)
-
 
 class ExcursionBooking(models.Model):
     STATUS_CHOICES = [
@@ -167,6 +148,16 @@ class ExcursionBooking(models.Model):
     class Meta:
         verbose_name = "Бронирование экскурсии"
         verbose_name_plural = "Бронирования экскурсий"
+        indexes = [
+            # Проверка конкретного объекта и фильтры по статусу
+            models.Index(fields=['excursion', 'status', 'start_date', 'end_date'], name='exc_booking_avail_idx'),
+            # Поиск свободных объектов на даты: после статуса — конец брони,
+            # чтобы прошедшие брони отсекались по индексу. Частичный индекс
+            # (WHERE status IN ...) SQLite не применяет к запросам с параметрами
+            models.Index(fields=['status', 'end_date', 'start_date', 'excursion'], name='exc_booking_search_idx'),
+            models.Index(fields=['telegram_id'], name='exc_booking_telegram_idx'),
+            models.Index(fields=['created_at'], name='exc_booking_created_idx'),
+        ]
     
     def __str__(self):
         return f"{self.excursion.title} - {self.client_name} ({self.start_date} - {self.end_date})"
@@ -188,4 +179,6 @@ class ExcursionBooking(models.Model):
     def save(self, *args, **kwargs):
         if not self.total_price:
             self.total_price = self.calculate_total_price()
-        super().save(*args, **kwargs)
+        # Бронь и её занятые дни (пишет сигнал post_save) фиксируются вместе
+        with transaction.atomic():
+            super().save(*args, **kwargs)
@@ -1,4 +1,8 @@
 from rest_framework import serializers
+
+from core.availability import availability
+from core.booking import BookingConflict, create_booking
+from core.serializers import FirstImageMixin
 from .models import ExcursionCategory, ExcursionFeature, Excursion, ExcursionImage, ExcursionBooking
 
 class ExcursionCategorySerializer(serializers.ModelSerializer):
@@ -57,14 +61,7 @@ class CreateExcursionBookingSerializer(serializers.ModelSerializer):
             raise serializers.ValidationError("Дата окончания должна быть позже даты начала")
         
         excursion = data['excursion']
-        conflicting_bookings = ExcursionBooking.objects.filter(
-            excursion=excursion,
-            status__in=['confirmed', 'active', 'pending'],
-            start_date__lte=end_date,
-            end_date__gte=start_date
-        )
-        
-        if conflicting_bookings.exists():
+        if not availability(ExcursionBooking).is_available(excursion.id, start_date, end_date):
             raise serializers.ValidationError("На выбранные даты экскурсия уже забронирована")
         
         return data
@@ -81,36 +78,35 @@ class CreateExcursionBookingSerializer(serializers.ModelSerializer):
         total_days = (end_date - start_date).days + 1
         total_price = total_days * excursion.price_per_person
         
-        booking = ExcursionBooking.objects.create(
-            excursion=excursion,
-            telegram_id=telegram_id,
-            start_date=start_date,
-            end_date=end_date,
-            client_name=client_name,
-            phone_number=phone_number,
-            comment=comment,
-            total_price=total_price,
-            status='pending'
-        )
+        try:
+            booking = create_booking(
+                ExcursionBooking,
+                excursion=excursion,
+                telegram_id=telegram_id,
+                start_date=start_date,
+                end_date=end_date,
+                client_name=client_name,
+                phone_number=phone_number,
+                comment=comment,
+                total_price=total_price,
+                status='pending'
+            )
+        except BookingConflict:
+            # Даты заняли между проверкой и сохранением
+            raise serializers.ValidationError("На выбранные даты экскурсия уже забронирована")
         
         return booking
     
-class ExcursionListSerializer(serializers.ModelSerializer):
+class ExcursionListSerializer(FirstImageMixin, serializers.ModelSerializer):
     """Сериализатор для списка экскурсий (карточек)"""
     category_title = serializers.CharField(source='category.title', read_only=True)
     features = ExcursionFeatureSerializer(many=True, read_only=True)
-    first_image = serializers.SerializerMethodField()
     price_per_person = serializers.IntegerField()
     
     class Meta:
         model = Excursion
         fields = [
             'id', 'title', 'category_title', 'days', 'price_per_person',
-            'status', 'features', 'first_image'
+            'status', 'features', 'first_image', 'first_image_srcset',
+            'first_image_placeholder'
         ]
-    
-    def get_first_image(self, obj):
-        first_image = obj.images.first()
-        if first_image and first_image.image:
-            return self.context['request'].build_absolute_uri(first_image.image.url)
-        return None
\ No newline at end of file
@@ -1,3 +1,57 @@
+from datetime import date
+
 from django.test import TestCase
+from django.urls import reverse
+
+from .models import Excursion, ExcursionBooking, ExcursionCategory, ExcursionFeature
+
+
+class AvailableExcursionsTests(TestCase):
+    def setUp(self):
+        self.category = ExcursionCategory.objects.create(title="Горы")
+        self.feature = ExcursionFeature.objects.create(title="Гид")
+
+    def make_excursions(self, count):
+        excursions = []
+        for i in range(count):
+            excursion = Excursion.objects.create(title=f"Экскурсия {i}", category=self.category, price_per_person=50)
+            excursion.features.add(self.feature)
+            excursions.append(excursion)
+        return excursions
+
+    def book(self, excursion, start, end, status='confirmed'):
+        return ExcursionBooking.objects.create(
+            excursion=excursion, telegram_id='1', start_date=start, end_date=end,
+            client_name="Иван", phone_number="+996", status=status, total_price=50,
+        )
+
+    def search(self):
+        return self.client.get(reverse('available-excursions'), {'start_date': '2025-07-10', 'end_date': '2025-07-12'})
+
+    def test_booked_excursions_are_excluded(self):
+        free, booked, cancelled = self.make_excursions(3)
+        self.book(booked, date(2025, 7, 12), date(2025, 7, 14))
+        self.book(cancelled, date(2025, 7, 9), date(2025, 7, 11), status='cancelled')
+        self.book(free, date(2025, 7, 1), date(2025, 7, 9))
+
+        response = self.search()
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual({item['id'] for item in response.json()}, {free.id, cancelled.id})
+        self.assertEqual(response.json()[0]['category_title'], "Горы")
+        self.assertEqual(response.json()[0]['features'][0]['title'], "Гид")
+
+    def test_query_count_does_not_grow_with_catalog(self):
+        # Экскурсии, особенности и фото — по одному запросу, сколько бы экскурсий ни было
+        self.make_excursions(2)
+        with self.assertNumQueries(3):
+            self.assertEqual(len(self.search().json()), 2)
+
+        self.make_excursions(20)
+        with self.assertNumQueries(3):
+            self.assertEqual(len(self.search().json()), 22)
 
-# Create your tests here.
+    def test_invalid_dates(self):
+        url = reverse('available-excursions')
+        self.assertEqual(self.client.get(url, {'start_date': '2025-07-10', 'end_date': 'завтра'}).status_code, 400)
+        self.assertEqual(self.client.get(url, {'start_date': '2025-07-10', 'end_date': '2025-07-10'}).status_code, 400)
@@ -10,8 +10,11 @@ router.register(r'bookings', views.ExcursionBookingViewSet, basename='excursion-
 
 urlpatterns = [
     path('', include(router.urls)),
+    path('<int:pk>/images/bulk/', views.ExcursionImagesBulkUploadView.as_view(), name='excursion-images-bulk'),
+    path('<int:pk>/images/uploads/', views.ExcursionImageUploadView.as_view(), name='excursion-images-upload'),
     path('available-excursions/', views.AvailableExcursionsView.as_view(), name='available-excursions'),
     path('excursion-availability/<int:excursion_id>/', views.ExcursionAvailabilityView.as_view(), name='excursion-availability'),
+    path('excursion-free-windows/<int:pk>/', views.ExcursionFreeWindowsView.as_view(), name='excursion-free-windows'),
     path('excursion-booking-calendar/', views.ExcursionBookingCalendarView.as_view(), name='excursion-booking-calendar'),
     
     # Новые endpoints для карточек
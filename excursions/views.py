@@ -3,11 +3,15 @@ from rest_framework.decorators import action
 from rest_framework.response import Response
 from rest_framework.views import APIView
 from django_filters.rest_framework import DjangoFilterBackend
-from django.utils import timezone
-from datetime import datetime, timedelta
-from django.db.models import Q
+from datetime import datetime
+from django.db.models import Exists, OuterRef, Q
 
-from .models import ExcursionCategory, ExcursionFeature, Excursion, ExcursionBooking
+from core.availability import availability
+from core.calendar import bookings_by_day, month_range
+from core.idempotency import IdempotentCreateMixin
+from core.occupancy import occupied
+from core.views import BulkImageUploadView, ChunkedUploadStartView, FreeWindowsView
+from .models import ExcursionCategory, ExcursionFeature, Excursion, ExcursionBooking, ExcursionImage
 from .serializers import ExcursionCategorySerializer, ExcursionFeatureSerializer, ExcursionSerializer, ExcursionBookingSerializer, CreateExcursionBookingSerializer, ExcursionListSerializer
 
 class ExcursionCategoryViewSet(viewsets.ModelViewSet):
@@ -72,7 +76,7 @@ class ExcursionViewSet(viewsets.ModelViewSet):
             status=status.HTTP_400_BAD_REQUEST
         )
 
-class ExcursionBookingViewSet(viewsets.ModelViewSet):
+class ExcursionBookingViewSet(IdempotentCreateMixin, viewsets.ModelViewSet):
     queryset = ExcursionBooking.objects.all()
     
     def get_serializer_class(self):
@@ -98,40 +102,32 @@ class AvailableExcursionsView(APIView):
         start_date = request.query_params.get('start_date')
         end_date = request.query_params.get('end_date')
         
-        excursions = Excursion.objects.filter(status='available')
+        # Категория, особенности и фото загружаются для всех экскурсий сразу,
+        # а не отдельными запросами для каждой
+        excursions = Excursion.objects.filter(status='available').select_related(
+            'category'
+        ).prefetch_related('features', 'images')
         
         if start_date and end_date:
             try:
                 start = datetime.strptime(start_date, '%Y-%m-%d').date()
                 end = datetime.strptime(end_date, '%Y-%m-%d').date()
-                
-                if end <= start:
-                    return Response(
-                        {'error': 'Дата окончания должна быть позже даты начала'}, 
-                        status=status.HTTP_400_BAD_REQUEST
-                    )
-                
-                available_excursions = []
-                for excursion in excursions:
-                    # Проверяем доступность для каждой экскурсии
-                    conflicting_bookings = ExcursionBooking.objects.filter(
-                        excursion=excursion,
-                        status__in=['confirmed', 'active', 'pending'],
-                        start_date__lte=end,
-                        end_date__gte=start
-                    )
-                    
-                    if not conflicting_bookings.exists():
-                        excursion_data = ExcursionSerializer(excursion).data
-                        available_excursions.append(excursion_data)
-                
-                return Response(available_excursions)
-                
             except ValueError:
                 return Response(
                     {'error': 'Неверный формат даты. Используйте YYYY-MM-DD'}, 
                     status=status.HTTP_400_BAD_REQUEST
                 )
+            
+            if end <= start:
+                return Response(
+                    {'error': 'Дата окончания должна быть позже даты начала'}, 
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+            
+            # Экскурсии без занятых дней в [start, end] — одним запросом
+            # (NOT EXISTS по индексу таблицы занятости)
+            booked_days = occupied('excursion', start, end).filter(resource_id=OuterRef('pk'))
+            excursions = excursions.filter(~Exists(booked_days))
         
         serializer = ExcursionSerializer(excursions, many=True)
         return Response(serializer.data)
@@ -161,15 +157,12 @@ class ExcursionAvailabilityView(APIView):
                         'error': 'Дата окончания должна быть позже даты начала'
                     }, status=status.HTTP_400_BAD_REQUEST)
                 
-                # Проверяем конфликтующие бронирования
-                conflicting_bookings = ExcursionBooking.objects.filter(
-                    excursion=excursion,
-                    status__in=['confirmed', 'active', 'pending'],
-                    start_date__lte=end,
-                    end_date__gte=start
-                )
+                # Проверяем конфликтующие бронирования: пересечения ищем в индексе
+                # занятости, из базы читаем только найденные брони
+                conflicting_ids = availability(ExcursionBooking).conflicts(excursion.id, start, end)
+                conflicting_bookings = ExcursionBooking.objects.filter(id__in=conflicting_ids)
                 
-                is_available = not conflicting_bookings.exists() and excursion.status == 'available'
+                is_available = not conflicting_ids and excursion.status == 'available'
                 
                 return Response({
                     'excursion_id': excursion.id,
@@ -195,91 +188,56 @@ class ExcursionBookingCalendarView(APIView):
     
     def get(self, request):
         excursion_id = request.query_params.get('excursion_id')
-        month = request.query_params.get('month')
-        year = request.query_params.get('year')
         
         try:
-            if month and year:
-                target_month = int(month)
-                target_year = int(year)
-                start_date = datetime(target_year, target_month, 1).date()
-                if target_month == 12:
-                    end_date = datetime(target_year + 1, 1, 1).date()
-                else:
-                    end_date = datetime(target_year, target_month + 1, 1).date()
-            else:
-                # По умолчанию текущий месяц
-                today = timezone.now().date()
-                start_date = datetime(today.year, today.month, 1).date()
-                if today.month == 12:
-                    end_date = datetime(today.year + 1, 1, 1).date()
-                else:
-                    end_date = datetime(today.year, today.month + 1, 1).date()
+            start_date, end_date = month_range(
+                request.query_params.get('month'), request.query_params.get('year')
+            )
             
-            # Получаем бронирования
+            # Получаем бронирования одним запросом вместе с экскурсиями
+            # (бронь, закончившаяся 1-го числа, этот день тоже занимает)
             bookings_query = ExcursionBooking.objects.filter(
                 status__in=['confirmed', 'active', 'pending'],
                 start_date__lt=end_date,
-                end_date__gt=start_date
-            )
+                end_date__gte=start_date
+            ).select_related('excursion')
             
             if excursion_id:
                 excursion_id = int(excursion_id)
                 bookings_query = bookings_query.filter(excursion_id=excursion_id)
+                excursions = list(Excursion.objects.filter(id=excursion_id))
+            else:
+                excursions = list(Excursion.objects.filter(status='available'))
+            
+            def describe(booking):
+                return {
+                    'id': booking.id,
+                    'excursion_id': booking.excursion_id,
+                    'excursion': booking.excursion.title,
+                    'client_name': booking.client_name,
+                    'telegram_id': booking.telegram_id,
+                    'status': booking.status,
+                    'period': f"{booking.start_date} - {booking.end_date}",
+                    'total_days': booking.total_days
+                }
             
             # Создаем календарь с периодами бронирования
             calendar_data = []
-            current_date = start_date
-            
-            while current_date < end_date:
-                # Находим бронирования на эту дату
-                date_bookings = []
-                
-                for booking in bookings_query:
-                    if booking.start_date <= current_date <= booking.end_date:
-                        date_bookings.append({
-                            'id': booking.id,
-                            'excursion': booking.excursion.title,
-                            'client_name': booking.client_name,
-                            'user': booking.user.username,
-                            'status': booking.status,
-                            'period': f"{booking.start_date} - {booking.end_date}",
-                            'total_days': booking.total_days,
-                            'participants': booking.participants
-                        })
-                
+            for day, day_bookings in bookings_by_day(list(bookings_query), start_date, end_date, describe):
                 # Проверяем доступность для каждой экскурсии
-                excursions_availability = []
-                if excursion_id:
-                    # Если указана конкретная экскурсия
-                    try:
-                        excursion = Excursion.objects.get(id=excursion_id)
-                        is_available = not any(b['excursion'] == excursion.title for b in date_bookings)
-                        excursions_availability.append({
-                            'excursion_id': excursion.id,
-                            'excursion_title': excursion.title,
-                            'is_available': is_available
-                        })
-                    except Excursion.DoesNotExist:
-                        pass
-                else:
-                    # Все экскурсии
-                    excursions = Excursion.objects.filter(status='available')
-                    for excursion in excursions:
-                        is_available = not any(b['excursion'] == excursion.title for b in date_bookings)
-                        excursions_availability.append({
+                booked_ids = {booking['excursion_id'] for booking in day_bookings}
+                calendar_data.append({
+                    'date': day,
+                    'bookings': day_bookings,
+                    'excursions_availability': [
+                        {
                             'excursion_id': excursion.id,
                             'excursion_title': excursion.title,
-                            'is_available': is_available
-                        })
-                
-                calendar_data.append({
-                    'date': current_date,
-                    'bookings': date_bookings,
-                    'excursions_availability': excursions_availability
+                            'is_available': excursion.id not in booked_ids
+                        }
+                        for excursion in excursions
+                    ]
                 })
-                
-                current_date += timedelta(days=1)
             
             return Response({
                 'period': {
@@ -328,4 +286,22 @@ class ExcursionFeaturesView(APIView):
     def get(self, request):
         features = ExcursionFeature.objects.all()
         serializer = ExcursionFeatureSerializer(features, many=True)
-        return Response(serializer.data)
\ No newline at end of file
+        return Response(serializer.data)
+
+
+class ExcursionImagesBulkUploadView(BulkImageUploadView):
+    """Массовая загрузка фотографий экскурсии (только для администраторов)"""
+    image_model = ExcursionImage
+    parent_model = Excursion
+    parent_field = 'excursion'
+
+
+class ExcursionImageUploadView(ChunkedUploadStartView):
+    """Начало загрузки фото экскурсии по частям (только для администраторов)"""
+    image_model = ExcursionImage
+    parent_model = Excursion
+
+
+class ExcursionFreeWindowsView(FreeWindowsView):
+    """Ближайшие свободные даты экскурсии на нужное число дней"""
+    booking_model = ExcursionBooking
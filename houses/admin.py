@@ -8,8 +8,8 @@ from .models import HouseCategory, HouseFeature, House, HouseImage, HouseBooking
 class HouseImageInline(admin.TabularInline):
     model = HouseImage
     extra = 1
-    fields = ['image', 'order', 'image_preview']
-    readonly_fields = ['image_preview']
+    fields = ['image', 'order', 'processing_status', 'image_preview']
+    readonly_fields = ['processing_status', 'image_preview']
     
     def image_preview(self, obj):
         if obj.image:
@@ -77,9 +77,9 @@ class HouseAdmin(ModelAdmin):
 
 @admin.register(HouseImage)
 class HouseImageAdmin(ModelAdmin):
-    list_display = ['house', 'order', 'image_preview']
+    list_display = ['house', 'order', 'processing_status', 'possible_duplicate', 'image_preview']
     list_editable = ['order']
-    list_filter = ['house']
+    list_filter = ['house', 'processing_status', 'possible_duplicate']
     list_per_page = 20
     
     @display(description="Изображение")
@@ -4,3 +4,8 @@ from django.apps import AppConfig
 class HousesConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'houses'
+
+    def ready(self):
+        from core.availability import register
+        from .models import HouseBooking
+        register(HouseBooking, 'house')
@@ -0,0 +1,23 @@
+# Generated by Django 5.1.2 on 2026-10-17 06:18
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('houses', '0005_houseimage_processing_status'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='houseimage',
+            name='processed_hash',
+            field=models.CharField(blank=True, max_length=64, verbose_name='Хэш результата'),
+        ),
+        migrations.AddField(
+            model_name='houseimage',
+            name='source_hash',
+            field=models.CharField(blank=True, db_index=True, max_length=64, verbose_name='Хэш исходника'),
+        ),
+    ]
@@ -0,0 +1,25 @@
+# Generated by Django 5.1.2 on 2026-10-17 06:20
+
+import core.models
+import core.storage
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('houses', '0006_houseimage_processed_hash_houseimage_source_hash'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='houseimage',
+            name='original',
+            field=models.FileField(blank=True, editable=False, storage=core.storage.originals_storage, upload_to=core.models.original_upload_to, verbose_name='Оригинал'),
+        ),
+        migrations.AddField(
+            model_name='houseimage',
+            name='watermark_version',
+            field=models.CharField(blank=True, max_length=16, verbose_name='Версия водяного знака'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.1.2 on 2026-10-17 06:31
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('houses', '0010_houseimage_perceptual_hash_houseimage_phash_band0_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='houseimage',
+            name='placeholder',
+            field=models.TextField(blank=True, editable=False, verbose_name='Превью-заглушка'),
+        ),
+    ]
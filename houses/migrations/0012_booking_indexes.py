@@ -0,0 +1,29 @@
+# Generated by Django 5.1.2 on 2026-10-17 06:48
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('houses', '0011_houseimage_placeholder'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='housebooking',
+            index=models.Index(fields=['house', 'status', 'start_date', 'end_date'], name='house_booking_avail_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='housebooking',
+            index=models.Index(fields=['status', 'end_date', 'start_date', 'house'], name='house_booking_search_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='housebooking',
+            index=models.Index(fields=['telegram_id'], name='house_booking_telegram_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='housebooking',
+            index=models.Index(fields=['created_at'], name='house_booking_created_idx'),
+        ),
+    ]
@@ -1,11 +1,11 @@
-from django.db import models
+from django.db import models, transaction
 from django.contrib.auth.models import User
 from django.utils import timezone
 from PIL import Image, ImageDraw, ImageFont
 import os
 from django.core.files.base import ContentFile
 import io
-from watermark import WatermarkProcessor
+from core.models import WatermarkedImage
 class HouseCategory(models.Model):
     title = models.CharField(max_length=100, verbose_name="Название категории")
     icon = models.FileField(upload_to='house_categories/icons/', verbose_name="Иконка", null=True, blank=True)
@@ -109,11 +109,15 @@ class HouseWatermark:
             print(f"Error adding watermark: {e}")
             return None
 
-class HouseImage(models.Model):
+class HouseImage(WatermarkedImage):
     house = models.ForeignKey(House, related_name='images', on_delete=models.CASCADE)
-    image = models.ImageField(upload_to='houses/images/')
+    image = models.ImageField(upload_to='houses/images/', blank=True)
     order = models.IntegerField(default=0, verbose_name="Порядок")
     
+    # Панорамы и очень большие фото домов — узором (один знак по центру легко
+    # обрезать), обычные фото — одним знаком
+    watermark_mode = 'auto'
+    
     class Meta:
         ordering = ['order']
         verbose_name = "Фотография дома"
@@ -121,25 +125,6 @@ class HouseImage(models.Model):
     
     def __str__(self):
         return f"Фото {self.house.title}"
-    
-    def save(self, *args, **kwargs):
-        if not self.pk:
-            super().save(*args, **kwargs)
-        
-        if self.image:
-            try:
-                watermarked_image = WatermarkProcessor.add_watermark(self.image.path)
-                if watermarked_image:
-                    self.image.save(
-                        os.path.basename(self.image.name),
-                        watermarked_image,
-                        save=False
-                    )
-            except Exception as e:
-                print(f"Error processing watermark for house image: {e}")
-        
-        super().save(*args, **kwargs)
-
 
 class HouseBooking(models.Model):
     STATUS_CHOICES = [
@@ -164,6 +149,16 @@ class HouseBooking(models.Model):
     class Meta:
         verbose_name = "Бронирование дома"
         verbose_name_plural = "Бронирования домов"
+        indexes = [
+            # Проверка конкретного объекта и фильтры по статусу
+            models.Index(fields=['house', 'status', 'start_date', 'end_date'], name='house_booking_avail_idx'),
+            # Поиск свободных объектов на даты: после статуса — конец брони,
+            # чтобы прошедшие брони отсекались по индексу. Частичный индекс
+            # (WHERE status IN ...) SQLite не применяет к запросам с параметрами
+            models.Index(fields=['status', 'end_date', 'start_date', 'house'], name='house_booking_search_idx'),
+            models.Index(fields=['telegram_id'], name='house_booking_telegram_idx'),
+            models.Index(fields=['created_at'], name='house_booking_created_idx'),
+        ]
     
     def __str__(self):
         return f"{self.house.title} - {self.client_name} ({self.start_date} - {self.end_date})"
@@ -185,4 +180,6 @@ class HouseBooking(models.Model):
     def save(self, *args, **kwargs):
         if not self.total_price:
             self.total_price = self.calculate_total_price()
-        super().save(*args, **kwargs)
\ No newline at end of file
+        # Бронь и её занятые дни (пишет сигнал post_save) фиксируются вместе
+        with transaction.atomic():
+            super().save(*args, **kwargs)
\ No newline at end of file
@@ -1,4 +1,8 @@
 from rest_framework import serializers
+
+from core.availability import availability
+from core.booking import BookingConflict, create_booking
+from core.serializers import FirstImageMixin
 from .models import HouseCategory, HouseFeature, House, HouseImage, HouseBooking
 
 class HouseCategorySerializer(serializers.ModelSerializer):
@@ -57,14 +61,7 @@ class CreateHouseBookingSerializer(serializers.ModelSerializer):
             raise serializers.ValidationError("Дата выезда должна быть позже даты заезда")
         
         house = data['house']
-        conflicting_bookings = HouseBooking.objects.filter(
-            house=house,
-            status__in=['confirmed', 'active', 'pending'],
-            start_date__lte=end_date,
-            end_date__gte=start_date
-        )
-        
-        if conflicting_bookings.exists():
+        if not availability(HouseBooking).is_available(house.id, start_date, end_date):
             raise serializers.ValidationError("На выбранные даты дом уже забронирован")
         
         return data
@@ -81,36 +78,35 @@ class CreateHouseBookingSerializer(serializers.ModelSerializer):
         total_days = (end_date - start_date).days + 1
         total_price = total_days * house.price_per_day
         
-        booking = HouseBooking.objects.create(
-            house=house,
-            telegram_id=telegram_id,
-            start_date=start_date,
-            end_date=end_date,
-            client_name=client_name,
-            phone_number=phone_number,
-            comment=comment,
-            total_price=total_price,
-            status='pending'
-        )
+        try:
+            booking = create_booking(
+                HouseBooking,
+                house=house,
+                telegram_id=telegram_id,
+                start_date=start_date,
+                end_date=end_date,
+                client_name=client_name,
+                phone_number=phone_number,
+                comment=comment,
+                total_price=total_price,
+                status='pending'
+            )
+        except BookingConflict:
+            # Даты заняли между проверкой и сохранением
+            raise serializers.ValidationError("На выбранные даты дом уже забронирован")
         
         return booking
     
-class HouseListSerializer(serializers.ModelSerializer):
+class HouseListSerializer(FirstImageMixin, serializers.ModelSerializer):
     """Сериализатор для списка домов (карточек)"""
     category_title = serializers.CharField(source='category.title', read_only=True)
     features = HouseFeatureSerializer(many=True, read_only=True)
-    first_image = serializers.SerializerMethodField()
     price_per_day = serializers.IntegerField()
     
     class Meta:
         model = House
         fields = [
             'id', 'title', 'category_title', 'floors', 'area',
-            'price_per_day', 'deposit', 'status', 'features', 'first_image'
+            'price_per_day', 'deposit', 'status', 'features', 'first_image', 'first_image_srcset',
+            'first_image_placeholder'
         ]
-    
-    def get_first_image(self, obj):
-        first_image = obj.images.first()
-        if first_image and first_image.image:
-            return self.context['request'].build_absolute_uri(first_image.image.url)
-        return None
\ No newline at end of file
@@ -10,8 +10,11 @@ router.register(r'bookings', views.HouseBookingViewSet, basename='house-booking'
 
 urlpatterns = [
     path('', include(router.urls)),
+    path('<int:pk>/images/bulk/', views.HouseImagesBulkUploadView.as_view(), name='house-images-bulk'),
+    path('<int:pk>/images/uploads/', views.HouseImageUploadView.as_view(), name='house-images-upload'),
     path('available-houses/', views.AvailableHousesView.as_view(), name='available-houses'),
     path('house-availability/<int:house_id>/', views.HouseAvailabilityView.as_view(), name='house-availability'),
+    path('house-free-windows/<int:pk>/', views.HouseFreeWindowsView.as_view(), name='house-free-windows'),
     path('house-booking-calendar/', views.HouseBookingCalendarView.as_view(), name='house-booking-calendar'),
     
     # Новые endpoints для карточек
@@ -3,11 +3,14 @@ from rest_framework.decorators import action
 from rest_framework.response import Response
 from rest_framework.views import APIView
 from django_filters.rest_framework import DjangoFilterBackend
-from django.utils import timezone
-from datetime import datetime, timedelta
+from datetime import datetime
 from django.db.models import Q
 
-from .models import HouseCategory, HouseFeature, House, HouseBooking
+from core.availability import availability
+from core.calendar import bookings_by_day, month_range
+from core.idempotency import IdempotentCreateMixin
+from core.views import BulkImageUploadView, ChunkedUploadStartView, FreeWindowsView
+from .models import HouseCategory, HouseFeature, House, HouseBooking, HouseImage
 from .serializers import HouseCategorySerializer, HouseFeatureSerializer, HouseSerializer, HouseBookingSerializer, CreateHouseBookingSerializer, HouseListSerializer
 
 class HouseCategoryViewSet(viewsets.ModelViewSet):
@@ -67,7 +70,7 @@ class HouseViewSet(viewsets.ModelViewSet):
             status=status.HTTP_400_BAD_REQUEST
         )
 
-class HouseBookingViewSet(viewsets.ModelViewSet):
+class HouseBookingViewSet(IdempotentCreateMixin, viewsets.ModelViewSet):
     queryset = HouseBooking.objects.all()
     
     def get_serializer_class(self):
@@ -100,12 +103,8 @@ class AvailableHousesView(APIView):
                 start = datetime.strptime(start_date, '%Y-%m-%d').date()
                 end = datetime.strptime(end_date, '%Y-%m-%d').date()
                 
-                # Исключаем дома с бронированиями на эти даты
-                booked_house_ids = HouseBooking.objects.filter(
-                    status__in=['confirmed', 'active', 'pending'],
-                    start_date__lte=end,
-                    end_date__gte=start
-                ).values_list('house_id', flat=True)
+                # Исключаем дома с бронированиями на эти даты (по индексу занятости)
+                booked_house_ids = availability(HouseBooking).booked_resources(start, end)
                 
                 houses = houses.exclude(id__in=booked_house_ids)
                 
@@ -138,15 +137,12 @@ class HouseAvailabilityView(APIView):
                 start = datetime.strptime(start_date, '%Y-%m-%d').date()
                 end = datetime.strptime(end_date, '%Y-%m-%d').date()
                 
-                # Проверяем конфликтующие бронирования
-                conflicting_bookings = HouseBooking.objects.filter(
-                    house=house,
-                    status__in=['confirmed', 'active', 'pending'],
-                    start_date__lte=end,
-                    end_date__gte=start
-                )
+                # Проверяем конфликтующие бронирования: пересечения ищем в индексе
+                # занятости, из базы читаем только найденные брони
+                conflicting_ids = availability(HouseBooking).conflicts(house.id, start, end)
+                conflicting_bookings = HouseBooking.objects.filter(id__in=conflicting_ids)
                 
-                is_available = not conflicting_bookings.exists() and house.status == 'available'
+                is_available = not conflicting_ids and house.status == 'available'
                 
                 return Response({
                     'house_id': house.id,
@@ -172,81 +168,60 @@ class HouseBookingCalendarView(APIView):
     
     def get(self, request):
         house_id = request.query_params.get('house_id')
-        month = request.query_params.get('month')
-        year = request.query_params.get('year')
         
         try:
-            if month and year:
-                target_month = int(month)
-                target_year = int(year)
-                start_date = datetime(target_year, target_month, 1).date()
-                if target_month == 12:
-                    end_date = datetime(target_year + 1, 1, 1).date()
-                else:
-                    end_date = datetime(target_year, target_month + 1, 1).date()
-            else:
-                # По умолчанию текущий месяц
-                today = timezone.now().date()
-                start_date = datetime(today.year, today.month, 1).date()
-                if today.month == 12:
-                    end_date = datetime(today.year + 1, 1, 1).date()
-                else:
-                    end_date = datetime(today.year, today.month + 1, 1).date()
+            start_date, end_date = month_range(
+                request.query_params.get('month'), request.query_params.get('year')
+            )
             
-            # Получаем бронирования
+            # Получаем бронирования одним запросом вместе с домами
+            # (бронь, закончившаяся 1-го числа, этот день тоже занимает)
             bookings_query = HouseBooking.objects.filter(
                 status__in=['confirmed', 'active', 'pending'],
                 start_date__lt=end_date,
-                end_date__gt=start_date
-            )
+                end_date__gte=start_date
+            ).select_related('house')
             
             if house_id:
                 house_id = int(house_id)
                 bookings_query = bookings_query.filter(house_id=house_id)
+            bookings = list(bookings_query)
             
-            # Создаем календарь с периодами бронирования
-            calendar_data = []
-            current_date = start_date
+            def describe(booking):
+                return {
+                    'id': booking.id,
+                    'house': booking.house.title,
+                    'client_name': booking.client_name,
+                    'telegram_id': booking.telegram_id,
+                    'status': booking.status,
+                    'period': f"{booking.start_date} - {booking.end_date}",
+                    'total_days': booking.total_days
+                }
             
-            while current_date < end_date:
-                # Находим бронирования на эту дату
-                date_bookings = []
-                for booking in bookings_query:
-                    if booking.start_date <= current_date <= booking.end_date:
-                        date_bookings.append({
-                            'id': booking.id,
-                            'house': booking.house.title,
-                            'user': booking.user.username,
-                            'status': booking.status,
-                            'period': f"{booking.start_date} - {booking.end_date}",
-                            'total_days': (booking.end_date - booking.start_date).days + 1,
-                            'guests': booking.guests
-                        })
-                
-                is_available = len(date_bookings) == 0
-                
-                calendar_data.append({
-                    'date': current_date,
-                    'is_available': is_available,
-                    'bookings': date_bookings
-                })
-                
-                current_date += timedelta(days=1)
+            # Создаем календарь с периодами бронирования
+            calendar_data = [
+                {
+                    'date': day,
+                    'is_available': not day_bookings,
+                    'bookings': day_bookings
+                }
+                for day, day_bookings in bookings_by_day(bookings, start_date, end_date, describe)
+            ]
             
             # Группируем занятые периоды для удобного отображения
             booked_periods = []
-            for booking in bookings_query:
+            for booking in bookings:
                 booked_periods.append({
                     'id': booking.id,
-                    'house_id': booking.house.id,
+                    'house_id': booking.house_id,
                     'house_title': booking.house.title,
                     'start_date': booking.start_date,
                     'end_date': booking.end_date,
                     'status': booking.status,
-                    'user': booking.user.username,
+                    'client_name': booking.client_name,
+                    'telegram_id': booking.telegram_id,
                     'period': f"{booking.start_date} - {booking.end_date}",
-                    'total_days': (booking.end_date - booking.start_date).days + 1,
-                    'guests': booking.guests
+                    'total_days': booking.total_days
                 })
             
             return Response({
@@ -297,4 +272,22 @@ class HouseFeaturesView(APIView):
     def get(self, request):
         features = HouseFeature.objects.all()
         serializer = HouseFeatureSerializer(features, many=True)
-        return Response(serializer.data)
\ No newline at end of file
+        return Response(serializer.data)
+
+
+class HouseImagesBulkUploadView(BulkImageUploadView):
+    """Массовая загрузка фотографий дома (только для администраторов)"""
+    image_model = HouseImage
+    parent_model = House
+    parent_field = 'house'
+
+
+class HouseImageUploadView(ChunkedUploadStartView):
+    """Начало загрузки фото дома по частям (только для администраторов)"""
+    image_model = HouseImage
+    parent_model = House
+
+
+class HouseFreeWindowsView(FreeWindowsView):
+    """Ближайшие свободные даты дома на нужное число дней"""
+    booking_model = HouseBooking
@@ -8,8 +8,8 @@ from .models import MotoCategory, MotoFeature, Motorcycle, MotoImage, MotoBookin
 class MotoImageInline(admin.TabularInline):
     model = MotoImage
     extra = 1
-    fields = ['image', 'order', 'image_preview']
-    readonly_fields = ['image_preview']
+    fields = ['image', 'order', 'processing_status', 'image_preview']
+    readonly_fields = ['processing_status', 'image_preview']
     
     def image_preview(self, obj):
         if obj.image:
@@ -94,9 +94,9 @@ class MotorcycleAdmin(ModelAdmin):
 
 @admin.register(MotoImage)
 class MotoImageAdmin(ModelAdmin):
-    list_display = ['motorcycle', 'order', 'image_preview']
+    list_display = ['motorcycle', 'order', 'processing_status', 'possible_duplicate', 'image_preview']
     list_editable = ['order']
-    list_filter = ['motorcycle']
+    list_filter = ['motorcycle', 'processing_status', 'possible_duplicate']
     list_per_page = 20
     
     @display(description="Изображение")
@@ -4,3 +4,8 @@ from django.apps import AppConfig
 class MotorcyclesConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'motorcycles'
+
+    def ready(self):
+        from core.availability import register
+        from .models import MotoBooking
+        register(MotoBooking, 'motorcycle')
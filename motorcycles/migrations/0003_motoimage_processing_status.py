@@ -0,0 +1,18 @@
+# Generated by Django 5.1.2 on 2026-10-17 06:17
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('motorcycles', '0002_motobrand_motorcycle_brand'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='motoimage',
+            name='processing_status',
+            field=models.CharField(choices=[('processing', 'Обрабатывается'), ('ready', 'Готово'), ('failed', 'Ошибка')], default='ready', max_length=20, verbose_name='Обработка'),
+        ),
+    ]
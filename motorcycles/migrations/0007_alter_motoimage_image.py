@@ -0,0 +1,18 @@
+# Generated by Django 5.1.2 on 2026-10-17 06:26
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('motorcycles', '0006_motoimage_renditions'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='motoimage',
+            name='image',
+            field=models.ImageField(blank=True, upload_to='motorcycles/images/'),
+        ),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 5.1.2 on 2026-10-17 06:48
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('motorcycles', '0009_motoimage_placeholder'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='motobooking',
+            index=models.Index(fields=['motorcycle', 'status', 'start_date', 'end_date'], name='moto_booking_avail_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='motobooking',
+            index=models.Index(fields=['status', 'end_date', 'start_date', 'motorcycle'], name='moto_booking_search_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='motobooking',
+            index=models.Index(fields=['telegram_id'], name='moto_booking_telegram_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='motobooking',
+            index=models.Index(fields=['created_at'], name='moto_booking_created_idx'),
+        ),
+    ]
@@ -1,11 +1,11 @@
-from django.db import models
+from django.db import models, transaction
 from django.contrib.auth.models import User
 from django.utils import timezone
 from PIL import Image, ImageDraw, ImageFont
 import os
 from django.core.files.base import ContentFile
 import io
-from watermark import WatermarkProcessor
+from core.models import WatermarkedImage
 
 class MotoCategory(models.Model):
     title = models.CharField(max_length=100, verbose_name="Название категории")
@@ -149,9 +149,9 @@ class MotoWatermark:
             print(f"Error adding watermark: {e}")
             return None
 
-class MotoImage(models.Model):
+class MotoImage(WatermarkedImage):
     motorcycle = models.ForeignKey(Motorcycle, related_name='images', on_delete=models.CASCADE)
-    image = models.ImageField(upload_to='motorcycles/images/')
+    image = models.ImageField(upload_to='motorcycles/images/', blank=True)
     order = models.IntegerField(default=0, verbose_name="Порядок")
     
     class Meta:
@@ -161,25 +161,6 @@ class MotoImage(models.Model):
     
     def __str__(self):
         return f"Фото {self.motorcycle.title}"
-    
-    def save(self, *args, **kwargs):
-        if not self.pk:
-            super().save(*args, **kwargs)
-        
-        if self.image:
-            try:
-                watermarked_image = WatermarkProcessor.add_watermark(self.image.path)
-                if watermarked_image:
-                    self.image.save(
-                        os.path.basename(self.image.name),
-                        watermarked_image,
-                        save=False
-                    )
-            except Exception as e:
-                print(f"Error processing watermark for moto image: {e}")
-        
-        super().save(*args, **kwargs)
-
 
 class MotoBooking(models.Model):
     STATUS_CHOICES = [
@@ -204,6 +185,16 @@ class MotoBooking(models.Model):
     class Meta:
         verbose_name = "Бронирование мотоцикла"
         verbose_name_plural = "Бронирования мотоциклов"
+        indexes = [
+            # Проверка конкретного объекта и фильтры по статусу
+            models.Index(fields=['motorcycle', 'status', 'start_date', 'end_date'], name='moto_booking_avail_idx'),
+            # Поиск свободных объектов на даты: после статуса — конец брони,
+            # чтобы прошедшие брони отсекались по индексу. Частичный индекс
+            # (WHERE status IN ...) SQLite не применяет к запросам с параметрами
+            models.Index(fields=['status', 'end_date', 'start_date', 'motorcycle'], name='moto_booking_search_idx'),
+            models.Index(fields=['telegram_id'], name='moto_booking_telegram_idx'),
+            models.Index(fields=['created_at'], name='moto_booking_created_idx'),
+        ]
     
     def __str__(self):
         return f"{self.motorcycle.title} - {self.client_name} ({self.start_date} - {self.end_date})"
@@ -225,4 +216,6 @@ class MotoBooking(models.Model):
     def save(self, *args, **kwargs):
         if not self.total_price:
             self.total_price = self.calculate_total_price()
-        super().save(*args, **kwargs)
\ No newline at end of file
+        # Бронь и её занятые дни (пишет сигнал post_save) фиксируются вместе
+        with transaction.atomic():
+            super().save(*args, **kwargs)
\ No newline at end of file
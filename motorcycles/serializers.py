@@ -1,4 +1,8 @@
 from rest_framework import serializers
+
+from core.availability import availability
+from core.booking import BookingConflict, create_booking
+from core.serializers import FirstImageMixin
 from .models import MotoCategory, MotoFeature, Motorcycle, MotoImage, MotoBooking, MotoBrand
 
 class MotoCategorySerializer(serializers.ModelSerializer):
@@ -59,14 +63,7 @@ class CreateMotoBookingSerializer(serializers.ModelSerializer):
             raise serializers.ValidationError("Дата окончания должна быть позже даты начала")
         
         motorcycle = data['motorcycle']
-        conflicting_bookings = MotoBooking.objects.filter(
-            motorcycle=motorcycle,
-            status__in=['confirmed', 'active', 'pending'],
-            start_date__lte=end_date,
-            end_date__gte=start_date
-        )
-        
-        if conflicting_bookings.exists():
+        if not availability(MotoBooking).is_available(motorcycle.id, start_date, end_date):
             raise serializers.ValidationError("На выбранные даты мотоцикл уже забронирован")
         
         return data
@@ -83,17 +80,22 @@ class CreateMotoBookingSerializer(serializers.ModelSerializer):
         total_days = (end_date - start_date).days + 1
         total_price = total_days * motorcycle.price_per_day
         
-        booking = MotoBooking.objects.create(
-            motorcycle=motorcycle,
-            telegram_id=telegram_id,
-            start_date=start_date,
-            end_date=end_date,
-            client_name=client_name,
-            phone_number=phone_number,
-            comment=comment,
-            total_price=total_price,
-            status='pending'
-        )
+        try:
+            booking = create_booking(
+                MotoBooking,
+                motorcycle=motorcycle,
+                telegram_id=telegram_id,
+                start_date=start_date,
+                end_date=end_date,
+                client_name=client_name,
+                phone_number=phone_number,
+                comment=comment,
+                total_price=total_price,
+                status='pending'
+            )
+        except BookingConflict:
+            # Даты заняли между проверкой и сохранением
+            raise serializers.ValidationError("На выбранные даты мотоцикл уже забронирован")
         
         return booking
     
@@ -103,13 +105,12 @@ class MotoBrandSerializer(serializers.ModelSerializer):
         model = MotoBrand
         fields = ['id', 'name', 'icon']
 
-class MotorcycleListSerializer(serializers.ModelSerializer):
+class MotorcycleListSerializer(FirstImageMixin, serializers.ModelSerializer):
     """Сериализатор для списка мотоциклов (карточек)"""
     brand_name = serializers.CharField(source='brand.name', read_only=True)
     brand_icon = serializers.SerializerMethodField()
     category_title = serializers.CharField(source='category.title', read_only=True)
     features = MotoFeatureSerializer(many=True, read_only=True)
-    first_image = serializers.SerializerMethodField()
     price_per_day = serializers.IntegerField()
     
     class Meta:
@@ -118,16 +119,11 @@ class MotorcycleListSerializer(serializers.ModelSerializer):
             'id', 'title', 'brand', 'brand_name', 'brand_icon', 'category_title',
             'year', 'color', 'engine_volume', 'mileage', 'transmission', 'oil_type',
             'bike_type', 'power', 'price_per_day', 'deposit', 'status', 
-            'features', 'first_image'
+            'features', 'first_image', 'first_image_srcset',
+            'first_image_placeholder'
         ]
     
     def get_brand_icon(self, obj):
         if obj.brand and obj.brand.icon:
             return self.context['request'].build_absolute_uri(obj.brand.icon.url)
         return None
-    
-    def get_first_image(self, obj):
-        first_image = obj.images.first()
-        if first_image and first_image.image:
-            return self.context['request'].build_absolute_uri(first_image.image.url)
-        return None
\ No newline at end of file
@@ -10,8 +10,11 @@ router.register(r'bookings', views.MotoBookingViewSet, basename='moto-booking')
 
 urlpatterns = [
     path('', include(router.urls)),
+    path('<int:pk>/images/bulk/', views.MotoImagesBulkUploadView.as_view(), name='moto-images-bulk'),
+    path('<int:pk>/images/uploads/', views.MotoImageUploadView.as_view(), name='moto-images-upload'),
     path('available-motorcycles/', views.AvailableMotorcyclesView.as_view(), name='available-motorcycles'),
     path('moto-availability/<int:motorcycle_id>/', views.MotoAvailabilityView.as_view(), name='moto-availability'),
+    path('moto-free-windows/<int:pk>/', views.MotoFreeWindowsView.as_view(), name='moto-free-windows'),
     path('moto-booking-calendar/', views.MotoBookingCalendarView.as_view(), name='moto-booking-calendar'),
     
     # Новые endpoints для карточек
@@ -3,11 +3,14 @@ from rest_framework.decorators import action
 from rest_framework.response import Response
 from rest_framework.views import APIView
 from django_filters.rest_framework import DjangoFilterBackend
-from django.utils import timezone
-from datetime import datetime, timedelta
+from datetime import datetime
 from django.db.models import Q
 
-from .models import MotoCategory, MotoFeature, Motorcycle, MotoBooking, MotoBrand
+from core.availability import availability
+from core.calendar import bookings_by_day, month_range
+from core.idempotency import IdempotentCreateMixin
+from core.views import BulkImageUploadView, ChunkedUploadStartView, FreeWindowsView
+from .models import MotoCategory, MotoFeature, Motorcycle, MotoBooking, MotoBrand, MotoImage
 from .serializers import MotoCategorySerializer, MotoFeatureSerializer, MotorcycleSerializer, MotoBookingSerializer, CreateMotoBookingSerializer, MotorcycleListSerializer, MotoBrandSerializer
 
 class MotoCategoryViewSet(viewsets.ModelViewSet):
@@ -75,7 +78,7 @@ class MotorcycleViewSet(viewsets.ModelViewSet):
             status=status.HTTP_400_BAD_REQUEST
         )
 
-class MotoBookingViewSet(viewsets.ModelViewSet):
+class MotoBookingViewSet(IdempotentCreateMixin, viewsets.ModelViewSet):
     queryset = MotoBooking.objects.all()
     
     def get_serializer_class(self):
@@ -108,12 +111,8 @@ class AvailableMotorcyclesView(APIView):
                 start = datetime.strptime(start_date, '%Y-%m-%d').date()
                 end = datetime.strptime(end_date, '%Y-%m-%d').date()
                 
-                # Исключаем мотоциклы с бронированиями на эти даты
-                booked_moto_ids = MotoBooking.objects.filter(
-                    status__in=['confirmed', 'active', 'pending'],
-                    start_date__lte=end,
-                    end_date__gte=start
-                ).values_list('motorcycle_id', flat=True)
+                # Исключаем мотоциклы с бронированиями на эти даты (по индексу занятости)
+                booked_moto_ids = availability(MotoBooking).booked_resources(start, end)
                 
                 motorcycles = motorcycles.exclude(id__in=booked_moto_ids)
                 
@@ -146,15 +145,12 @@ class MotoAvailabilityView(APIView):
                 start = datetime.strptime(start_date, '%Y-%m-%d').date()
                 end = datetime.strptime(end_date, '%Y-%m-%d').date()
                 
-                # Проверяем конфликтующие бронирования
-                conflicting_bookings = MotoBooking.objects.filter(
-                    motorcycle=motorcycle,
-                    status__in=['confirmed', 'active', 'pending'],
-                    start_date__lte=end,
-                    end_date__gte=start
-                )
+                # Проверяем конфликтующие бронирования: пересечения ищем в индексе
+                # занятости, из базы читаем только найденные брони
+                conflicting_ids = availability(MotoBooking).conflicts(motorcycle.id, start, end)
+                conflicting_bookings = MotoBooking.objects.filter(id__in=conflicting_ids)
                 
-                is_available = not conflicting_bookings.exists() and motorcycle.status == 'available'
+                is_available = not conflicting_ids and motorcycle.status == 'available'
                 
                 return Response({
                     'motorcycle_id': motorcycle.id,
@@ -180,79 +176,60 @@ class MotoBookingCalendarView(APIView):
     
     def get(self, request):
         motorcycle_id = request.query_params.get('motorcycle_id')
-        month = request.query_params.get('month')
-        year = request.query_params.get('year')
         
         try:
-            if month and year:
-                target_month = int(month)
-                target_year = int(year)
-                start_date = datetime(target_year, target_month, 1).date()
-                if target_month == 12:
-                    end_date = datetime(target_year + 1, 1, 1).date()
-                else:
-                    end_date = datetime(target_year, target_month + 1, 1).date()
-            else:
-                # По умолчанию текущий месяц
-                today = timezone.now().date()
-                start_date = datetime(today.year, today.month, 1).date()
-                if today.month == 12:
-                    end_date = datetime(today.year + 1, 1, 1).date()
-                else:
-                    end_date = datetime(today.year, today.month + 1, 1).date()
+            start_date, end_date = month_range(
+                request.query_params.get('month'), request.query_params.get('year')
+            )
             
-            # Получаем бронирования
+            # Получаем бронирования одним запросом вместе с мотоциклами
+            # (бронь, закончившаяся 1-го числа, этот день тоже занимает)
             bookings_query = MotoBooking.objects.filter(
                 status__in=['confirmed', 'active', 'pending'],
                 start_date__lt=end_date,
-                end_date__gt=start_date
-            )
+                end_date__gte=start_date
+            ).select_related('motorcycle')
             
             if motorcycle_id:
                 motorcycle_id = int(motorcycle_id)
                 bookings_query = bookings_query.filter(motorcycle_id=motorcycle_id)
+            bookings = list(bookings_query)
             
-            # Создаем календарь с периодами бронирования
-            calendar_data = []
-            current_date = start_date
+            def describe(booking):
+                return {
+                    'id': booking.id,
+                    'motorcycle': booking.motorcycle.title,
+                    'client_name': booking.client_name,
+                    'telegram_id': booking.telegram_id,
+                    'status': booking.status,
+                    'period': f"{booking.start_date} - {booking.end_date}",
+                    'total_days': booking.total_days
+                }
             
-            while current_date < end_date:
-                # Находим бронирования на эту дату
-                date_bookings = []
-                for booking in bookings_query:
-                    if booking.start_date <= current_date <= booking.end_date:
-                        date_bookings.append({
-                            'id': booking.id,
-                            'motorcycle': booking.motorcycle.title,
-                            'user': booking.user.username,
-                            'status': booking.status,
-                            'period': f"{booking.start_date} - {booking.end_date}",
-                            'total_days': (booking.end_date - booking.start_date).days + 1
-                        })
-                
-                is_available = len(date_bookings) == 0
-                
-                calendar_data.append({
-                    'date': current_date,
-                    'is_available': is_available,
-                    'bookings': date_bookings
-                })
-                
-                current_date += timedelta(days=1)
+            # Создаем календарь с периодами бронирования
+            calendar_data = [
+                {
+                    'date': day,
+                    'is_available': not day_bookings,
+                    'bookings': day_bookings
+                }
+                for day, day_bookings in bookings_by_day(bookings, start_date, end_date, describe)
+            ]
             
             # Группируем занятые периоды для удобного отображения
             booked_periods = []
-            for booking in bookings_query:
+            for booking in bookings:
                 booked_periods.append({
                     'id': booking.id,
-                    'motorcycle_id': booking.motorcycle.id,
+                    'motorcycle_id': booking.motorcycle_id,
                     'motorcycle_title': booking.motorcycle.title,
                     'start_date': booking.start_date,
                     'end_date': booking.end_date,
                     'status': booking.status,
-                    'user': booking.user.username,
+                    'client_name': booking.client_name,
+                    'telegram_id': booking.telegram_id,
                     'period': f"{booking.start_date} - {booking.end_date}",
-                    'total_days': (booking.end_date - booking.start_date).days + 1
+                    'total_days': booking.total_days
                 })
             
             return Response({
@@ -303,4 +280,22 @@ class MotoFeaturesView(APIView):
     def get(self, request):
         features = MotoFeature.objects.all()
         serializer = MotoFeatureSerializer(features, many=True)
-        return Response(serializer.data)
\ No newline at end of file
+        return Response(serializer.data)
+
+
+class MotoImagesBulkUploadView(BulkImageUploadView):
+    """Массовая загрузка фотографий мотоцикла (только для администраторов)"""
+    image_model = MotoImage
+    parent_model = Motorcycle
+    parent_field = 'motorcycle'
+
+
+class MotoImageUploadView(ChunkedUploadStartView):
+    """Начало загрузки фото мотоцикла по частям (только для администраторов)"""
+    image_model = MotoImage
+    parent_model = Motorcycle
+
+
+class MotoFreeWindowsView(FreeWindowsView):
+    """Ближайшие свободные даты мотоцикла на нужное число дней"""
+    booking_model = MotoBooking
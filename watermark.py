@@ -1,76 +1,505 @@
 # watermark.py
+import base64
+import hashlib
+import math
 import os
-from PIL import Image, ImageDraw, ImageFont
+import threading
+from collections import OrderedDict
+from PIL import Image, ImageDraw, ImageFont, ImageOps, features
 import io
 from django.core.files.base import ContentFile
 from django.conf import settings
 
+try:
+    from PIL import ImageCms
+except ImportError:  # Pillow собран без littlecms — цветовые профили не переводим
+    ImageCms = None
+
+
+class WatermarkLayerCache:
+    """
+    Ограниченный LRU-кэш готовых к наложению слоёв водяного знака.
+    Ключ — (ширина, высота, прозрачность, масштаб, режим) целевого изображения.
+    Размер ограничен и числом слоёв, и суммарным объёмом в байтах: слой
+    для режима «плитка» занимает столько же, сколько само фото.
+    Кэш сбрасывается целиком, когда меняется mtime файла водяного знака.
+    """
+
+    def __init__(self, maxsize=16, max_bytes=None):
+        self.maxsize = maxsize
+        self.max_bytes = max_bytes
+        self._layers = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self._mtime = None
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    def _layer_bytes(self, layer):
+        if self.max_bytes is None:
+            return 0
+        return layer.width * layer.height * len(layer.getbands())
+
+    def get(self, key, mtime, factory):
+        with self._lock:
+            if mtime != self._mtime:
+                if self._mtime is not None:
+                    self.invalidations += 1
+                self._layers.clear()
+                self._bytes = 0
+                self._mtime = mtime
+
+            layer = self._layers.get(key)
+            if layer is not None:
+                self._layers.move_to_end(key)
+                self.hits += 1
+                return layer
+            self.misses += 1
+
+        # Строим слой вне блокировки, чтобы не задерживать другие потоки
+        layer = factory()
+        size = self._layer_bytes(layer)
+
+        with self._lock:
+            if mtime == self._mtime and key not in self._layers and (
+                    self.max_bytes is None or size <= self.max_bytes):
+                # Слой больше всего бюджета не кэшируем, чтобы не вытеснять остальные
+                self._layers[key] = layer
+                self._bytes += size
+                while len(self._layers) > self.maxsize or (
+                        self.max_bytes is not None and self._bytes > self.max_bytes):
+                    _, evicted = self._layers.popitem(last=False)
+                    self._bytes -= self._layer_bytes(evicted)
+        return layer
+
+    def clear(self):
+        with self._lock:
+            self._layers.clear()
+            self._bytes = 0
+            self._mtime = None
+            self.hits = self.misses = self.invalidations = 0
+
+    def info(self):
+        with self._lock:
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'invalidations': self.invalidations,
+                'size': len(self._layers),
+                'maxsize': self.maxsize,
+                'bytes': self._bytes,
+                'max_bytes': self.max_bytes,
+            }
+
+
+layer_cache = WatermarkLayerCache(
+    getattr(settings, 'WATERMARK_CACHE_SIZE', 16),
+    getattr(settings, 'WATERMARK_CACHE_BYTES', 64 * 1024 * 1024),
+)
+
+# Отпечатки водяного знака: (прозрачность, масштаб, режим) -> (mtime файла, отпечаток)
+_fingerprints = {}
+
+
+class EncodingProfile:
+    """
+    Профиль кодирования: формат и качество. JPEG всегда прогрессивный и с
+    оптимизированными таблицами Хаффмана; EXIF и ICC не записываются
+    (ориентация и цвет применяются к пикселям ещё при чтении, см. open_image).
+    """
+    EXTENSIONS = {'jpeg': 'jpg', 'webp': 'webp', 'avif': 'avif'}
+    CONTENT_TYPES = {'jpeg': 'image/jpeg', 'webp': 'image/webp', 'avif': 'image/avif'}
+
+    def __init__(self, image_format='jpeg', quality=85):
+        if image_format not in self.EXTENSIONS:
+            raise ValueError(f"Неизвестный формат: {image_format}")
+        self.format = image_format
+        self.quality = quality
+
+    def __repr__(self):
+        return f"EncodingProfile({self.format!r}, quality={self.quality})"
+
+    @property
+    def extension(self):
+        return self.EXTENSIONS[self.format]
+
+    @property
+    def content_type(self):
+        return self.CONTENT_TYPES[self.format]
+
+    @staticmethod
+    def available(image_format):
+        """AVIF есть не во всех сборках Pillow"""
+        return image_format == 'jpeg' or features.check(image_format)
+
+    def with_format(self, image_format):
+        return EncodingProfile(image_format, self.quality)
+
+    def encode(self, image):
+        image = WatermarkProcessor.flatten(image)
+        buffer = io.BytesIO()
+        if self.format == 'jpeg':
+            image.save(buffer, format='JPEG', quality=self.quality, optimize=True, progressive=True)
+        elif self.format == 'webp':
+            image.save(buffer, format='WEBP', quality=self.quality, method=4)
+        else:
+            image.save(buffer, format='AVIF', quality=self.quality, speed=6)
+        return buffer.getvalue()
+
+
+def encoding_profile(name):
+    """
+    Профиль из IMAGE_ENCODING_PROFILES: 'photo' — основной файл,
+    имена копий ('thumbnail', 'card', ...) — их качество во всех форматах.
+    """
+    profiles = getattr(settings, 'IMAGE_ENCODING_PROFILES', {})
+    options = {'format': 'jpeg', 'quality': 85, **profiles.get(name, {})}
+    return EncodingProfile(options['format'], options['quality'])
+
+
+def rendition_formats():
+    """Форматы уменьшенных копий из IMAGE_RENDITION_FORMATS, которые умеет Pillow"""
+    formats = getattr(settings, 'IMAGE_RENDITION_FORMATS', ['webp', 'jpeg'])
+    return [image_format for image_format in formats if EncodingProfile.available(image_format)]
+
+
 class WatermarkProcessor:
+    # 'center' — один знак по центру, 'tile' — знак повторяется по всему фото
+    MODES = ('center', 'tile')
+    # Ширина знака относительно ширины фото по умолчанию для каждого режима
+    DEFAULT_SCALE = {'center': 0.5, 'tile': 0.2}
+    # 'auto' — режим по размеру фото (см. choose_mode)
+    AUTO = 'auto'
+
+    @staticmethod
+    def tile_thresholds():
+        """(соотношение сторон, пиксели), начиная с которых знак кладётся узором"""
+        return (
+            getattr(settings, 'IMAGE_TILE_MIN_ASPECT', 2.0),
+            getattr(settings, 'IMAGE_TILE_MIN_PIXELS', 40_000_000),
+        )
+
+    @staticmethod
+    def choose_mode(width, height):
+        """
+        Режим для фото этого размера: панорамы и очень большие фото — узором
+        (один знак по центру у них легко обрезать), обычные — одним знаком.
+        """
+        min_aspect, min_pixels = WatermarkProcessor.tile_thresholds()
+        if max(width, height) >= min_aspect * min(width, height) or width * height >= min_pixels:
+            return 'tile'
+        return 'center'
+
+    @staticmethod
+    def resolve_mode(image_path, mode):
+        """Режим для 'auto' по заголовку файла (пиксели не читаются), иначе mode"""
+        if mode != WatermarkProcessor.AUTO:
+            return mode
+        with Image.open(image_path) as image:
+            width, height = image.size
+        if hasattr(image_path, 'seek'):
+            image_path.seek(0)
+        return WatermarkProcessor.choose_mode(width, height)
+
+    @staticmethod
+    def watermark_path():
+        return os.path.join(settings.BASE_DIR, 'media', 'watermark.png')
+
+    @staticmethod
+    def fingerprint(opacity=90, scale=None, mode='center'):
+        """
+        Короткий отпечаток файла водяного знака и параметров наложения.
+        Меняется при замене watermark.png — по нему видно, какие фото устарели.
+        """
+        if mode == WatermarkProcessor.AUTO:
+            # Режим выбирается у каждого фото — отпечаток покрывает оба режима и пороги
+            digest = hashlib.sha256()
+            for each in WatermarkProcessor.MODES:
+                digest.update(WatermarkProcessor.fingerprint(opacity, scale, each).encode())
+            digest.update(f":auto:{WatermarkProcessor.tile_thresholds()}".encode())
+            return digest.hexdigest()[:16]
+        if scale is None:
+            scale = WatermarkProcessor.DEFAULT_SCALE[mode]
+        watermark_path = WatermarkProcessor.watermark_path()
+        # Файл перечитывается и хэшируется, только когда сменился его mtime
+        mtime = os.stat(watermark_path).st_mtime_ns
+        key = (opacity, scale, mode)
+        cached = _fingerprints.get(key)
+        if cached is not None and cached[0] == mtime:
+            return cached[1]
+        digest = hashlib.sha256()
+        with open(watermark_path, 'rb') as f:
+            digest.update(f.read())
+        digest.update(f"{opacity}:{scale}".encode())
+        if mode != 'center':
+            # Для центрального режима отпечаток прежний — уже обработанные фото не устаревают
+            digest.update(f":{mode}".encode())
+        _fingerprints[key] = (mtime, digest.hexdigest()[:16])
+        return _fingerprints[key][1]
+
+    @staticmethod
+    def cache_info():
+        """Счётчики попаданий/промахов кэша слоёв для мониторинга"""
+        return layer_cache.info()
+
+    @staticmethod
+    def get_layer(image_width, image_height, opacity, scale, mode='center'):
+        """
+        Возвращает слой водяного знака для изображения заданного размера.
+        :param opacity: прозрачность (0-1)
+        :param scale: размер относительно ширины изображения (0.1-1)
+        :param mode: 'center' — слой размером со знак, 'tile' — во всё фото
+        Возвращаемый слой общий для всех вызовов — изменять его нельзя.
+        """
+        watermark_path = WatermarkProcessor.watermark_path()
+        mtime = os.stat(watermark_path).st_mtime_ns
+        key = (image_width, image_height, opacity, scale, mode)
+        if mode == 'tile':
+            factory = lambda: WatermarkProcessor._build_tiled_layer(
+                watermark_path, image_width, image_height, opacity, scale
+            )
+        else:
+            factory = lambda: WatermarkProcessor._build_layer(watermark_path, image_width, opacity, scale)
+        return layer_cache.get(key, mtime, factory)
+
+    @staticmethod
+    def _build_layer(watermark_path, image_width, opacity, scale):
+        watermark = Image.open(watermark_path).convert('RGBA')
+
+        # Масштабируем водяной знак по ширине изображения
+        watermark_width = int(image_width * scale)
+        watermark_height = int(watermark_width * watermark.height / watermark.width)
+        if watermark_width < 100:
+            watermark_width = 100
+            watermark_height = int(watermark_width * watermark.height / watermark.width)
+
+        watermark = watermark.resize((watermark_width, watermark_height), Image.Resampling.LANCZOS)
+
+        # Применяем прозрачность одной операцией над альфа-каналом
+        # (point строит таблицу на 256 значений вместо цикла по пикселям)
+        alpha = watermark.getchannel('A').point(lambda a: int(a * opacity))
+        watermark.putalpha(alpha)
+        return watermark
+
+    @staticmethod
+    def _build_tiled_layer(watermark_path, image_width, image_height, opacity, scale):
+        """
+        Прозрачный слой размером с фото, на котором знак повторяется в шахматном
+        порядке. Сначала собирается одна полоса знаков, затем она копируется
+        вниз — вставок столько, сколько столбцов плюс строк, а не их произведение.
+        """
+        mark = WatermarkProcessor._build_layer(watermark_path, image_width, opacity, scale)
+        step_x = mark.width + mark.width // 2
+        step_y = mark.height + mark.height // 2
+
+        # Полоса шире фото на шаг: нечётные ряды сдвигаются на полшага влево
+        strip = Image.new('RGBA', (image_width + step_x, mark.height))
+        for x in range(0, strip.width, step_x):
+            strip.paste(mark, (x, 0))
+
+        layer = Image.new('RGBA', (image_width, image_height))
+        for row, y in enumerate(range(mark.height // 4, image_height, step_y)):
+            layer.paste(strip, (-(step_x // 2) if row % 2 else 0, y))
+        return layer
+
     @staticmethod
-    def add_watermark(image_path, opacity=90, scale=0.5):
+    def open_image(image_path, max_pixels=None, pixel_budget=None):
+        """
+        Открывает изображение, не раскодируя его целиком в исходном размере.
+        Размер читается из заголовка; слишком большие файлы отклоняются сразу,
+        а фото больше max_pixels уменьшаются ещё при декодировании: JPEG
+        раскодируется сразу в 1/2, 1/4 или 1/8 размера (draft), остальное
+        дожимается resize.
+        :param max_pixels: до скольких пикселей уменьшать (по умолчанию IMAGE_MAX_PIXELS)
+        :param pixel_budget: больше скольких пикселей не открывать вовсе (IMAGE_PIXEL_BUDGET)
+        :return: (изображение PIL, исходный формат)
+        """
+        if max_pixels is None:
+            max_pixels = getattr(settings, 'IMAGE_MAX_PIXELS', None)
+        if pixel_budget is None:
+            pixel_budget = getattr(settings, 'IMAGE_PIXEL_BUDGET', None)
+
+        # Image.open читает только заголовок, пиксели ещё не загружены
+        image = Image.open(image_path)
+        image_format = image.format
+        width, height = image.size
+
+        if pixel_budget and width * height > pixel_budget:
+            image.close()
+            raise ValueError(
+                f"Изображение {width}x{height} больше допустимых {pixel_budget} пикселей"
+            )
+
+        oversized = max_pixels and width * height > max_pixels
+        if oversized:
+            ratio = math.sqrt(max_pixels / (width * height))
+            # draft выбирает наибольший шаг уменьшения, при котором
+            # картинка всё ещё не меньше нужной (для не-JPEG ничего не делает)
+            image.draft(image.mode, (max(1, int(width * ratio)), max(1, int(height * ratio))))
+
+        # Поворот из EXIF применяем к пикселям: сам тег при сохранении не пишется
+        ImageOps.exif_transpose(image, in_place=True)
+        WatermarkProcessor.to_srgb(image)
+
+        if oversized and image.width * image.height > max_pixels:
+            # draft уже мог уменьшить картинку — коэффициент считаем от её текущего размера
+            ratio = math.sqrt(max_pixels / (image.width * image.height))
+            target = (max(1, int(image.width * ratio)), max(1, int(image.height * ratio)))
+            image = image.resize(target, Image.Resampling.LANCZOS)
+
+        return image, image_format
+
+    @staticmethod
+    def to_srgb(image):
+        """
+        Переводит пиксели из встроенного ICC-профиля (например, Display P3
+        с iPhone) в sRGB и убирает профиль: без этого после удаления
+        метаданных цвета бы поблёкли.
+        """
+        icc_profile = image.info.pop('icc_profile', None)
+        if not icc_profile or ImageCms is None or image.mode not in ('RGB', 'RGBA'):
+            return image
+        try:
+            source_profile = ImageCms.ImageCmsProfile(io.BytesIO(icc_profile))
+            if ImageCms.getProfileDescription(source_profile).startswith('sRGB'):
+                return image
+            ImageCms.profileToProfile(
+                image, source_profile, ImageCms.createProfile('sRGB'), inPlace=True
+            )
+        except ImageCms.PyCMSError as e:
+            print(f"ICC profile ignored: {e}")
+        return image
+
+    @staticmethod
+    def render(image_path, opacity=90, scale=None, mode='center'):
+        """
+        Накладывает водяной знак и возвращает (изображение PIL, исходный формат).
+        В отличие от add_watermark ошибки не перехватываются.
+        :param image_path: путь к оригинальному изображению или открытый файл
+        :param mode: 'center', 'tile' (см. MODES) или 'auto' — по размеру фото
+        """
+        mode = WatermarkProcessor.resolve_mode(image_path, mode)
+        if mode not in WatermarkProcessor.MODES:
+            raise ValueError(f"Неизвестный режим водяного знака: {mode}")
+        if scale is None:
+            scale = WatermarkProcessor.DEFAULT_SCALE[mode]
+
+        # Ограничиваем параметры
+        opacity = max(0, min(100, opacity)) / 100.0
+        scale = max(0.1, min(1.0, scale))  # минимум 10%, максимум 100%
+
+        # Открываем оригинальное изображение (огромные — сразу уменьшенными)
+        original_image, image_format = WatermarkProcessor.open_image(image_path)
+        original_mode = original_image.mode
+        # convert возвращает новую копию — на неё и накладываем знак,
+        # без ещё одного полноразмерного буфера
+        watermarked = original_image.convert('RGBA')
+        original_image.close()
+
+        # Берём готовый слой водяного знака из кэша
+        image_width, image_height = watermarked.size
+        watermark_with_alpha = WatermarkProcessor.get_layer(image_width, image_height, opacity, scale, mode)
+        watermark_width, watermark_height = watermark_with_alpha.size
+
+        # Центрируем водяной знак (слой «плитки» совпадает с фото по размеру)
+        position = ((image_width - watermark_width) // 2, (image_height - watermark_height) // 2)
+
+        # Накладываем водяной знак одной операцией
+        watermarked.paste(watermark_with_alpha, position, watermark_with_alpha)
+
+        # Конвертируем обратно в исходный формат
+        if original_mode == 'RGB':
+            watermarked = watermarked.convert('RGB')
+
+        return watermarked, image_format
+
+    @staticmethod
+    def encode(image, image_format):
+        buffer = io.BytesIO()
+        if image_format == 'JPEG':
+            image.save(buffer, format='JPEG', quality=95)
+        else:
+            image.save(buffer, format=image_format or 'PNG')
+        return buffer.getvalue()
+
+    @staticmethod
+    def flatten(image):
+        """RGB-копия: прозрачный фон PNG кладём на белый — JPEG альфа-канал не хранит"""
+        if image.mode == 'RGB':
+            return image
+        background = Image.new('RGB', image.size, (255, 255, 255))
+        background.paste(image, mask=image.getchannel('A') if 'A' in image.getbands() else None)
+        return background
+
+    @staticmethod
+    def make_renditions(image, widths, formats=None):
+        """
+        Уменьшенные копии для карточек и srcset, качество — из профиля копии.
+        :param widths: {'thumbnail': 320, ...}; ширины не меньше исходной пропускаются
+        :param formats: по умолчанию rendition_formats()
+        :return: {'thumbnail': {'width', 'height', 'webp': bytes, 'jpeg': bytes}, ...}
+        """
+        image = WatermarkProcessor.flatten(image)
+        formats = formats or rendition_formats()
+
+        renditions = {}
+        current = image
+        # От большей к меньшей: каждая следующая копия считается из предыдущей
+        for name, width in sorted(widths.items(), key=lambda item: -item[1]):
+            if width >= image.width:
+                continue
+            height = max(1, round(image.height * width / image.width))
+            current = current.resize((width, height), Image.Resampling.LANCZOS)
+            profile = encoding_profile(name)
+            renditions[name] = {'width': width, 'height': height}
+            for image_format in formats:
+                renditions[name][image_format] = profile.with_format(image_format).encode(current)
+        return renditions
+
+    @staticmethod
+    def make_rendition(image, width, profile):
+        """Одна копия шириной не больше width (маленькие фото не растягиваются)"""
+        image = WatermarkProcessor.flatten(image)
+        if width < image.width:
+            height = max(1, round(image.height * width / image.width))
+            image = image.resize((width, height), Image.Resampling.LANCZOS)
+        return profile.encode(image)
+
+    @staticmethod
+    def make_placeholder(image, width=20):
+        """
+        Крошечное превью (LQIP) в виде data URI: карточка показывает его
+        размытым, пока грузится настоящее фото, без отдельного запроса.
+        """
+        height = max(1, round(image.height * width / image.width))
+        small = image.convert('RGB').resize((width, height), Image.Resampling.BOX)
+        buffer = io.BytesIO()
+        small.save(buffer, format='JPEG', quality=40, optimize=True)
+        return "data:image/jpeg;base64," + base64.b64encode(buffer.getvalue()).decode('ascii')
+
+    @staticmethod
+    def add_watermark(image_path, opacity=90, scale=None, mode='center'):
         """
         Добавляет водяной знак из изображения.
         :param image_path: путь к оригинальному изображению
         :param opacity: прозрачность водяного знака в процентах (0-100)
         :param scale: размер водяного знака относительно ширины изображения (0-1)
+        :param mode: 'center' — один знак по центру, 'tile' — узор по всему фото
         """
         try:
-            # Ограничиваем параметры
-            opacity = max(0, min(100, opacity)) / 100.0
-            scale = max(0.1, min(1.0, scale))  # минимум 10%, максимум 100%
-            
             # Путь к водяному знаку
-            watermark_path = os.path.join(settings.BASE_DIR, 'media', 'watermark.png')
+            watermark_path = WatermarkProcessor.watermark_path()
             if not os.path.exists(watermark_path):
                 print(f"Watermark file not found: {watermark_path}")
                 return None
-            
-            # Открываем оригинальное изображение
-            original_image = Image.open(image_path)
-            image = original_image.convert('RGBA')
-            
-            # Открываем водяной знак
-            watermark = Image.open(watermark_path).convert('RGBA')
-            
-            # Масштабируем водяной знак по ширине изображения
-            image_width, image_height = image.size
-            watermark_width = int(image_width * scale)
-            watermark_height = int(watermark_width * watermark.height / watermark.width)
-            if watermark_width < 100:
-                watermark_width = 100
-                watermark_height = int(watermark_width * watermark.height / watermark.width)
-            
-            watermark = watermark.resize((watermark_width, watermark_height), Image.Resampling.LANCZOS)
-            
-            # Применяем прозрачность
-            watermark_with_alpha = Image.new('RGBA', watermark.size)
-            for x in range(watermark.width):
-                for y in range(watermark.height):
-                    r, g, b, a = watermark.getpixel((x, y))
-                    watermark_with_alpha.putpixel((x, y), (r, g, b, int(a * opacity)))
-            
-            # Центрируем водяной знак
-            position = ((image_width - watermark_width) // 2, (image_height - watermark_height) // 2)
-            
-            # Накладываем водяной знак
-            watermarked = Image.new('RGBA', image.size)
-            watermarked.paste(image, (0, 0))
-            watermarked.paste(watermark_with_alpha, position, watermark_with_alpha)
-            
-            # Конвертируем обратно в исходный формат
-            if original_image.mode == 'RGB':
-                watermarked = watermarked.convert('RGB')
-            
-            # Сохраняем в буфер
-            buffer = io.BytesIO()
-            if original_image.format == 'JPEG':
-                watermarked.save(buffer, format='JPEG', quality=95)
-            else:
-                watermarked.save(buffer, format=original_image.format or 'PNG')
-            buffer.seek(0)
-            
-            return ContentFile(buffer.read(), name=os.path.basename(image_path))
-        
+
+            watermarked, image_format = WatermarkProcessor.render(image_path, opacity, scale, mode)
+            return ContentFile(
+                WatermarkProcessor.encode(watermarked, image_format),
+                name=os.path.basename(image_path)
+            )
+
         except Exception as e:
             print(f"Error adding watermark: {e}")
             import traceback